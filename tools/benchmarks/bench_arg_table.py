@@ -0,0 +1,88 @@
+#!/usr/bin/env python2
+"""
+  Measures the per-instruction cost of reading argument information in the analysis loops,
+  comparing Command.get_arg (plus Argument attribute reads) against the precomputed
+  Command.arg_descriptor table, and the resulting cost of Bytecode.discover_global_vars.
+
+  Examples:
+    py benchmarks/bench_arg_table.py
+    py benchmarks/bench_arg_table.py 200000
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import random
+import timeit
+import gta3sc
+from gta3sc.config import Config, Command as CommandInfo, Argument, Alternator
+from gta3sc.bytecode import Bytecode, Command, ArgNumber, ArgVariable
+from gta3sc.bytecode import DATATYPE_INT32, DATATYPE_GLOBALVAR_NUMBER
+
+def make_config(num_commands):
+    config = Config()
+    rng = random.Random(1)
+    for i in range(num_commands):
+        cmd = CommandInfo()
+        cmd.name = "COMMAND_%d" % i
+        cmd.id = i
+        for k in range(rng.randint(1, 6)):
+            arg = Argument()
+            arg.type = rng.choice(["INT", "FLOAT", "PARAM"])
+            arg.out = rng.random() < 0.2
+            arg.entity = rng.choice([None, None, "CAR", "CHAR"])
+            arg.enums = rng.choice([[], [], ["WEAPONTYPE"]])
+            cmd.args.append(arg)
+        cmd.args[-1].optional = rng.random() < 0.1
+        cmd.update_arg_table()
+        config.commands.append(cmd)
+    config.alternators.append(Alternator())
+    config.alternators[-1].name = "SET"
+    return config
+
+def make_program(config, num_instructions):
+    rng = random.Random(2)
+    block = []
+    for i in range(num_instructions):
+        cmdinfo = rng.choice(config.commands)
+        args = []
+        for k in range(len(cmdinfo.args) + (cmdinfo.has_optional() and rng.randint(0, 4))):
+            if rng.random() < 0.5:
+                # a variable slot per command argument keeps its type consistent over the program
+                args.append(ArgVariable(DATATYPE_GLOBALVAR_NUMBER, 4 * (4 * (16 * cmdinfo.id + k) + rng.randint(0, 3))))
+            else:
+                args.append(ArgNumber(DATATYPE_INT32, rng.randint(0, 1000)))
+        block.append(Command(False, cmdinfo.name, args))
+    return Bytecode(block)
+
+def loop_get_arg(bytecode, commands):
+    for off, data in bytecode:
+        cmdinfo = commands[data.name]
+        for i, arg in enumerate(data.args):
+            arginfo = cmdinfo.get_arg(i)
+            arginfo.type, arginfo.out, arginfo.entity
+            if len(arginfo.enums) > 0:
+                arginfo.enums[0]
+
+def loop_arg_descriptor(bytecode, commands):
+    for off, data in bytecode:
+        cmdinfo = commands[data.name]
+        for arg, arginfo in zip(data.args, cmdinfo.arg_descriptors(len(data.args))):
+            arginfo.type, arginfo.out, arginfo.entity
+            if arginfo.enum:
+                arginfo.enum
+
+def main(num_instructions):
+    config = make_config(1500)
+    bytecode = make_program(config, num_instructions)
+    commands = {cmd.name: cmd for cmd in config.commands}
+
+    def report(name, func, repeat=5):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        print("%-24s %8.3f ms  %8.3f us/instruction" % (name, best * 1000.0, best * 1e6 / num_instructions))
+
+    report("get_arg", lambda: loop_get_arg(bytecode, commands))
+    report("arg_descriptor", lambda: loop_arg_descriptor(bytecode, commands))
+    report("discover_global_vars", lambda: bytecode.discover_global_vars(config=config), repeat=3)
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
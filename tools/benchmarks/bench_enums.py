@@ -0,0 +1,65 @@
+#!/usr/bin/env python2
+"""
+  Measures the value -> name lookup of the enums of every shipped constants file, comparing
+  the dense runs Enum keeps (Enum.get_name) against the inverted dicts the tools used to
+  build at startup ({value: name} for each enum).
+
+  For each file prints the time to read it, the time to build the runs (done by an Enum
+  on its first lookup) and the inverted dicts, the bytes of each lookup structure
+  (containers only, names and values are shared with Enum.constants), and the time to
+  look up every value of the file with each.
+
+  Examples:
+    py benchmarks/bench_enums.py
+    py benchmarks/bench_enums.py --repeat=10
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import glob
+import timeit
+import gta3sc
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def inverted_dicts(enums):
+    return {enum.name: {v: k for k,v in enum.constants.iteritems()} for enum in enums}
+
+def runs_size(enum): # -> bytes of the value -> name structures of an Enum
+    return (sys.getsizeof(enum.run_starts) + sum(sys.getsizeof(names) for names in enum.run_names) +
+            sys.getsizeof(enum.sparse_names))
+
+def main(repeat=5):
+    files = [f for f in sorted(glob.glob(os.path.join(REPO_CONFIG_DIR, "*", "*.xml")))
+             if len(gta3sc.read_config(f).enums) > 0]
+    print("%-22s %6s %9s %9s %9s %9s %9s %9s %9s" % ("file", "values", "read s", "runs s", "invert s",
+                                                    "runs KB", "dicts KB", "get_name s", "dict s"))
+    for filename in files:
+        enums = gta3sc.read_config(filename).enums
+        values = [(enum, value) for enum in enums for value in enum.constants.itervalues()]
+        inverted = inverted_dicts(enums)
+        lookups = [(inverted[enum.name], value) for enum, value in values]
+
+        read_time = best_time(lambda: gta3sc.read_config(filename), repeat)
+        runs_time = best_time(lambda: [enum.update_values() for enum in enums], repeat)
+        invert_time = best_time(lambda: inverted_dicts(enums), repeat)
+        runs_bytes = sum(runs_size(enum) for enum in enums)
+        dict_bytes = sum(sys.getsizeof(d) for d in inverted.itervalues())
+        get_time = best_time(lambda: [enum.get_name(value) for enum, value in values], repeat)
+        dict_time = best_time(lambda: [d.get(value) for d, value in lookups], repeat)
+
+        print("%-22s %6d %9.4f %9.4f %9.4f %9.1f %9.1f %9.4f %9.4f" % (
+              os.path.relpath(filename, REPO_CONFIG_DIR), len(values), read_time, runs_time, invert_time,
+              runs_bytes / 1024.0, dict_bytes / 1024.0, get_time, dict_time))
+    return 0
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_enums.py [--repeat=5]")
+        sys.exit(1)
+    sys.exit(main(repeat=int(options.get("repeat", 5))))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+"""
+  Measures what a worker process pays at startup to get the config of each game (its
+  commands, with arguments synthesized as in synth.py, constants, alternators and default
+  models): reading the XML files, unpickling the Config (as a pool that does not fork
+  hands it over) and attaching its flat encoding (FlatConfig), and the latter followed
+  by looking up some commands and enum values as a scan would.
+
+  For each way prints the best time of some runs and the RSS growth of a forked process
+  doing it once, and the size of the pickle and of the flat file.
+
+  Examples:
+    py benchmarks/bench_flat_config.py
+    py benchmarks/bench_flat_config.py --repeat=10 --lookups=1000
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import cPickle
+import shutil
+import tempfile
+import timeit
+import gta3sc
+import synth
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+BASE_FILES = ["constants.xml", "alternators.xml", "default.xml"]
+
+def rss(): # -> current resident set size in bytes
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def growth(func): # -> bytes the RSS grew by calling func (keeping its result alive) in a forked process
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        before = rss()
+        result = func()
+        os.write(w, str(rss() - before))
+        os._exit(0)
+    os.close(w)
+    result = int(os.read(r, 64) or -1)
+    os.close(r)
+    os.waitpid(pid, 0)
+    return result
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def prepare(tmpdir, game): # -> directory with the config files of a game
+    gamedir = os.path.join(tmpdir, game)
+    os.makedirs(gamedir)
+    synth.make_config(os.path.join(REPO_CONFIG_DIR, game)).save_config(os.path.join(gamedir, "commands.xml"))
+    for name in BASE_FILES:
+        if os.path.exists(os.path.join(REPO_CONFIG_DIR, game, name)):
+            shutil.copy(os.path.join(REPO_CONFIG_DIR, game, name), gamedir)
+    return gamedir
+
+def lookups(config, names, values): # what a scan does with the config, some commands and enum values
+    for name in names:
+        config.get_command(name).arg_descriptors(2)
+    for enum_name, value in values:
+        config.get_enum(enum_name).get_name(value)
+
+def main(repeat=5, count=100):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        kb = 1024.0
+        print("%-8s %-20s %9s %9s %9s" % ("game", "startup", "seconds", "RSS KB", "file KB"))
+        for game in sorted(os.listdir(REPO_CONFIG_DIR)):
+            gamedir = prepare(tmpdir, game)
+            config = gta3sc.read_config(gamedir)
+            pickled = cPickle.dumps(config, 2)
+            flatfile = os.path.join(tmpdir, game + ".flatconfig")
+            gta3sc.write_flat_config(config, flatfile)
+
+            step = max(1, len(config.commands) // count)
+            names = [cmd.name for cmd in config.commands[::step]]
+            values = [(enum.name, value) for enum in config.enums if enum.name is not None
+                      for value in sorted(enum.constants.itervalues())[:count // 10]]
+            def attach_and_look_up():
+                flat = gta3sc.FlatConfig(flatfile)
+                lookups(flat, names, values)
+                return flat
+
+            for name, load, size in (("read_config", lambda: gta3sc.read_config(gamedir), None),
+                                     ("unpickle", lambda: cPickle.loads(pickled), len(pickled)),
+                                     ("attach", lambda: gta3sc.FlatConfig(flatfile), os.path.getsize(flatfile)),
+                                     ("attach, %d lookups" % (len(names) + len(values)), attach_and_look_up, None)):
+                print("%-8s %-20s %9.4f %9.1f %9s" % (game, name, best_time(load, repeat), growth(load) / kb,
+                                                     "" if size is None else "%.1f" % (size / kb)))
+        return 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_flat_config.py [--repeat=5] [--lookups=100]")
+        sys.exit(1)
+    sys.exit(main(repeat=int(options.get("repeat", 5)), count=int(options.get("lookups", 100))))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python2
+"""
+  Round-trips an IR2 program (read -> write -> read) checking that nothing is lost,
+  and measures the throughput of read_ir2, write_ir2 and str(Bytecode).
+
+  Without an IR2 file, a synthetic program exercising every argument kind and
+  large IR2_HEX payloads is used.
+
+  Examples:
+    py benchmarks/bench_ir2_roundtrip.py
+    py benchmarks/bench_ir2_roundtrip.py main.ir2
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import math
+import random
+import tempfile
+import timeit
+from gta3sc.bytecode import Bytecode, Label, Hex, Command, ArgNumber, ArgLabel, ArgString, ArgVariable, ArgArray
+from gta3sc.bytecode import read_ir2, write_ir2
+from gta3sc.bytecode import DATATYPE_INT8, DATATYPE_INT16, DATATYPE_INT32, DATATYPE_FLOAT
+from gta3sc.bytecode import DATATYPE_GLOBAL_LABEL, DATATYPE_LOCAL_LABEL
+from gta3sc.bytecode import DATATYPES_GLOBALVARS, DATATYPES_LOCALVARS, ARRAY_ELEM_TYPES
+from gta3sc.bytecode import DATATYPE_TEXTLABEL8, DATATYPE_TEXTLABEL16, DATATYPE_STRING, DATATYPE_BUFFER128
+
+def make_arg(rng, labels):
+    kind = rng.randint(0, 8)
+    if kind == 0: return ArgNumber(DATATYPE_INT8, rng.randint(-128, 127))
+    if kind == 1: return ArgNumber(DATATYPE_INT16, rng.randint(-32768, 32767))
+    if kind == 2: return ArgNumber(DATATYPE_INT32, rng.randint(-2**31, 2**31 - 1))
+    if kind == 3: return ArgNumber(DATATYPE_FLOAT, rng.choice([-1, 1]) * float.fromhex("0x1.%06xp%d" % (rng.randint(0, 0xfffffe) & ~1, rng.randint(-20, 20))))
+    if kind == 4: return ArgLabel(rng.choice([DATATYPE_GLOBAL_LABEL, DATATYPE_LOCAL_LABEL]), rng.choice(labels))
+    if kind == 5: return ArgVariable(rng.choice(DATATYPES_GLOBALVARS), 4 * rng.randint(0, 10000))
+    if kind == 6: return ArgVariable(rng.choice(DATATYPES_LOCALVARS), 4 * rng.randint(0, 31))
+    if kind == 7:
+        base = ArgVariable(rng.choice(DATATYPES_GLOBALVARS), 4 * rng.randint(0, 10000))
+        index = ArgVariable(DATATYPES_LOCALVARS[0], 4 * rng.randint(0, 31))
+        return ArgArray(base, index, rng.randint(1, 100), rng.choice(ARRAY_ELEM_TYPES))
+    strtype = rng.choice([DATATYPE_TEXTLABEL8, DATATYPE_TEXTLABEL16, DATATYPE_STRING, DATATYPE_BUFFER128])
+    return ArgString(strtype, "TXT_%d" % rng.randint(0, 999))
+
+def make_block(rng, num_instructions, prefix):
+    labels = ["%s_%d" % (prefix, i) for i in range(num_instructions / 16 + 1)]
+    block = []
+    for i in range(num_instructions):
+        if i % 16 == 0:
+            block.append(Label(labels[i / 16]))
+        if rng.random() < 0.002:
+            block.append(Hex(bytearray(rng.randint(0, 255) for k in range(rng.randint(1, 4096)))))
+        else:
+            args = [make_arg(rng, labels) for k in range(rng.randint(0, 8))]
+            block.append(Command(rng.random() < 0.1, "COMMAND_%d" % rng.randint(0, 1500), args))
+    return block
+
+def make_program(num_instructions):
+    rng = random.Random(3)
+    missions = [make_block(rng, num_instructions / 40, "MISSION_%d" % i) for i in range(10)]
+    streams = [make_block(rng, num_instructions / 40, "STREAM_%d" % i) for i in range(10)]
+    main_block = make_block(rng, num_instructions / 2, "MAIN")
+    # float32 operands of a compiled script may be non-finite too
+    main_block.insert(1, Command(False, "COMMAND_NONFINITE",
+                                 [ArgNumber(DATATYPE_FLOAT, math.copysign(v, sign)) for v in (float("inf"), float("nan")) for sign in (1.0, -1.0)]))
+    return Bytecode(main_block, missions, streams,
+                    ["MODEL_%d" % i for i in range(50)], ["STREAM%d" % i for i in range(10)])
+
+def main(ir2file=None, num_instructions=20000):
+    tmpdir = tempfile.mkdtemp()
+    first = os.path.join(tmpdir, "first.ir2")
+    second = os.path.join(tmpdir, "second.ir2")
+    try:
+        if ir2file is None:
+            write_ir2(make_program(num_instructions), first)
+        else:
+            write_ir2(read_ir2(ir2file), first)
+        size_mb = os.path.getsize(first) / (1024.0 * 1024.0)
+
+        def report(name, func, repeat=3):
+            best = min(timeit.repeat(func, number=1, repeat=repeat))
+            print("%-12s %8.3f s  %8.2f MB/s" % (name, best, size_mb / best))
+
+        bytecode = read_ir2(first)
+        report("read_ir2", lambda: read_ir2(first))
+        report("write_ir2", lambda: write_ir2(bytecode, second))
+        report("str", lambda: str(bytecode))
+
+        with open(first) as f1, open(second) as f2:
+            identical = (f1.read() == f2.read())
+        reread = read_ir2(second)
+        same_shape = (len(reread.main_block) == len(bytecode.main_block) and
+                      map(len, reread.mission_blocks) == map(len, bytecode.mission_blocks) and
+                      map(len, reread.streamed_blocks) == map(len, bytecode.streamed_blocks) and
+                      reread.models == bytecode.models and reread.stream_names == bytecode.stream_names)
+        print("%.2f MB, round-trip %s" % (size_mb, "identical" if identical and same_shape else "DIFFERS"))
+        return 0 if identical and same_shape else 1
+    finally:
+        for path in (first, second):
+            if os.path.exists(path):
+                os.remove(path)
+        os.rmdir(tmpdir)
+
+if __name__ == "__main__":
+    sys.exit(main(*sys.argv[1:2]))
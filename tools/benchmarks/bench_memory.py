@@ -0,0 +1,99 @@
+#!/usr/bin/env python2
+"""
+  Checks the memory of ir2_to_gta3 phases against budgets on a synthetic program (see synth.py).
+
+  The program is converted once with memory instrumentation enabled (as --memory-report
+  does), then the memory each phase left allocated, and the peak of the whole run, are
+  compared against the budgets in benchmarks/memory_budgets.json (megabytes), or the
+  file given by --budgets-file. --budget=phase=MB,... overrides some of them. Exceeding
+  any budget makes the exit status 1.
+
+  The phase budgets cover only the memory a phase kept, its peak is printed but not
+  checked; the peak of the whole run is checked against the "peak" budget. Without
+  tracemalloc (Python 2) the phases are measured through the process RSS, so the budgets
+  bound approximate figures: run a single workload per process, as this script does.
+
+  Examples:
+    py benchmarks/bench_memory.py
+    py benchmarks/bench_memory.py --game=gta3 --instructions=50000 --budget=read_ir2=40,peak=200
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import json
+import shutil
+import subprocess
+import tempfile
+import gta3sc
+import ir2_to_gta3
+from gta3sc import instrument
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+DEFAULT_BUDGETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "memory_budgets.json")
+
+def measure(game, num_missions, num_streams, num_instructions): # -> ({ phase: (kept bytes, peak bytes) }, peak bytes)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        # generated by another process, not to leave its memory behind in this one
+        synth = os.path.join(os.path.dirname(os.path.abspath(__file__)), "synth.py")
+        subprocess.check_call([sys.executable, synth, os.path.join(REPO_CONFIG_DIR, game), tmpdir,
+                               str(num_missions), str(num_streams), str(num_instructions)], stdout=open(os.devnull, "w"))
+        ir2file, configpath = os.path.join(tmpdir, "main.ir2"), os.path.join(tmpdir, "config")
+        instrument.enable_memory()
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w") # progress messages
+        try:
+            with instrument.timer("total"):
+                ir2_to_gta3.main(ir2file, configpath, os.path.join(tmpdir, "output"))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        stats = instrument.memory_stats()
+        return stats, instrument.peak_rss() or stats["total"][1]
+    finally:
+        instrument.disable()
+        shutil.rmtree(tmpdir)
+
+def check(stats, peak, budgets): # -> number of exceeded budgets
+    mb = 1024.0 * 1024.0
+    exceeded = 0
+    traced = instrument.is_memory_traced()
+    print("%-32s %10s %10s %10s" % ("phase", "kept MB" if traced else "~kept MB", "peak MB" if traced else "~peak MB", "budget MB"))
+    for phase, (kept, phase_peak) in sorted(stats.items()):
+        budget = budgets.get(phase)
+        flag = "  OVER BUDGET" if budget is not None and kept / mb > budget else ""
+        exceeded += bool(flag)
+        print("%-32s %10.1f %10.1f %10s%s" % (phase, kept / mb, phase_peak / mb, "-" if budget is None else "%.1f" % budget, flag))
+    budget = budgets.get("peak")
+    flag = "  OVER BUDGET" if budget is not None and peak / mb > budget else ""
+    exceeded += bool(flag)
+    print("%-32s %10s %10.1f %10s%s" % ("peak", "", peak / mb, "-" if budget is None else "%.1f" % budget, flag))
+    if not instrument.is_memory_traced():
+        print("(~ phases are changes of the process RSS, only approximate)")
+    return exceeded
+
+def main(game="gtasa", num_missions=40, num_streams=40, num_instructions=20000, budgets_file=DEFAULT_BUDGETS, overrides={}):
+    with open(budgets_file) as f:
+        budgets = json.load(f).get(game, {})
+    budgets.update(overrides)
+    stats, peak = measure(game, num_missions, num_streams, num_instructions)
+    return 1 if check(stats, peak, budgets) else 0
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_memory.py [--game=gtasa] [--missions=40] [--streams=40] [--instructions=20000] "
+              "[--budgets-file=<file.json>] [--budget=<phase>=<MB>,...]")
+        sys.exit(1)
+    overrides = {}
+    if "budget" in options:
+        for item in options["budget"].split(","):
+            phase, value = item.rsplit("=", 1)
+            overrides[phase] = float(value)
+    sys.exit(main(options.get("game", "gtasa"),
+                  num_missions=int(options.get("missions", 40)),
+                  num_streams=int(options.get("streams", 40)),
+                  num_instructions=int(options.get("instructions", 20000)),
+                  budgets_file=options.get("budgets-file", DEFAULT_BUDGETS),
+                  overrides=overrides))
@@ -0,0 +1,105 @@
+#!/usr/bin/env python2
+"""
+  Measures the memory and load time of keeping every config variant of every game resident:
+  the base (commands, constants, alternators and default models) and the base plus each of
+  cleo.xml, extensions.xml and mobile.xml the game has.
+
+  Variants are loaded each on its own (as read_config does, with and without intern=True)
+  and as overlays of a single frozen base per game (read_config with base=). The base
+  commands are synthesized with their arguments (see synth.py), the shipped ones only have
+  2.0 format parameters. Memory is the RSS growth of a forked process loading all of them.
+
+  Examples:
+    py benchmarks/bench_overlays.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import shutil
+import tempfile
+import time
+import gta3sc
+import synth
+from gta3sc.config import Config
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+BASE_FILES = ["commands.xml", "constants.xml", "alternators.xml", "default.xml"]
+VARIANT_FILES = ["cleo.xml", "extensions.xml", "mobile.xml"]
+
+def rss(): # -> current resident set size in bytes
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def prepare(tmpdir): # -> { game: (base files, [variant file, ...]) }
+    games = {}
+    for game in sorted(os.listdir(REPO_CONFIG_DIR)):
+        gamedir = os.path.join(tmpdir, game)
+        os.makedirs(gamedir)
+        synth.make_config(os.path.join(REPO_CONFIG_DIR, game)).save_config(os.path.join(gamedir, "commands.xml"))
+        for name in BASE_FILES[1:] + VARIANT_FILES:
+            if os.path.exists(os.path.join(REPO_CONFIG_DIR, game, name)):
+                shutil.copy(os.path.join(REPO_CONFIG_DIR, game, name), gamedir)
+        games[game] = ([os.path.join(gamedir, name) for name in BASE_FILES],
+                       [os.path.join(gamedir, name) for name in VARIANT_FILES if os.path.exists(os.path.join(gamedir, name))])
+    return games
+
+def load_separate(games, intern): # -> [Config, ...]
+    configs = []
+    for game, (base_files, variant_files) in sorted(games.items()):
+        for extra in [[]] + [[f] for f in variant_files]:
+            config = Config(intern=intern)
+            for filename in base_files + extra:
+                config.read_config(filename)
+            configs.append(config)
+    return configs
+
+def load_overlays(games): # -> [Config, ...]
+    configs = []
+    for game, (base_files, variant_files) in sorted(games.items()):
+        base = Config()
+        for filename in base_files:
+            base.read_config(filename)
+        base.freeze()
+        configs.append(base)
+        configs += [gta3sc.read_config(filename, base=base) for filename in variant_files]
+    return configs
+
+def measure(load): # -> (number of configs, seconds, RSS growth bytes), loaded in a child process
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        before = rss()
+        start = time.time()
+        configs = load()
+        elapsed = time.time() - start
+        os.write(w, "%d %r %d" % (len(configs), elapsed, rss() - before))
+        os._exit(0)
+    os.close(w)
+    result = os.read(r, 128).split()
+    os.close(r)
+    os.waitpid(pid, 0)
+    return int(result[0]), float(result[1]), int(result[2])
+
+def main():
+    tmpdir = tempfile.mkdtemp()
+    try:
+        games = prepare(tmpdir)
+        mb = 1024.0 * 1024.0
+        print("%-20s %8s %9s %9s" % ("variants loaded", "configs", "seconds", "MB"))
+        for name, load in (("separately", lambda: load_separate(games, False)),
+                           ("separately, intern", lambda: load_separate(games, True)),
+                           ("as overlays", lambda: load_overlays(games))):
+            count, seconds, growth = measure(load)
+            print("%-20s %8d %9.3f %9.1f" % (name, count, seconds, growth / mb))
+        return 0
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_overlays.py")
+        sys.exit(1)
+    sys.exit(main())
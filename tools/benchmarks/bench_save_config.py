@@ -0,0 +1,107 @@
+#!/usr/bin/env python2
+"""
+  Compares Config.save_config, which streams each element to the file as it is made,
+  against building the whole element tree first and writing it (the former way), over
+  every shipped config file and over a synthesized commands file of each game with its
+  arguments (see synth.py, the shipped commands only have 2.0 format parameters).
+
+  Prints the best time of some runs and the peak memory growth of one run of each way
+  (measured through the RSS of a forked process), and checks both outputs are the same
+  bytes, in which case the exit status is 0.
+
+  Examples:
+    py benchmarks/bench_save_config.py
+    py benchmarks/bench_save_config.py --repeat=10 --compact
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import glob
+import shutil
+import tempfile
+import timeit
+from io import BytesIO
+from lxml import etree
+import gta3sc
+import synth
+from gta3sc import instrument
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+
+def save_config_tree(config, file, pretty_print=True):
+    root = etree.Element("GTA3Script")
+    for tag, items in (("Constants", config.enums), ("Alternators", config.alternators), ("Commands", config.commands)):
+        if len(items) > 0:
+            base = etree.SubElement(root, tag)
+            for item in items:
+                base.append(item.to_node())
+    etree.ElementTree(root).write(file, encoding="utf-8", pretty_print=pretty_print, xml_declaration=True)
+
+def save_config_stream(config, file, pretty_print=True):
+    config.save_config(file, pretty_print)
+
+def rss(): # -> current resident set size in bytes
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+def peak_growth(save, config, filename, pretty_print): # -> bytes the peak RSS grew while saving
+    # in a child the peak RSS starts at the RSS at the fork, unaffected by previous runs
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        before = rss()
+        save(config, filename, pretty_print)
+        os.write(w, str(instrument.peak_rss() - before))
+        os._exit(0)
+    os.close(w)
+    result = int(os.read(r, 64) or -1)
+    os.close(r)
+    os.waitpid(pid, 0)
+    return result
+
+def best_time(func, repeat):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+def configs(): # -> [(name, Config), ...]
+    result = []
+    for filename in sorted(glob.glob(os.path.join(REPO_CONFIG_DIR, "*", "*.xml"))):
+        name = os.path.relpath(filename, REPO_CONFIG_DIR)
+        result.append((name, gta3sc.read_config(filename)))
+    for game in sorted(os.listdir(REPO_CONFIG_DIR)):
+        result.append(("%s/commands.xml (synth)" % game, synth.make_config(os.path.join(REPO_CONFIG_DIR, game))))
+    return result
+
+def main(repeat=5, pretty_print=True):
+    tmpdir = tempfile.mkdtemp()
+    try:
+        same = True
+        mb = 1024.0 * 1024.0
+        print("%-30s %9s %9s %9s %9s %9s" % ("file", "KB", "tree s", "stream s", "tree MB", "stream MB"))
+        for name, config in configs():
+            try:
+                save_config_tree(config, BytesIO(), pretty_print)
+            except TypeError: # e.g. the unnamed enums of 2.0 format files, not written by either way
+                print("%-30s cannot be saved" % name)
+                continue
+            tree_file, stream_file = os.path.join(tmpdir, "tree.xml"), os.path.join(tmpdir, "stream.xml")
+            tree_time = best_time(lambda: save_config_tree(config, tree_file, pretty_print), repeat)
+            stream_time = best_time(lambda: save_config_stream(config, stream_file, pretty_print), repeat)
+            tree_peak = peak_growth(save_config_tree, config, tree_file, pretty_print)
+            stream_peak = peak_growth(save_config_stream, config, stream_file, pretty_print)
+            with open(tree_file, "rb") as f1, open(stream_file, "rb") as f2:
+                identical = f1.read() == f2.read()
+            same = same and identical
+            print("%-30s %9d %9.4f %9.4f %9.1f %9.1f%s" % (name, os.path.getsize(tree_file) / 1024, tree_time, stream_time,
+                                                       tree_peak / mb, stream_peak / mb, "" if identical else "  DIFFERENT OUTPUT"))
+        return 0 if same else 1
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_save_config.py [--repeat=5] [--compact]")
+        sys.exit(1)
+    sys.exit(main(repeat=int(options.get("repeat", 5)), pretty_print="compact" not in options))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python2
+"""
+  Benchmark suite over synthetic programs (see synth.py) of growing size.
+
+  Measures read_config, read_ir2, discover_scopes, _discover_vars and an end-to-end
+  ir2_to_gta3.main at each size (a multiple of the base size), printing the best of
+  some runs with the garbage collector enabled, as the tools run.
+
+  --save stores the results as a baseline (by default benchmarks/baselines/<game>.json,
+  timings are only comparable on the same machine) and --compare checks the results
+  against one, flagging benchmarks slower than the baseline by more than --threshold.
+  Benchmarks whose time grows faster than the program size (more than --scaling over
+  a linear exponent) are flagged too. Any flag makes the exit status 1.
+
+  Examples:
+    py benchmarks/bench_suite.py
+    py benchmarks/bench_suite.py --game=gta3 --sizes=1,2,4,8 --save
+    py benchmarks/bench_suite.py --compare --threshold=0.1
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import json
+import math
+import shutil
+import tempfile
+import timeit
+import gta3sc
+import ir2_to_gta3
+import synth
+from gta3sc.bytecode import _discover_vars
+
+REPO_CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "config")
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+def best_time(func, repeat): # -> best wall time of repeat calls, in seconds
+    best = None
+    for i in range(repeat):
+        start = timeit.default_timer()
+        func()
+        elapsed = timeit.default_timer() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def convert(ir2file, configpath, output_dir):
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w") # progress messages
+    try:
+        ir2_to_gta3.main(ir2file, configpath, output_dir)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+def run(game, sizes, num_missions, num_streams, num_instructions, repeat): # -> { benchmark: { size: seconds } }
+    configdir = os.path.join(REPO_CONFIG_DIR, game)
+    results = {}
+    def record(name, size, seconds):
+        results.setdefault(name, {})[str(size)] = seconds
+        print("%-20s %6s %10.4f s" % (name, size, seconds))
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            workdir = os.path.join(tmpdir, str(size))
+            os.makedirs(workdir)
+            ir2file, configpath = synth.generate(configdir, workdir, num_missions * size, num_streams * size,
+                                                 num_instructions * size)
+            if size == sizes[0]:
+                # not depending on the program size, measured once
+                record("read_config", 1, best_time(lambda: gta3sc.read_config(configdir), repeat))
+                record("read_config.synth", 1, best_time(lambda: gta3sc.read_config(configpath), repeat))
+
+            config = gta3sc.read_config(configpath)
+            bytecode = gta3sc.read_ir2(ir2file, workers=1)
+            record("read_ir2", size, best_time(lambda: gta3sc.read_ir2(ir2file, workers=1), repeat))
+            record("discover_scopes", size, best_time(bytecode.discover_scopes, repeat))
+            record("_discover_vars", size, best_time(lambda: _discover_vars(iter(bytecode), False, config=config), repeat))
+            output_dir = os.path.join(workdir, "output")
+            record("ir2_to_gta3", size, best_time(lambda: convert(ir2file, configpath, output_dir), repeat))
+    finally:
+        shutil.rmtree(tmpdir)
+    return results
+
+def compare(results, baseline, threshold): # -> number of regressions
+    flagged = 0
+    print("%-20s %6s %10s %10s %7s" % ("benchmark", "size", "seconds", "baseline", "ratio"))
+    for name in sorted(results):
+        for size in sorted(results[name], key=int):
+            before = baseline.get(name, {}).get(size)
+            if before is None:
+                continue
+            ratio = results[name][size] / before
+            flag = "  REGRESSION" if ratio > 1.0 + threshold else ""
+            flagged += bool(flag)
+            print("%-20s %6s %10.4f %10.4f %7.2f%s" % (name, size, results[name][size], before, ratio, flag))
+    return flagged
+
+def check_scaling(results, tolerance): # -> number of superlinear benchmarks
+    flagged = 0
+    for name in sorted(results):
+        sizes = sorted(results[name], key=int)
+        if len(sizes) < 2:
+            continue
+        first, last = sizes[0], sizes[-1]
+        exponent = math.log(results[name][last] / results[name][first]) / math.log(float(last) / float(first))
+        flag = "  SUPERLINEAR" if exponent > 1.0 + tolerance else ""
+        flagged += bool(flag)
+        print("%-20s time ~ size^%.2f%s" % (name, exponent, flag))
+    return flagged
+
+def main(game="gtasa", sizes=(1, 2, 4), num_missions=10, num_streams=10, num_instructions=5000, repeat=3,
+         save=None, baseline=None, threshold=0.2, scaling=0.25):
+    params = {"game": game, "missions": num_missions, "streams": num_streams,
+              "instructions": num_instructions, "repeat": repeat}
+    results = run(game, list(sizes), num_missions, num_streams, num_instructions, repeat)
+    print("")
+    flagged = check_scaling(results, scaling)
+
+    if baseline is not None:
+        with open(baseline) as f:
+            stored = json.load(f)
+        if stored["params"] != params:
+            print("\nwarning: the baseline was measured with %r" % (stored["params"],))
+        print("")
+        flagged += compare(results, stored["results"], threshold)
+
+    if save is not None:
+        if not os.path.isdir(os.path.dirname(os.path.abspath(save))):
+            os.makedirs(os.path.dirname(os.path.abspath(save)))
+        with open(save, "w") as f:
+            json.dump({"params": params, "python": sys.version.split()[0], "results": results}, f, indent=2, sort_keys=True)
+        print("\nbaseline saved to %s" % save)
+
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if args:
+        print("Usage: bench_suite.py [--game=gtasa] [--sizes=1,2,4] [--missions=10] [--streams=10] [--instructions=5000] "
+              "[--repeat=3] [--save[=<file.json>]] [--compare[=<file.json>]] [--threshold=0.2] [--scaling=0.25]")
+        sys.exit(1)
+    game = options.get("game", "gtasa")
+    default_baseline = os.path.join(BASELINE_DIR, "%s.json" % game)
+    def path_option(name): # --name means the default baseline file
+        value = options.get(name)
+        return default_baseline if value is True else value
+    sys.exit(main(game,
+                  sizes=[int(x) for x in options.get("sizes", "1,2,4").split(",")],
+                  num_missions=int(options.get("missions", 10)),
+                  num_streams=int(options.get("streams", 10)),
+                  num_instructions=int(options.get("instructions", 5000)),
+                  repeat=int(options.get("repeat", 3)),
+                  save=path_option("save"),
+                  baseline=path_option("compare"),
+                  threshold=float(options.get("threshold", 0.2)),
+                  scaling=float(options.get("scaling", 0.25))))
@@ -0,0 +1,312 @@
+#!/usr/bin/env python2
+"""
+  Deterministic generator of synthetic IR2 programs for the benchmarks.
+
+  The commands and their parameter types, entities and enums are taken from the
+  config/<game> directory of this repository (GTA3script 2.0 format), from which a
+  config the tools can read is also synthesized (gta3sc.read_config does not know
+  the Params of the 2.0 format). The same seed and sizes always give the same program.
+
+  The program has a main script starting some subscripts, N missions and M streamed
+  scripts, with about K instructions overall, using global, local, text label and
+  array variables (the latter two on gtasa only), labels and model references.
+
+  Examples:
+    py benchmarks/synth.py ../config/gtasa out/
+    py benchmarks/synth.py ../config/gtasa out/ 20 10 50000
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import random
+from lxml import etree
+import gta3sc
+from gta3sc.config import Config, Command as CommandInfo, Argument, Enum
+from gta3sc.bytecode import Bytecode, Label, Command, ArgNumber, ArgLabel, ArgString, ArgVariable, ArgArray
+from gta3sc.bytecode import TABLE_SCOPE_SPAWNERS, write_ir2
+from gta3sc.bytecode import DATATYPE_INT8, DATATYPE_INT16, DATATYPE_INT32, DATATYPE_FLOAT
+from gta3sc.bytecode import DATATYPE_GLOBAL_LABEL, DATATYPE_LOCAL_LABEL
+from gta3sc.bytecode import DATATYPE_GLOBALVAR_NUMBER, DATATYPE_LOCALVAR_NUMBER
+from gta3sc.bytecode import DATATYPE_GLOBALVAR_TEXTLABEL, DATATYPE_GLOBALVAR_TEXTLABEL16
+from gta3sc.bytecode import DATATYPE_LOCALVAR_TEXTLABEL, DATATYPE_LOCALVAR_TEXTLABEL16
+from gta3sc.bytecode import DATATYPE_TEXTLABEL8, DATATYPE_TEXTLABEL16, DATATYPE_STRING
+from gta3sc.bytecode import ARRAY_ELEM_TYPE_INT, ARRAY_ELEM_TYPE_FLOAT
+
+COMMANDLINE = "-fscope-then-label -ftimer-index=16 -fno-arrays -fmission-var-begin=0"
+
+# Param type of the 2.0 format -> (Arg type, out, optional) of the format read by gta3sc
+PARAM_TYPES = {
+    "INT":                  ("INT", False, False),
+    "FLOAT":                ("FLOAT", False, False),
+    "INPUT_INT":            ("INT", False, False),
+    "INPUT_FLOAT":          ("FLOAT", False, False),
+    "INPUT_OPT":            ("PARAM", False, True),
+    "OUTPUT_INT":           ("INT", True, False),
+    "OUTPUT_FLOAT":         ("FLOAT", True, False),
+    "VAR_INT":              ("INT", True, False),
+    "VAR_FLOAT":            ("FLOAT", True, False),
+    "LVAR_INT":             ("INT", True, False),
+    "LVAR_FLOAT":           ("FLOAT", True, False),
+    "VAR_INT_OPT":          ("INT", True, True),
+    "VAR_FLOAT_OPT":        ("FLOAT", True, True),
+    "LVAR_INT_OPT":         ("INT", True, True),
+    "LVAR_FLOAT_OPT":       ("FLOAT", True, True),
+    "LABEL":                ("LABEL", False, False),
+    "TEXT_LABEL":           ("TEXT_LABEL", False, False),
+    "TEXT_LABEL16":         ("TEXT_LABEL", False, False),
+    "TEXT_LABEL32":         ("STRING", False, False),
+    "VAR_TEXT_LABEL":       ("TEXT_LABEL", True, False),
+    "VAR_TEXT_LABEL16":     ("TEXT_LABEL", True, False),
+    "LVAR_TEXT_LABEL":      ("TEXT_LABEL", True, False),
+    "LVAR_TEXT_LABEL16":    ("TEXT_LABEL", True, False),
+    "OUTPUT_TEXT_LABEL":    ("TEXT_LABEL", True, False),
+    "OUTPUT_TEXT_LABEL16":  ("TEXT_LABEL", True, False),
+    "VAR_TEXT_LABEL_OPT":   ("TEXT_LABEL", True, True),
+    "VAR_TEXT_LABEL16_OPT": ("TEXT_LABEL", True, True),
+    "LVAR_TEXT_LABEL_OPT":  ("TEXT_LABEL", True, True),
+    "LVAR_TEXT_LABEL16_OPT":("TEXT_LABEL", True, True),
+}
+
+# commands whose arguments refer to scripts, placed by the generator itself
+STRUCTURAL_COMMANDS = set(TABLE_SCOPE_SPAWNERS) | set([
+    "SCRIPT_NAME", "TERMINATE_THIS_SCRIPT", "MISSION_END", "LOAD_AND_LAUNCH_MISSION_INTERNAL",
+    "REGISTER_STREAMED_SCRIPT_INTERNAL", "REGISTER_STREAMED_SCRIPT", "STREAM_SCRIPT",
+    "HAS_STREAMED_SCRIPT_LOADED", "MARK_STREAMED_SCRIPT_AS_NO_LONGER_NEEDED", "REMOVE_STREAMED_SCRIPT",
+    "START_NEW_STREAMED_SCRIPT", "GET_NUMBER_OF_INSTANCES_OF_STREAMED_SCRIPT", "SWITCH_OBJECT_BRAINS",
+    "REGISTER_SCRIPT_BRAIN_FOR_CODE_USE", "REGISTER_ATTRACTOR_SCRIPT_BRAIN_FOR_CODE_USE",
+    "ALLOCATE_STREAMED_SCRIPT_TO_RANDOM_PED", "ALLOCATE_STREAMED_SCRIPT_TO_OBJECT",
+    "REGISTER_OBJECT_SCRIPT_BRAIN_FOR_CODE_USE", "ALLOCATE_STREAMED_SCRIPT_TO_PED_GENERATOR",
+])
+
+NUM_LOCAL_INTS = 6      # 0@..5@
+NUM_LOCAL_FLOATS = 4    # 6@..9@, then a text label at 10@ and a long one at 12@
+
+def read_command_params(configdir): # -> [(name, id, [(param type, entity, enum), ...]), ...]
+    """Reads the commands of config/<game>/commands.xml and their ids from config.xml."""
+    ids = {}
+    config_xml = os.path.join(configdir, "config.xml")
+    if os.path.exists(config_xml):
+        for node in etree.parse(config_xml).iter("CommandId"):
+            ids[node.get("Name")] = int(node.get("ID"), 0)
+    result = []
+    for node in etree.parse(os.path.join(configdir, "commands.xml")).iter("Command"):
+        name = node.get("Name")
+        params = [(p.get("Type"), p.get("Entity"), p.get("Enum")) for p in node.iter("Param")]
+        result.append((name, ids.get(name, len(result)), params))
+    return result
+
+def make_config(configdir): # -> Config
+    """Synthesizes a config the tools can read out of a GTA3script 2.0 config directory."""
+    config = Config()
+    real = gta3sc.read_config(configdir) # alternators and constants are in a common format
+    config.alternators = real.alternators
+    config.enums = [e for e in real.enums if e.name]
+    if not any(e.name == "DEFAULTMODEL" for e in config.enums):
+        config.enums.append(Enum())
+        config.enums[-1].name = "DEFAULTMODEL"
+        config.enums[-1].constants = {"NULL": 0}
+    for name, cmdid, params in read_command_params(configdir):
+        if not all(ptype in PARAM_TYPES for ptype, entity, enum in params):
+            continue
+        cmd = CommandInfo()
+        cmd.name = name
+        cmd.id = cmdid
+        cmd.supported = True
+        for ptype, entity, enum in params:
+            arg = Argument()
+            arg.type, arg.out, arg.optional = PARAM_TYPES[ptype]
+            arg.allow_const = not arg.out
+            arg.allow_gvar = arg.allow_lvar = (arg.type != "LABEL")
+            arg.entity = entity
+            arg.enums = [enum] if enum else []
+            cmd.args.append(arg)
+        cmd.update_arg_table()
+        config.commands.append(cmd)
+    return config
+
+def write_config(config, output_dir):
+    """Writes config as a directory read_config and read_commandline understand."""
+    config.save_config(os.path.join(output_dir, "commands.xml"))
+    with open(os.path.join(output_dir, "commandline.txt"), "w") as f:
+        f.write(COMMANDLINE)
+
+
+class _Generator:
+    def __init__(self, config, params, game, seed, num_globals):
+        self.rng = random.Random(seed)
+        self.sa = (game == "gtasa")
+        self.num_globals = num_globals
+        self.params = {name: [ptype for ptype, entity, enum in p] for name, cmdid, p in params}
+        self.commands = [cmd for cmd in config.commands if cmd.name not in STRUCTURAL_COMMANDS
+                         and not cmd.name.startswith("IS_CONSTANT_") and not cmd.name.endswith("_CONSTANT")
+                         and cmd.name in self.params]
+        self.global_commands = [cmd for cmd in self.commands if not any(p.startswith("LVAR_") for p in self.params[cmd.name])]
+        self.known = set(cmd.name for cmd in config.commands)
+        self.locals = True # the main script until the first subscript has no local variables
+        self.num_models = 50
+
+    # variables are laid out by type so that every one keeps its type over the program
+    def global_int(self):
+        return ArgVariable(DATATYPE_GLOBALVAR_NUMBER, 4 * (2 + self.rng.randrange(self.num_globals)))
+
+    def global_float(self):
+        return ArgVariable(DATATYPE_GLOBALVAR_NUMBER, 4 * (2 + self.num_globals + self.rng.randrange(self.num_globals)))
+
+    def global_text_label(self, long):
+        base = 2 + 2 * self.num_globals
+        if long:
+            return ArgVariable(DATATYPE_GLOBALVAR_TEXTLABEL16, 4 * (base + 32 + 4 * self.rng.randrange(8)))
+        return ArgVariable(DATATYPE_GLOBALVAR_TEXTLABEL, 4 * (base + 2 * self.rng.randrange(16)))
+
+    def global_array(self, is_float):
+        base = 2 + 2 * self.num_globals + 64 + (120 if is_float else 0)
+        index = self.local_int() if self.locals else self.global_int()
+        elem = ARRAY_ELEM_TYPE_FLOAT if is_float else ARRAY_ELEM_TYPE_INT
+        k = self.rng.randrange(4)
+        return ArgArray(ArgVariable(DATATYPE_GLOBALVAR_NUMBER, 4 * (base + 30 * k)), index, 10 + 5 * k, elem)
+
+    def local_int(self):
+        return ArgVariable(DATATYPE_LOCALVAR_NUMBER, 4 * self.rng.randrange(NUM_LOCAL_INTS))
+
+    def local_float(self):
+        return ArgVariable(DATATYPE_LOCALVAR_NUMBER, 4 * (NUM_LOCAL_INTS + self.rng.randrange(NUM_LOCAL_FLOATS)))
+
+    def local_text_label(self, long):
+        if long:
+            return ArgVariable(DATATYPE_LOCALVAR_TEXTLABEL16, 4 * (NUM_LOCAL_INTS + NUM_LOCAL_FLOATS + 2))
+        return ArgVariable(DATATYPE_LOCALVAR_TEXTLABEL, 4 * (NUM_LOCAL_INTS + NUM_LOCAL_FLOATS))
+
+    def var(self, is_float, where):
+        rng = self.rng
+        if where == "LVAR" or (where is None and self.locals and rng.random() < 0.4):
+            return self.local_float() if is_float else self.local_int()
+        if self.sa and where is None and rng.random() < 0.1:
+            return self.global_array(is_float)
+        return self.global_float() if is_float else self.global_int()
+
+    def number(self, is_float, enum):
+        rng = self.rng
+        if is_float:
+            return ArgNumber(DATATYPE_FLOAT, rng.randint(-4000, 4000) / 8.0)
+        if enum == "MODEL" and rng.random() < 0.5:
+            return ArgNumber(DATATYPE_INT16, -1 - rng.randrange(self.num_models))
+        kind = rng.random()
+        if kind < 0.6:
+            return ArgNumber(DATATYPE_INT8, rng.randint(-128, 127))
+        if kind < 0.9:
+            return ArgNumber(DATATYPE_INT16, rng.randint(-32768, 32767))
+        return ArgNumber(DATATYPE_INT32, rng.randint(-2**31, 2**31 - 1))
+
+    def text_label(self, ptype, optional):
+        rng = self.rng
+        long = "16" in ptype
+        # ir2_to_gta3 does not take text label variables in optional arguments
+        if not optional and (ptype.startswith("VAR_") or ptype.startswith("LVAR_") or ptype.startswith("OUTPUT_")):
+            local = self.locals and (ptype.startswith("LVAR_") or (ptype.startswith("OUTPUT_") and rng.random() < 0.5))
+            return self.local_text_label(long) if local else self.global_text_label(long)
+        if ptype == "TEXT_LABEL32":
+            return ArgString(DATATYPE_STRING, "STRING_%d" % rng.randrange(1000))
+        if self.sa and not optional and rng.random() < 0.2:
+            return self.local_text_label(long) if self.locals and rng.random() < 0.5 else self.global_text_label(long)
+        return ArgString(DATATYPE_TEXTLABEL16 if long else DATATYPE_TEXTLABEL8, "TXT%d" % rng.randrange(1000))
+
+    def arg(self, ptype, enum, labels, label_type):
+        rng = self.rng
+        vtype, out, optional = PARAM_TYPES[ptype]
+        if vtype == "LABEL":
+            return ArgLabel(label_type, rng.choice(labels))
+        if vtype in ("TEXT_LABEL", "STRING"):
+            return self.text_label(ptype, optional)
+        if vtype == "PARAM":
+            is_float = rng.random() < 0.3
+            return self.var(is_float, None) if rng.random() < 0.3 else self.number(is_float, None)
+        is_float = (vtype == "FLOAT")
+        if ptype.startswith("VAR_"):
+            return self.var(is_float, "VAR")
+        if ptype.startswith("LVAR_"):
+            return self.var(is_float, "LVAR")
+        if out or rng.random() < 0.3:
+            return self.var(is_float, None)
+        return self.number(is_float, enum)
+
+    def instruction(self, labels, label_type):
+        rng = self.rng
+        cmd = rng.choice(self.commands if self.locals else self.global_commands)
+        args = []
+        for i, arginfo in enumerate(cmd.args):
+            ptype = self.params[cmd.name][i]
+            if arginfo.optional:
+                # optional text label variables are not taken by ir2_to_gta3, and outputs need them
+                count = 0 if arginfo.out and arginfo.type == "TEXT_LABEL" else rng.randint(0, 2)
+                for k in range(count):
+                    args.append(self.arg(ptype, arginfo.enums[0] if arginfo.enums else None, labels, label_type))
+                break
+            args.append(self.arg(ptype, arginfo.enums[0] if arginfo.enums else None, labels, label_type))
+        return Command(rng.random() < 0.05, cmd.name, args)
+
+    def script(self, prefix, script_name, num_instructions, label_type, extra=(), locals=True):
+        """A script labeled prefix_0 with about num_instructions instructions and a label every 16."""
+        self.locals = locals
+        labels = ["%s_%d" % (prefix, i) for i in range(num_instructions / 16 + 1)]
+        block = [Label(labels[0])]
+        if script_name is not None:
+            block.append(Command(False, "SCRIPT_NAME", [ArgString(DATATYPE_TEXTLABEL8, script_name)]))
+        block.extend(extra)
+        for i in range(num_instructions):
+            if i % 16 == 15:
+                block.append(Label(labels[i / 16 + 1]))
+            block.append(self.instruction(labels, label_type))
+        block.append(Command(False, "TERMINATE_THIS_SCRIPT", []))
+        return block
+
+
+def make_program(config, params, game, num_missions=10, num_streams=10, num_instructions=20000, seed=1): # -> Bytecode
+    """
+    Generates a program with about num_instructions instructions, a tenth of them in
+    subscripts of the main script and half of them spread over the missions and streams.
+    """
+    gen = _Generator(config, params, game, seed, num_globals=200 + num_instructions / 50)
+    num_subscripts = 4
+    per_script = max(16, num_instructions / 2 / max(1, num_missions + num_streams))
+    per_subscript = max(16, num_instructions / 10 / num_subscripts)
+
+    launch = []
+    for i in range(num_subscripts):
+        launch.append(Command(False, "START_NEW_SCRIPT", [ArgLabel(DATATYPE_GLOBAL_LABEL, "SUB%d_0" % i)]))
+    if "LOAD_AND_LAUNCH_MISSION_INTERNAL" in gen.known:
+        for i in range(num_missions):
+            launch.append(Command(False, "LOAD_AND_LAUNCH_MISSION_INTERNAL", [ArgNumber(DATATYPE_INT8, i)]))
+    if "REGISTER_STREAMED_SCRIPT_INTERNAL" in gen.known:
+        for i in range(num_streams):
+            launch.append(Command(False, "REGISTER_STREAMED_SCRIPT_INTERNAL", [ArgNumber(DATATYPE_INT8, i)]))
+
+    num_main = max(16, num_instructions - num_subscripts * per_subscript - (num_missions + num_streams) * per_script)
+    main_block = gen.script("MAIN", "MAIN", num_main, DATATYPE_GLOBAL_LABEL, launch, locals=False)
+    for i in range(num_subscripts):
+        main_block += gen.script("SUB%d" % i, "SUB%d" % i, per_subscript, DATATYPE_GLOBAL_LABEL)
+    missions = [gen.script("MISSION%d" % i, "MIS%d" % i, per_script, DATATYPE_LOCAL_LABEL) for i in range(num_missions)]
+    streams = [gen.script("STREAM%d" % i, "STR%d" % i, per_script, DATATYPE_LOCAL_LABEL) for i in range(num_streams)]
+    return Bytecode(main_block, missions, streams,
+                    ["MODEL_%d" % i for i in range(gen.num_models)], ["STREAM%d" % i for i in range(num_streams)])
+
+def generate(configdir, output_dir, num_missions=10, num_streams=10, num_instructions=20000, seed=1): # -> (ir2 path, config dir)
+    """Writes output_dir/main.ir2 and a config for it in output_dir/config."""
+    game = os.path.basename(os.path.normpath(configdir))
+    config = make_config(configdir)
+    program = make_program(config, read_command_params(configdir), game, num_missions, num_streams, num_instructions, seed)
+    configpath = os.path.join(output_dir, "config")
+    if not os.path.isdir(configpath):
+        os.makedirs(configpath)
+    write_config(config, configpath)
+    ir2file = os.path.join(output_dir, "main.ir2")
+    write_ir2(program, ir2file)
+    return ir2file, configpath
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: synth.py <configdir> <output_dir> [missions] [streams] [instructions]")
+        sys.exit(1)
+    sizes = [int(x) for x in sys.argv[3:6]]
+    ir2file, configpath = generate(sys.argv[1], sys.argv[2], *sizes)
+    print("%s (%d bytes), config in %s" % (ir2file, os.path.getsize(ir2file), configpath))
@@ -6,6 +6,7 @@
     py cmp_scmini.py ../config/gtasa/commands.xml SASCM.ini
 """
 import gta3sc
+from gta3sc import instrument
 import sys
 
 def read_scmini(filename):
@@ -27,7 +28,7 @@ def read_scmini(filename):
         return output
 
 def main(xmlname, ininame):
-    commands = gta3sc.read_config(xmlname).commands
+    commands = gta3sc.read_config(xmlname, intern=True).commands
     inidata  = read_scmini(ininame)
 
     commands_dict = {c.id: c for c in commands}
@@ -67,7 +68,8 @@ def main(xmlname, ininame):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: cmp_scmini.py <xmlfile> <inifile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 2:
+        print("Usage: cmp_scmini.py <xmlfile> <inifile> [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
+    instrument.run_tool(options, main, args[0], args[1])
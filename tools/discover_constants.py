@@ -3,9 +3,11 @@
 """
 import sys
 import gta3sc
+from gta3sc import instrument
 from gta3sc.bytecode import Scope, VarInfo
 from collections import defaultdict
 from itertools import chain
+from functools import partial
 
 CONST_COMMANDS = set([
     "SET_VAR_INT_TO_CONSTANT",
@@ -31,76 +33,93 @@ CONST_COMMANDS = set([
 SET_MODELS_ENUMS = set(["DEFAULTMODEL", "MODEL"])
 
 
-def main(ir2file, xmlfile):
-    config = gta3sc.read_config(xmlfile)
+def scan(config, ir2file, cache=None): # -> (enum_args, unknown_values, commands_enum)
     ir2 = gta3sc.read_ir2(ir2file)
+    with gta3sc.cached_analysis(ir2, ir2file, cache) as analysis:
+        scopes = analysis.discover_scopes()
+        current_scope = None
+        first_scope = scopes[0] if len(scopes) > 0 else None
 
-    commands    = {cmd.name: cmd for cmd in config.commands}
-    alternators = defaultdict(set, {alt.name: set(alt.alters) for alt in config.alternators})
-    enums       = {enum.name: {v: k for k,v in enum.constants.iteritems()} for enum in config.enums}
+        global_vars = analysis.discover_global_vars(config=config)
+        local_vars = None
 
-    scopes = ir2.discover_scopes()
-    current_scope = None
-    first_scope = scopes[0] if len(scopes) > 0 else None
+        commands = {cmd.name: cmd for cmd in config.commands}
+        cmds_all_alternatives = set(chain.from_iterable(map(lambda x: x.alters, config.alternators)))
 
-    global_vars = ir2.discover_global_vars(config=config)
-    local_vars = None
+        enum_args = defaultdict(set)   # All values used for a enum that exists
+        unknown_values = []             # Values without a matching enum
+        commands_enum = set()           # Commands missing enum info
 
-    commands = {cmd.name: cmd for cmd in config.commands}
-    cmds_all_alternatives = set(chain.from_iterable(map(lambda x: x.alters, config.alternators)))
+        for off, data in ir2:
 
-    enum_args = defaultdict(set)   # All values used for a enum that exists
-    unknown_values = set()          # Values without a matching enum
-    commands_enum = set()           # Commands missing enum info
-
-    highest_default_id = max(enums["DEFAULTMODEL"].iterkeys())
+            if current_scope == None:
+                if first_scope != None and off >= first_scope.start:
+                    current_scope = Scope.from_offset(off, scopes)
+                    assert current_scope != None
+            elif not current_scope.owns_offset(off):
+                current_scope = Scope.from_offset(off, scopes)
+                assert current_scope != None
+                local_vars = analysis.discover_local_vars(current_scope, config=config)
+
+            if data.is_command() and data.name in CONST_COMMANDS:
+                argvar   = data.args[0] if not data.name.startswith("IS_CONSTANT_") else data.args[1]
+                argconst = data.args[1] if not data.name.startswith("IS_CONSTANT_") else data.args[0]
+                assert argvar.is_var()
+                assert argconst.is_number()
+                varlist  = local_vars if argvar.is_local() else global_vars
+                var = VarInfo.from_offset(argvar.get_offset(), varlist)
+                if len(var.enums) > 0:
+                    for ve in var.enums:
+                        enum_args[ve].add(argconst.value)
+                else:
+                    unknown_values.append("Unknown value %d at %s" % (argconst.value, str(data)))
+            elif data.is_command() and data.name in cmds_all_alternatives:
+                pass
+            elif data.is_command():
+                cmdinfo = commands[data.name]
+                for i, (arg, arginfo) in enumerate(zip(data.args, cmdinfo.arg_descriptors(len(data.args)))):
+                    if arginfo.enum:
+                        enum_name = arginfo.enum
+                        if arg.is_number():
+                            enum_args[enum_name].add(arg.value)
+                            pass
+                        else:
+                            pass # TODO
+                    elif not arginfo.out:
+                        if arg.is_var():
+                            varlist = local_vars if arg.is_local() else global_vars
+                            var = VarInfo.from_offset(arg.get_offset(), varlist)
+                            if len(var.enums) > 0:
+                                for enum_name in var.enums:
+                                    commands_enum.add((cmdinfo.name, i, enum_name))
+
+    return enum_args, unknown_values, commands_enum
+
+def main(ir2path, xmlfile, jobs=None, cache=None):
+    config = gta3sc.read_config(xmlfile, intern=True)
+
+    enums       = {enum.name: enum for enum in config.enums}
+
+    enum_args = defaultdict(set)
+    unknown_values = []
+    commands_enum = set()
+
+    ir2files = gta3sc.find_ir2_files(ir2path)
+    for file_enum_args, file_unknown_values, file_commands_enum in gta3sc.parallel_map(partial(scan, cache=cache), ir2files, shared=config, workers=jobs, flat_config=True):
+        for name, values in file_enum_args.iteritems():
+            enum_args[name].update(values)
+        unknown_values.extend(file_unknown_values)
+        commands_enum.update(file_commands_enum)
+
+    highest_default_id = enums["DEFAULTMODEL"].max_value()
 
     print("--------------------------")
 
-    for off, data in ir2:
-
-        if current_scope == None:
-            if first_scope != None and off >= first_scope.start:
-                current_scope = Scope.from_offset(off, scopes)
-                assert current_scope != None
-        elif not current_scope.owns_offset(off):
-            current_scope = Scope.from_offset(off, scopes)
-            assert current_scope != None
-            local_vars = ir2.discover_local_vars(current_scope, config=config)
-
-        if data.is_command() and data.name in CONST_COMMANDS:
-            argvar   = data.args[0] if not data.name.startswith("IS_CONSTANT_") else data.args[1]
-            argconst = data.args[1] if not data.name.startswith("IS_CONSTANT_") else data.args[0]
-            assert argvar.is_var()
-            assert argconst.is_number()
-            varlist  = local_vars if argvar.is_local() else global_vars
-            var = VarInfo.from_offset(argvar.get_offset(), varlist)
-            if len(var.enums) > 0:
-                for ve in var.enums:
-                    enum_args[ve].add(argconst.value)
-            else:
-                print("Unknown value %d at %s" % (argconst.value, str(data)))
-        elif data.is_command() and data.name in cmds_all_alternatives:
-            pass
-        elif data.is_command():
-            cmdinfo = commands[data.name]
-            for i, arg in enumerate(data.args):
-                arginfo = cmdinfo.get_arg(i)
-                if len(arginfo.enums) > 0:
-                    assert len(arginfo.enums) == 1
-                    enum_name = arginfo.enums[0]
-                    if arg.is_number():
-                        enum_args[enum_name].add(arg.value)
-                        pass
-                    else:
-                        pass # TODO
-                elif not arginfo.out:
-                    if arg.is_var():
-                        varlist = local_vars if arg.is_local() else global_vars
-                        var = VarInfo.from_offset(arg.get_offset(), varlist)
-                        if len(var.enums) > 0:
-                            for enum_name in var.enums:
-                                commands_enum.add((cmdinfo.name, i, enum_name))
+    printed = set()
+    for line in unknown_values:
+        if line not in printed:
+            printed.add(line)
+            print(line)
 
     for info in commands_enum:
         print("Command %s has enum %s at argument %d" % (info[0], info[2], info[1]))
@@ -111,17 +130,19 @@ def main(ir2file, xmlfile):
             missing = sorted(v for v in values if v > highest_default_id)
         elif name == "DEFAULTMODEL":
             enum = enums[name]
-            missing = sorted(v for v in values if v >= 0 and v not in enum)
+            missing = sorted(v for v in values if v >= 0 and not enum.has_value(v))
         else:
-            enum = enums.get(name, {})
-            missing = sorted(v for v in values if v not in enum)
+            enum = enums.get(name)
+            missing = sorted(v for v in values if enum is None or not enum.has_value(v))
         
         if len(missing) > 0:
             print("Values missing from enum %s: %s" % (name, missing))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: discover_constants.py <ir2_script> <xmlfile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 2:
+        print("Usage: discover_constants.py <ir2_script|ir2_dir|ir2_glob> <xmlfile> [--jobs=N] [--cache[=<dir>]] [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
+    instrument.run_tool(options, main, args[0], args[1],
+                        jobs=int(options["jobs"]) if "jobs" in options else None, cache=options.get("cache"))
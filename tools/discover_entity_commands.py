@@ -7,52 +7,35 @@
   Scripts with erroneous entity information (e.g. those built with SCM assemblers) are prone
   to trigger an assertion.
 
+  A directory or a glob of IR2 scripts may be given to scan a whole corpus in parallel,
+  in which case the findings of every script are merged into a single report.
+
   Examples:
     $GTA3SC --config=gtasa main.scm -emit-ir2 -o main.ir2
     py discover_entity_commands.py main.ir2 ../config/gtasa
+    py discover_entity_commands.py "dumps/*.ir2" ../config/gtasa --jobs=8
 """
 import sys
 import gta3sc
+from gta3sc import instrument
 from gta3sc.bytecode import Scope
 from itertools import chain
+from functools import partial
 from collections import defaultdict
-from bisect import *
-
-def find_le(a, x):
-    'Find rightmost value less than or equal to x'
-    i = bisect_right(a, x)
-    return a[i-1] if i else None
+from gta3sc.interval import IntervalIndex
 
 class VariableInfo:
-    def __init__(self, ir2, scopes):
+    def __init__(self, analysis, scopes):
         self.gvars = {}
         self.local_scopes = {scope: {} for scope in scopes}
-        self.global_arrays = ir2.discover_global_arrays()
-        self.local_arrays = {scope: ir2.discover_local_arrays(scope) for scope in scopes}
-        self.global_arrays_keys = sorted(voff for voff in self.global_arrays.iterkeys())
-        self.local_arrays_keys = {scope: sorted(voff for voff in arrays.iterkeys()) for scope, arrays in self.local_arrays.iteritems()}
-        self.globals_arrays_keys = []
-        self.local_arrays_keys = {scope: [] for scope, arrays in self.local_arrays.iteritems() }
+        self.global_arrays = IntervalIndex.from_arrays(analysis.discover_global_arrays())
+        self.local_arrays = {scope: IntervalIndex.from_arrays(analysis.discover_local_arrays(scope)) for scope in scopes}
 
     def get_var_base(self, arg, scope):
         assert not arg.is_array()
-        start_offset = None
-        end_offset = None
-
-        if arg.is_local():
-            voff = find_le(self.local_arrays_keys[scope], arg.offset)
-            if voff != None:
-                start_offset = voff
-                end_offset = start_offset + self.local_arrays[scope][voff]
-        else:
-            voff = find_le(self.global_arrays_keys, arg.offset)
-            if voff != None:
-                start_offset = voff
-                end_offset = start_offset + self.global_arrays[voff]
-
-        if start_offset != None and arg.offset >= start_offset and arg.offset < end_offset:
-            return start_offset
-        return arg.offset
+        arrays = self.local_arrays[scope] if arg.is_local() else self.global_arrays
+        start_offset = arrays.owner(arg.offset)
+        return start_offset if start_offset is not None else arg.offset
 
     def register_var(self, arg, entity_type, scope):
         assert arg.is_var()
@@ -80,11 +63,14 @@ class VariableInfo:
         else:
             return self.gvars.get(offset)
 
-def main(ir2file, xmlfile):
-    config = gta3sc.read_config(xmlfile)
+def scan(config, ir2file, cache=None, verify=True, strict=False): # -> { command_name: set([(arg_index, entity_type), ...]), ... }
     ir2 = gta3sc.read_ir2(ir2file)
+    if verify:
+        gta3sc.check_program(ir2, config, ir2file, strict)
+    with gta3sc.cached_analysis(ir2, ir2file, cache) as analysis:
+        scopes = analysis.discover_scopes()
+        varinfo = VariableInfo(analysis, scopes)
 
-    scopes = ir2.discover_scopes()
     current_scope = None
     first_scope = scopes[0] if len(scopes) > 0 else None
 
@@ -93,11 +79,8 @@ def main(ir2file, xmlfile):
     cmds_is_thing_equal_to_thing = set(config.get_alternator("IS_THING_EQUAL_TO_THING"))
     cmds_all_alternatives = set(chain.from_iterable(map(lambda x: x.alters, config.alternators)))
 
-    varinfo = VariableInfo(ir2, scopes)
     commands_to_tweak = defaultdict(set)
 
-    print("--------------------------")
-
     for off, data in ir2:
 
         if current_scope == None:
@@ -134,8 +117,7 @@ def main(ir2file, xmlfile):
             pass
         elif data.is_command():
             cmd = commands.get(data.name)
-            for i, arg in enumerate(data.args):
-                cmdarg = cmd.get_arg(i)
+            for i, (arg, cmdarg) in enumerate(zip(data.args, cmd.arg_descriptors(len(data.args)))):
                 if cmdarg.out and cmdarg.entity:
                     varinfo.register_var(arg, cmdarg.entity, current_scope)
                 elif arg.is_var():
@@ -149,6 +131,19 @@ def main(ir2file, xmlfile):
                         #        current_scope.find_script_name(ir2), off, current_scope)
                         pass
 
+    return commands_to_tweak
+
+def main(ir2path, xmlfile, jobs=None, cache=None, verify=True, strict=False):
+    config = gta3sc.read_config(xmlfile, intern=True)
+
+    commands_to_tweak = defaultdict(set)
+    ir2files = gta3sc.find_ir2_files(ir2path)
+    for file_commands_to_tweak in gta3sc.parallel_map(partial(scan, cache=cache, verify=verify, strict=strict), ir2files, shared=config, workers=jobs, flat_config=True):
+        for cmdname, args in file_commands_to_tweak.iteritems():
+            commands_to_tweak[cmdname].update(args)
+
+    print("--------------------------")
+
     # Prone to mistakes,so not going to update the XML automatically.
     for cmdname, args in commands_to_tweak.iteritems():
         for info in args:
@@ -158,7 +153,10 @@ def main(ir2file, xmlfile):
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: discover_entity_commands.py <ir2_script> <xmlfile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 2:
+        print("Usage: discover_entity_commands.py <ir2_script|ir2_dir|ir2_glob> <xmlfile> [--jobs=N] [--cache[=<dir>]] [--no-verify|--strict] [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
+    instrument.run_tool(options, main, args[0], args[1],
+                        jobs=int(options["jobs"]) if "jobs" in options else None, cache=options.get("cache"),
+                        verify="no-verify" not in options, strict="strict" in options)
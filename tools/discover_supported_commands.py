@@ -3,31 +3,41 @@
 """
 import sys
 import gta3sc
+from gta3sc import instrument
 from gta3sc.bytecode import Scope
 from itertools import chain
 from collections import defaultdict
 from bisect import *
 
-def main(ir2file, xmlfile):
-    config = gta3sc.read_config(xmlfile)
+def scan(config, ir2file): # -> set([command_name, ...])
     ir2 = gta3sc.read_ir2(ir2file)
+    return set(data.name for off, data in ir2 if data.is_command())
 
+def discover_supported(config, ir2path, jobs=None):
     commands = {cmd.name: cmd for cmd in config.commands}
 
-    for off, data in ir2:
-        if data.is_command():
-            if not data.name in commands:
-                print("Missing command %s" % data.name)
-            else:
-                cmd = commands[data.name]
-                if not cmd.supported:
-                    cmd.supported = True
-                    print("Command %s is actually supported" % data.name)
+    used_commands = set()
+    ir2files = gta3sc.find_ir2_files(ir2path)
+    for file_used_commands in gta3sc.parallel_map(scan, ir2files, shared=config, workers=jobs, flat_config=True):
+        used_commands.update(file_used_commands)
 
+    for name in sorted(used_commands):
+        if not name in commands:
+            print("Missing command %s" % name)
+        else:
+            cmd = commands[name]
+            if not cmd.supported:
+                cmd.supported = True
+                print("Command %s is actually supported" % name)
+
+def main(ir2path, xmlfile, jobs=None):
+    config = gta3sc.read_config(xmlfile, intern=True)
+    discover_supported(config, ir2path, jobs)
     config.save_config(xmlfile)
 
 if __name__ == "__main__":
-    if len(sys.argv) < 3:
-        print("Usage: discover_supported_commands.py <ir2_script> <xmlfile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 2:
+        print("Usage: discover_supported_commands.py <ir2_script|ir2_dir|ir2_glob> <xmlfile> [--jobs=N] [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
+    instrument.run_tool(options, main, args[0], args[1], jobs=int(options["jobs"]) if "jobs" in options else None)
@@ -5,6 +5,7 @@
 """
 
 import gta3sc
+from gta3sc import instrument
 from collections import defaultdict, namedtuple
 
 def print_once(iterator):
@@ -35,7 +36,8 @@ def copy_properties(gta3_commands, gtavc_commands, gtasa_commands):
                 s.allow_gvar  = v.allow_gvar
                 s.allow_lvar  = v.allow_lvar
                 s.entity      = v.entity
-                s.enums       = v.enums
+                s.enums       = list(v.enums)
+            sacmd.update_arg_table()
 
         elif g3cmd is not None and sacmd.same_behaviour(g3cmd):
             assert False
@@ -56,64 +58,65 @@ def commands_with_model_args(commands):
             if any(arg.has_enum("MODEL") for arg in cmd.args):
                 yield cmd.name
 
-def argument_descriptions(commands):
-    for cmd in commands.itervalues():
-        for arg in cmd.args:
-            yield arg.desc
-
-def discover_properties_from_description(commands):
+def discover_properties_from_description(commands, index=None):
+    # index is the ArgIndex changes go through, pass the config's own (config.arg_index())
+    # to keep it in sync; the postings of commands not in commands are ignored
+    if index is None:
+        index = gta3sc.ArgIndex(commands.itervalues())
+    def find_desc(desc):
+        return [(cmd, i) for cmd, i in index.find("desc", desc) if commands.get(cmd.id) is cmd]
 
-    temp_all_descs = list(argument_descriptions(commands))
-    assert len(set(temp_all_descs)) == len(set(x.upper() for x in temp_all_descs))
-    del temp_all_descs
+    all_descs = [desc for desc in index.values("desc") if find_desc(desc)]
+    assert len(all_descs) == len(set(x.upper() for x in all_descs))
 
     Enum = namedtuple('Enum', ['defined_at', 'name'])
     Entity = namedtuple('Entity', ['defined_at', 'name'])
 
     dictionary = {}
-    used_in_cmds = defaultdict(list)
-    for cmd in commands.itervalues():
-        for arg in cmd.args:
-            if arg.desc:
-                if arg.desc in ("Model ID",):
-                    continue
-                used_in_cmds[arg.desc].append(cmd)
-                mydata = dictionary.get(arg.desc)
-                newdata = None
-                try:
-                    if mydata is None:
-                        if len(arg.enums) > 0:
-                            newdata = Enum(cmd, arg.enums[0])
-                            assert len(arg.enums) == 1
-                            assert arg.entity is None
-                        if arg.entity is not None:
-                            newdata = Entity(cmd, arg.entity)
-                            assert len(arg.enums) == 0
-                        if newdata is not None:
-                            mydata = newdata
-                            dictionary[arg.desc] = newdata
-                    elif isinstance(mydata, Enum):
+    used_in_cmds = {}
+    for desc in all_descs:
+        if desc in ("Model ID",):
+            continue
+        postings = find_desc(desc)
+        used_in_cmds[desc] = [cmd for cmd, i in postings]
+        for cmd, i in postings:
+            arg = cmd.args[i]
+            mydata = dictionary.get(arg.desc)
+            newdata = None
+            try:
+                if mydata is None:
+                    if len(arg.enums) > 0:
+                        newdata = Enum(cmd, arg.enums[0])
+                        assert len(arg.enums) == 1
                         assert arg.entity is None
-                        if len(arg.enums) > 0:
-                            assert len(arg.enums) == 1
-                            assert mydata.name == arg.enums[0]
-                    elif isinstance(mydata, Entity):
+                    if arg.entity is not None:
+                        newdata = Entity(cmd, arg.entity)
                         assert len(arg.enums) == 0
-                        if arg.entity is not None:
-                            assert mydata.name == arg.entity
-                except AssertionError: # HACKY
-                    print("======= PROPERTIES CONFLICT ==========")
-                    print("Argument Description: %s" % (arg.desc))
-                    if mydata is not None:
-                        print("Previous property found in %s with value %s and type %s." % (mydata.defined_at.name, mydata.name, type(mydata).__name__))
-                    else:
-                        print("Previous data never found.")
                     if newdata is not None:
-                        print("Currently parsing data is in %s with value %s and type %s" % (newdata.defined_at.name, newdata.name, type(newdata).__name__))
-                    else:
-                        print("Currently parsing data is in %s" % (cmd.name))
-                    print("=====================================")
-                    raise 
+                        mydata = newdata
+                        dictionary[arg.desc] = newdata
+                elif isinstance(mydata, Enum):
+                    assert arg.entity is None
+                    if len(arg.enums) > 0:
+                        assert len(arg.enums) == 1
+                        assert mydata.name == arg.enums[0]
+                elif isinstance(mydata, Entity):
+                    assert len(arg.enums) == 0
+                    if arg.entity is not None:
+                        assert mydata.name == arg.entity
+            except AssertionError: # HACKY
+                print("======= PROPERTIES CONFLICT ==========")
+                print("Argument Description: %s" % (arg.desc))
+                if mydata is not None:
+                    print("Previous property found in %s with value %s and type %s." % (mydata.defined_at.name, mydata.name, type(mydata).__name__))
+                else:
+                    print("Previous data never found.")
+                if newdata is not None:
+                    print("Currently parsing data is in %s with value %s and type %s" % (newdata.defined_at.name, newdata.name, type(newdata).__name__))
+                else:
+                    print("Currently parsing data is in %s" % (cmd.name))
+                print("=====================================")
+                raise 
 
     #print(dictionary.get("Boolean true/false").defined_at.name)
     assert dictionary.get("Model ID") == None
@@ -125,17 +128,15 @@ def discover_properties_from_description(commands):
             print("    %s" % (cmd.name))
         print("")
 
-    for cmd in commands.itervalues():
-        for arg in cmd.args:
-            data = dictionary.get(arg.desc)
-            if data is None:
-                pass
-            elif isinstance(data, Enum):
+    for desc, data in dictionary.iteritems():
+        for cmd, i in find_desc(desc):
+            arg = cmd.args[i]
+            if isinstance(data, Enum):
                 if not arg.enums:
-                    arg.enums.append(data.name)
+                    index.set(cmd, i, "enum", data.name)
             elif isinstance(data, Entity):
                 if not arg.entity:
-                    arg.entity = data.name
+                    index.set(cmd, i, "entity", data.name)
 
 def find_missing_properties_from_command_name(commands_notfiltered):
 
@@ -148,20 +149,20 @@ def find_missing_properties_from_command_name(commands_notfiltered):
 
     commands = {c.id: c for c in commands_notfiltered.itervalues() if c.supported}
 
+    # each command name is scanned once for every type name, then checked against its own args
+    entity_matcher = gta3sc.PatternMatcher(entity_types)
+    enum_matcher = gta3sc.PatternMatcher(enum_types)
+
     entity_missing = defaultdict(list)
     enum_missing = defaultdict(list)
 
     for cmd in commands.itervalues():
-        for name in entity_types:
-            if name in cmd.name:
-                if not any(a.entity == name for a in cmd.args):
-                    entity_missing[name].append(cmd)
-
-    for cmd in commands.itervalues():
-        for name in enum_types:
-            if name in cmd.name:
-                if not any(a.enums and a.enums[0] == name for a in cmd.args):
-                    enum_missing[name].append(cmd)
+        arg_entities = set(a.entity for a in cmd.args)
+        arg_enums = set(a.enums[0] for a in cmd.args if a.enums)
+        for name in entity_matcher.findall(cmd.name) - arg_entities:
+            entity_missing[name].append(cmd)
+        for name in enum_matcher.findall(cmd.name) - arg_enums:
+            enum_missing[name].append(cmd)
 
     print("============================================")
     print("Possible Entities Missing")
@@ -188,29 +189,33 @@ def remove_enums_from_outputs(commands):
             if arg.out and len(arg.enums) > 0:
                 print(cmd.name)
                 arg.enums = []
+        cmd.update_arg_table()
 
 def add_allow_const_false_to_out_params(commands):
     for cmd in commands.itervalues():
         for arg in cmd.args:
             if arg.out:
                 arg.allow_const = False
+        cmd.update_arg_table()
 
 def main():
     gtasa = gta3sc.read_config("gtasa/commands.xml")
-    gtavc = gta3sc.read_config("gtavc/commands.xml")
-    gta3  = gta3sc.read_config("gta3/commands.xml")
+    gtavc = gta3sc.read_config("gtavc/commands.xml", intern=True)
+    gta3  = gta3sc.read_config("gta3/commands.xml", intern=True)
 
     gtasa_commands = {c.id: c for c in gtasa.commands}
     gtavc_commands = {c.id: c for c in gtavc.commands}
     gta3_commands  = {c.id: c for c in gta3.commands}
 
-    discover_properties_from_description(gtasa_commands)
+    discover_properties_from_description(gtasa_commands, gtasa.arg_index())
 
     gtasa.save_config("gtasa/commands.xml")
 
 
 
 if __name__ == "__main__":
-    main()
+    import sys
+    args, options = gta3sc.split_options(sys.argv[1:])
+    instrument.run_tool(options, main)
 
 
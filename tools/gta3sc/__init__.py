@@ -1,3 +1,12 @@
 # -*- Python -*-
 from config import read_commandline, read_config
-from bytecode import read_ir2
\ No newline at end of file
+from bytecode import read_ir2, read_scm
+from parallel import parallel_map, find_ir2_files, split_options
+from ir2index import load_ir2_index, find_script_block, read_ir2_blocks
+from cache import AnalysisCache, cached_analysis
+from validate import compile_schema, validate_configs
+from lint import lint_config
+from verify import verify_program, check_program
+from ahocorasick import PatternMatcher
+from argindex import ArgIndex
+from flatconfig import FlatConfig, write_flat_config, share_config
\ No newline at end of file
@@ -0,0 +1,25 @@
+# -*- Python -*-
+"""
+Config maintenance commands.
+
+Usage:
+    py -m gta3sc lint ../config/gtasa
+    py -m gta3sc validate ../schema.rnc ../config
+    py -m gta3sc pipeline ../config/gtasa/commands.xml hash simplify
+"""
+import sys
+
+import lint
+import pipeline
+import validate
+
+COMMANDS = {
+    "lint":     lint.main,
+    "pipeline": pipeline.main,
+    "validate": validate.main,
+}
+
+if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+    print("Usage: py -m gta3sc <%s> [args...]" % "|".join(sorted(COMMANDS)))
+    sys.exit(1)
+sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
@@ -0,0 +1,68 @@
+# -*- Python -*-
+from collections import deque
+
+__all__ = ["PatternMatcher"]
+
+class PatternMatcher:
+    """
+    Finds every occurrence of many substrings in a text in a single pass (Aho-Corasick).
+
+    The automaton is built once over the patterns, then each text is scanned in time
+    linear to its length plus the matches, however many patterns there are. Patterns
+    inside other patterns (e.g. CAR inside CAR_GENERATOR) are all reported.
+    """
+
+    def __init__(self, patterns=()):
+        self.goto = [{}]      # state -> { char: state }
+        self.fail = [0]       # state -> longest proper suffix state
+        self.output = [()]    # state -> (pattern, ...) ending at this state, suffixes included
+        self.patterns = set()
+        for pattern in patterns:
+            self._add(pattern)
+        self._link()
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def _add(self, pattern):
+        if not pattern or pattern in self.patterns:
+            return
+        self.patterns.add(pattern)
+        state = 0
+        for char in pattern:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto[state][char] = next_state
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            state = next_state
+        self.output[state] = (pattern,)
+
+    def _link(self):
+        # breadth first, so the failure state of a parent is known before its children
+        queue = deque(self.goto[0].itervalues())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].iteritems():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.output[next_state] = self.output[next_state] + self.output[fail]
+
+    def finditer(self, text): # -> yields (end index, pattern) for every occurrence
+        goto, fail, output = self.goto, self.fail, self.output
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for pattern in output[state]:
+                yield (i + 1, pattern)
+
+    def findall(self, text): # -> set([pattern, ...]) of the patterns occurring in text
+        return set(pattern for end, pattern in self.finditer(text))
@@ -0,0 +1,91 @@
+# -*- Python -*-
+from bisect import bisect_left
+
+__all__ = ["ArgIndex", "ARG_INDEX_ATTRS"]
+
+ARG_INDEX_ATTRS = ("desc", "entity", "enum", "type")
+
+def _get(arg, attr):
+    if attr == "enum": # only the first enum, as ArgDescriptor
+        return arg.enums[0] if len(arg.enums) > 0 else None
+    return getattr(arg, attr)
+
+def _set(arg, attr, value):
+    if attr == "enum": # replaces (or drops, given no value) only the first enum
+        arg.enums = ([value] if value else []) + arg.enums[1:]
+    else:
+        setattr(arg, attr, value)
+
+class ArgIndex:
+    """
+    Inverted indexes from the desc, entity, enum and type of arguments to the
+    (Command, arg index) postings having them, for queries over the whole command table.
+
+    Empty values (no desc, entity or enum) are not indexed. Changes to the arguments
+    must go through set() or add_command/remove_command to keep the index in sync;
+    set() also updates the arg tables of the command.
+    """
+
+    def __init__(self, commands=()):
+        self.postings = {attr: {} for attr in ARG_INDEX_ATTRS} # attr -> { value: [(Command, i), ...] }
+        self._sorted = {}   # attr -> sorted values, for prefix queries, dropped when values change
+        for cmd in commands:
+            self.add_command(cmd)
+
+    def _add(self, attr, value, posting):
+        if value:
+            postings = self.postings[attr].get(value)
+            if postings is None:
+                postings = self.postings[attr][value] = []
+                self._sorted.pop(attr, None)
+            postings.append(posting)
+
+    def _remove(self, attr, value, posting):
+        if value:
+            postings = self.postings[attr][value]
+            postings.remove(posting)
+            if not postings:
+                del self.postings[attr][value]
+                self._sorted.pop(attr, None)
+
+    def add_command(self, cmd):
+        for i, arg in enumerate(cmd.args):
+            for attr in ARG_INDEX_ATTRS:
+                self._add(attr, _get(arg, attr), (cmd, i))
+
+    def remove_command(self, cmd):
+        for i, arg in enumerate(cmd.args):
+            for attr in ARG_INDEX_ATTRS:
+                self._remove(attr, _get(arg, attr), (cmd, i))
+
+    def set(self, cmd, i, attr, value):
+        """Sets an attribute of argument i of cmd, moving its posting to the new value."""
+        arg = cmd.args[i]
+        old = _get(arg, attr)
+        if old == value:
+            return
+        _set(arg, attr, value)
+        cmd.update_arg_table()
+        self._remove(attr, old, (cmd, i))
+        self._add(attr, _get(arg, attr), (cmd, i)) # dropping the first enum makes the next one first
+
+    def values(self, attr): # -> sorted [value, ...] of attr present in some argument
+        values = self._sorted.get(attr)
+        if values is None:
+            values = self._sorted[attr] = sorted(self.postings[attr])
+        return values
+
+    def find(self, attr, value): # -> [(Command, arg index), ...] of the args with such value
+        return list(self.postings[attr].get(value, ()))
+
+    def find_prefix(self, attr, prefix): # -> [(Command, arg index), ...] of the args with a value starting with prefix
+        values = self.values(attr)
+        result = []
+        for k in xrange(bisect_left(values, prefix), len(values)):
+            if not values[k].startswith(prefix):
+                break
+            result += self.postings[attr][values[k]]
+        return result
+
+    def args(self, attr, value): # -> [Argument, ...] of the args with such value
+        return [cmd.args[i] for cmd, i in self.postings[attr].get(value, ())]
@@ -1,13 +1,23 @@
 # -*- Python -*-
 
 from collections import namedtuple
+from contextlib import contextmanager
+from cStringIO import StringIO
+import gc
 from itertools import chain
+import math
 import re
+import struct
+
+from compression import open_compressed
+from img import ImgArchive, map_file
+from parallel import parallel_map
+import instrument
 
 __all__ = [
     "Bytecode", "Offset", "VarInfo", "Scope", "Data", "Arg", "Label", "Hex", "Command", 
      "ArgNumber", "ArgLabel", "ArgString", "ArgVariable", "ArgArray",
-     "read_ir2",
+     "LazyBlocks", "read_ir2", "read_scm", "write_ir2",
 ]
 
 DATA_HEX     = 0
@@ -77,22 +87,26 @@ class Bytecode:
         self.stream_names = stream_names
 
         self.label_table = {}
-        for off, data in self:
+        self.unplaced_labels = {} # name -> position of labels read_scm could not place in a block
+        self._add_labels(BYTECODE_OFFSET_MAIN, 0, main_block)
+        for i, block in enumerate(mission_blocks):
+            self._add_labels(BYTECODE_OFFSET_MISSION, i, block)
+        if isinstance(streamed_blocks, LazyBlocks):
+            # labels of lazily loaded blocks are registered when the block is first accessed
+            streamed_blocks.on_load = lambda i, block: self._add_labels(BYTECODE_OFFSET_STREAMED, i, block)
+        else:
+            for i, block in enumerate(streamed_blocks):
+                self._add_labels(BYTECODE_OFFSET_STREAMED, i, block)
+
+    def _add_labels(self, blocktype, block_id, block):
+        for i, data in enumerate(block):
             if data.is_label():
-                self.label_table[data.name] = off
+                self.label_table[data.name] = Offset(blocktype, block_id, i)
 
     def __str__(self):
-        lines = []
-        lines.extend(str(data) for data in self.main_block)
-        for i, block in enumerate(self.mission_blocks):
-            lines.append("#MISSION_BLOCK_START %d" % i)
-            lines.extend(str(data) for data in block)
-            lines.append("#MISSION_BLOCK_END")
-        for i, block in enumerate(self.streamed_blocks):
-            lines.append("#STREAMED_BLOCK_START %d" % i)
-            lines.extend(str(data) for data in block)
-            lines.append("#STREAMED_BLOCK_END")
-        return "\n".join(lines)
+        output = StringIO()
+        _write_ir2(self, output.write, 1024, defines=False)
+        return output.getvalue().rstrip("\n")
 
     def __iter__(self):
         for i, data in enumerate(self.main_block):
@@ -132,6 +146,13 @@ class Bytecode:
     def offset_from_streamed(self, i):
         return Offset(BYTECODE_OFFSET_STREAMED, i, 0)
 
+    def offset_from_stream_name(self, name): # -> Offset or None, without loading other streamed blocks
+        names = [stream.lower() for stream in self.stream_names]
+        if name.lower() not in names:
+            return None
+        return self.offset_from_streamed(names.index(name.lower()))
+
+    @instrument.timed("discover_scopes")
     def discover_scopes(self): # -> sorted [Scope, ...]
         scopes_at = []
         result = []
@@ -156,19 +177,58 @@ class Bytecode:
 
         return result
 
-    def discover_global_vars(self, config=None, more_info=None):  # -> sorted [VarInfo, ...]
+    @instrument.timed("discover_global_vars")
+    def discover_global_vars(self, config=None, more_info=None, workers=None):  # -> sorted [VarInfo, ...]
+        # with workers > 1 each block is analyzed by its own process, see _discover_vars_sharded
+        if workers is not None and workers > 1:
+            return _discover_vars_sharded(self, False, config=config, more_info=more_info, workers=workers)
         return _discover_vars(iter(self), False, config=config, more_info=more_info)
 
+    @instrument.timed("discover_local_vars")
     def discover_local_vars(self, scope, config=None, more_info=None):  # -> sorted [VarInfo, ...]
         return _discover_vars(iter(scope.iter_data(self)), True, config=config, more_info=more_info)
 
+    @instrument.timed("discover_global_arrays")
     def discover_global_arrays(self): # -> { offset: end_offset, ... }
         return _discover_arrays(iter(self), False)
 
+    @instrument.timed("discover_local_arrays")
     def discover_local_arrays(self, scope): # -> { offset: end_offset, ... }
         return _discover_arrays(scope.iter_data(self), True)
 
 
+class LazyBlocks:
+    """
+    A list of blocks decoded on first access by load(i) -> [Data, ...].
+
+    Used for the streamed blocks of a Bytecode, so that picking one script out of
+    script.img does not decode the others. on_load(i, block) is called once per block.
+    """
+
+    def __init__(self, count, load):
+        self.blocks = [None] * count
+        self.load = load
+        self.on_load = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __getitem__(self, i):
+        block = self.blocks[i]
+        if block is None:
+            block = self.blocks[i] = self.load(i)
+            if self.on_load is not None:
+                self.on_load(i, block)
+        return block
+
+    def __iter__(self):
+        for i in range(len(self.blocks)):
+            yield self[i]
+
+    def is_loaded(self, i):
+        return self.blocks[i] is not None
+
+
 Offset = namedtuple("Offset", ['type', 'block', 'index'])
 
 ScopeBase = namedtuple('ScopeBase', ['start', 'end'])
@@ -296,11 +356,12 @@ class Hex(Data):
         self.bytes = bytearray_object
 
     def __str__(self):
-        output = "IR2_HEX"
-        for i in self.bytes:
-            output += ' '
-            output += str(i - 256 if i > 127 else i) + 'i8'
-        return output
+        return "IR2_HEX" + "".join(self.iter_tokens())
+
+    def iter_tokens(self, chunk_size=4096): # -> strings of " <byte>i8" tokens, chunk_size bytes at a time
+        data = self.bytes # may be a memoryview of a mapped file
+        for start in range(0, len(data), chunk_size):
+            yield "".join(map(_HEX_TOKENS.__getitem__, bytearray(data[start:start+chunk_size])))
 
 class Command(Data):
     def __init__(self, not_flag, name, args):
@@ -337,7 +398,7 @@ class ArgNumber(Arg):
         if self.type == DATATYPE_INT32:
             return "%di32" % self.value
         if self.type == DATATYPE_FLOAT:
-            return "%.6af" % self.value
+            return _hexfloat(self.value) + 'f'
         assert False
 
 class ArgLabel(Arg):
@@ -463,146 +524,575 @@ class ArgArray(Arg):
 
 
 
-def read_ir2(file):
+def read_ir2(file, workers=None):
+    """
+    Reads an IR2 text file, which may be compressed (see open_compressed), into a Bytecode.
+
+    With workers > 1, the file is split at block boundaries (and large blocks in
+    runs of lines) and the pieces are parsed in a process pool, then stitched back.
+    """
     try:
-        lines = file.readlines()
+        readlines = file.readlines
     except AttributeError:
-        with open(file) as f:
-            return read_ir2(f)
-
-    RE_INT8 = re.compile(r"^(-?[0-9]+)i8$")
-    RE_INT16 = re.compile(r"^(-?[0-9]+)i16$")
-    RE_INT32 = re.compile(r"^(-?[0-9]+)i32$")
-    RE_FLOAT = re.compile(r"^(-?0x[01]\.[0-9a-f]{6}p[+-][0-9]+)f$")
-    RE_GLOBALOFF = re.compile(r"^@([_A-Z][_A-Z0-9]*)$")
-    RE_LOCALOFF = re.compile(r"^%([_A-Z][_A-Z0-9]*)$")
-    RE_GLOBALVAR = re.compile(r"^([sv]?)&([0-9]+)$")
-    RE_LOCALVAR = re.compile(r"^([0-9]+)@([sv]?)$")
-    RE_ARRAY = re.compile(r"^([sv&@0-9]+)\(([&@0-9]+),([0-9]+)([ifsv])\)$")
-    RE_TEXTLABEL = re.compile(r"^'([\x20-\x7E]*)'$")
-    RE_TEXTLABEL16 = re.compile(r"^v'([\x20-\x7E]*)'$")
-    RE_BUFFER128 = re.compile(r"^b\"([\x20-\x7E]*)\"$")
-    RE_STRING = re.compile(r"^\"([\x20-\x7E]*)\"$")
-
-    def escape(string):
-        return string # TODO
-
-    def var_datatype_from_char(c, tup):
-        if c == '': return tup[0]
-        if c == 's': return tup[1]
-        if c == 'v': return tup[2]
-        return None
+        with open_compressed(file) as f:
+            return read_ir2(f, workers)
+    with instrument.timer("read_ir2"):
+        return _read_ir2_lines(readlines(), workers)
+
+def _read_ir2_lines(lines, workers):
+    models = []
+    stream_names = []
+    blocks = { BYTECODE_OFFSET_MISSION: [], BYTECODE_OFFSET_STREAMED: [] } # -> [(start line, end line), ...]
+    main_end = None
+    start = None
+
+    # Only directives need to be looked at to find the blocks, everything else is parsed later.
+    for i, line in enumerate(lines):
+        if line[0] != '#':
+            continue
+        tokens = line.split()
+        if tokens[0] == "#MISSION_BLOCK_START" or tokens[0] == "#STREAMED_BLOCK_START":
+            blocktype = BYTECODE_OFFSET_MISSION if tokens[0] == "#MISSION_BLOCK_START" else BYTECODE_OFFSET_STREAMED
+            assert len(blocks[blocktype]) == int(tokens[1])
+            if main_end is None:
+                main_end = i
+            start = i + 1
+        elif tokens[0] == "#MISSION_BLOCK_END" or tokens[0] == "#STREAMED_BLOCK_END":
+            blocktype = BYTECODE_OFFSET_MISSION if tokens[0] == "#MISSION_BLOCK_END" else BYTECODE_OFFSET_STREAMED
+            blocks[blocktype].append((start, i))
+        elif tokens[0] == "#DEFINE_MODEL":
+            models.append(tokens[1])
+        elif tokens[0] == "#DEFINE_STREAM":
+            stream_names.append(tokens[1])
+    blocks[BYTECODE_OFFSET_MAIN] = [(0, main_end if main_end is not None else len(lines))]
+
+    parallel = workers is not None and workers > 1
+    ranges = []     # (blocktype, block id, start line, end line)
+    chunk_size = max(1000, len(lines) / (4 * workers)) if parallel else len(lines) + 1
+    for blocktype in (BYTECODE_OFFSET_MAIN, BYTECODE_OFFSET_MISSION, BYTECODE_OFFSET_STREAMED):
+        for block_id, (start, end) in enumerate(blocks[blocktype]):
+            for chunk_start in range(start, end, chunk_size):
+                ranges.append((blocktype, block_id, chunk_start, min(end, chunk_start + chunk_size)))
+
+    with _gc_paused():
+        if parallel:
+            parsed = parallel_map(_parse_ir2_packed, ranges, shared=lines, workers=workers)
+            parsed = [map(_unpack_data, block) for block in parsed]
+        else:
+            parsed = [_parse_ir2_lines(lines, r) for r in ranges]
+
+    result = { BYTECODE_OFFSET_MAIN: [[]],
+               BYTECODE_OFFSET_MISSION: [[] for b in blocks[BYTECODE_OFFSET_MISSION]],
+               BYTECODE_OFFSET_STREAMED: [[] for b in blocks[BYTECODE_OFFSET_STREAMED]] }
+    for (blocktype, block_id, start, end), block in zip(ranges, parsed):
+        result[blocktype][block_id].extend(block)
+
+    return Bytecode(result[BYTECODE_OFFSET_MAIN][0], result[BYTECODE_OFFSET_MISSION],
+                    result[BYTECODE_OFFSET_STREAMED], models, stream_names)
+
+_RE_INT8 = re.compile(r"^(-?[0-9]+)i8$")
+_RE_INT16 = re.compile(r"^(-?[0-9]+)i16$")
+_RE_INT32 = re.compile(r"^(-?[0-9]+)i32$")
+_RE_FLOAT = re.compile(r"^(-?(?:0x[01]\.[0-9a-f]{6}p[+-][0-9]+|inf|nan))f$")
+_RE_GLOBALOFF = re.compile(r"^@([_A-Z][_A-Z0-9]*)$")
+_RE_LOCALOFF = re.compile(r"^%([_A-Z][_A-Z0-9]*)$")
+_RE_GLOBALVAR = re.compile(r"^([sv]?)&([0-9]+)$")
+_RE_LOCALVAR = re.compile(r"^([0-9]+)@([sv]?)$")
+_RE_ARRAY = re.compile(r"^([sv&@0-9]+)\(([&@0-9]+),([0-9]+)([ifsv])\)$")
+_RE_TEXTLABEL = re.compile(r"^'([\x20-\x7E]*)'$")
+_RE_TEXTLABEL16 = re.compile(r"^v'([\x20-\x7E]*)'$")
+_RE_BUFFER128 = re.compile(r"^b\"([\x20-\x7E]*)\"$")
+_RE_STRING = re.compile(r"^\"([\x20-\x7E]*)\"$")
+_RE_TOKENS = re.compile("( |b?\\\".*?\\\"|v?'.*?')")
+
+@contextmanager
+def _gc_paused():
+    # Parsing allocates a lot of objects that all stay alive, which makes the cyclic
+    # collector run over and over for nothing; it is about half of the parsing time.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _parse_ir2_lines(lines, line_range): # -> [Data, ...] of the lines in line_range
+    blocktype, block_id, start, end = line_range
+    arg_from_token = _arg_from_token_counted if instrument.is_enabled() else _arg_from_token
+    block = []
+    for n in xrange(start, end):
+        line = lines[n].rstrip('\r\n')
+        assert len(line) > 0 and not line[0].isspace() and not line[-1].isspace()
+        if line[0] == '#':
+            continue
+        elif line[-1] == ':':
+            block.append(Label(line[:-1]))
+        else:
+            tokens = [p for p in _RE_TOKENS.split(line) if p.strip()]
+            not_flag = (tokens[0] == "NOT")
+            cmdname  = tokens[not_flag].upper()
+            cmdargs = [arg_from_token(tokens[i]) for i in range(1 + not_flag, len(tokens))]
+            if cmdname == "IR2_HEX":
+                bytedata = bytearray([(i + 256 if i < 0 else i) for i in map(lambda a: a.value, cmdargs)])
+                block.append(Hex(bytedata))
+            else:
+                block.append(Command(not_flag, cmdname, cmdargs))
+    return block
 
-    def var_from_token(token):
-        m = RE_GLOBALVAR.match(token)
-        if m != None:
-            datatype = var_datatype_from_char(m.group(1), DATATYPES_GLOBALVARS)
-            return ArgVariable(datatype, int(m.group(2)))
+# Data instances are slow to pickle, about as slow as parsing them in the first place,
+# so workers send blocks back as tuples of plain values.
 
-        m = RE_LOCALVAR.match(token)
-        if m != None:
-            datatype = var_datatype_from_char(m.group(2), DATATYPES_LOCALVARS)
-            return ArgVariable(datatype, 4 * int(m.group(1)))
+def _parse_ir2_packed(lines, line_range): # -> [packed Data, ...]
+    with _gc_paused():
+        return map(_pack_data, _parse_ir2_lines(lines, line_range))
 
-        return None
+def _pack_data(data):
+    if data.is_label(): return data.name
+    if data.is_hex(): return bytearray(data.bytes)
+    return (data.not_flag, data.name, map(_pack_arg, data.args))
 
-    def elem_from_token(token):
-        if token == 'i': return ARRAY_ELEM_TYPE_INT
-        if token == 'f': return ARRAY_ELEM_TYPE_FLOAT
-        if token == 's': return ARRAY_ELEM_TYPE_TEXTLABEL
-        if token == 'v': return ARRAY_ELEM_TYPE_TEXTLABEL16
-        return None
+def _pack_arg(arg):
+    if arg.is_array(): return (arg.type, _pack_arg(arg.base), _pack_arg(arg.index), arg.size, arg.elem_type)
+    if arg.is_var(): return (arg.type, arg.offset)
+    return (arg.type, arg.value)
 
-    def arg_from_token(token):
-        m = RE_INT8.match(token)
-        if m != None: return ArgNumber(DATATYPE_INT8, int(m.group(1)))
+def _unpack_data(packed):
+    if type(packed) is tuple: return Command(packed[0], packed[1], [_unpack_arg(a) for a in packed[2]])
+    if type(packed) is str: return Label(packed)
+    return Hex(packed)
 
-        m = RE_INT16.match(token)
-        if m != None: return ArgNumber(DATATYPE_INT16, int(m.group(1)))
-            
-        m = RE_INT32.match(token)
-        if m != None: return ArgNumber(DATATYPE_INT32, int(m.group(1)))
+def _unpack_arg(packed):
+    if len(packed) == 2: return _UNPACK_CLASSES[packed[0]](packed[0], packed[1])
+    return ArgArray(_unpack_arg(packed[1]), _unpack_arg(packed[2]), packed[3], packed[4])
 
-        m = RE_FLOAT.match(token)
-        if m != None: return ArgNumber(DATATYPE_FLOAT, float.fromhex(m.group(1)))
+_UNPACK_CLASSES = dict([(t, ArgNumber) for t in DATATYPES_NUMERIC] + [(t, ArgLabel) for t in DATATYPES_LABEL] +
+                       [(t, ArgString) for t in DATATYPES_STRING] + [(t, ArgVariable) for t in DATATYPES_VARS_ALL])
 
-        m = RE_GLOBALOFF.match(token)
-        if m != None: return ArgLabel(DATATYPE_GLOBAL_LABEL, m.group(1))
+def _escape(string):
+    return string # TODO
 
-        m = RE_LOCALOFF.match(token)
-        if m != None: return ArgLabel(DATATYPE_LOCAL_LABEL, m.group(1))
+def _var_datatype_from_char(c, tup):
+    if c == '': return tup[0]
+    if c == 's': return tup[1]
+    if c == 'v': return tup[2]
+    return None
 
-        a = var_from_token(token)
-        if a != None: return a
+def _var_from_token(token):
+    m = _RE_GLOBALVAR.match(token)
+    if m != None:
+        datatype = _var_datatype_from_char(m.group(1), DATATYPES_GLOBALVARS)
+        return ArgVariable(datatype, int(m.group(2)))
 
-        m = RE_ARRAY.match(token)
-        if m != None:
-            base = var_from_token(m.group(1))
-            index = var_from_token(m.group(2))
-            size = int(m.group(3))
-            elem = elem_from_token(m.group(4))
-            return ArgArray(base, index, size, elem)
+    m = _RE_LOCALVAR.match(token)
+    if m != None:
+        datatype = _var_datatype_from_char(m.group(2), DATATYPES_LOCALVARS)
+        return ArgVariable(datatype, 4 * int(m.group(1)))
 
-        m = RE_TEXTLABEL.match(token)
-        if m != None: return ArgString(DATATYPE_TEXTLABEL8, escape(m.group(1)))
+    return None
 
-        m = RE_TEXTLABEL16.match(token)
-        if m != None: return ArgString(DATATYPE_TEXTLABEL16, escape(m.group(1)))        
+def _elem_from_token(token):
+    if token == 'i': return ARRAY_ELEM_TYPE_INT
+    if token == 'f': return ARRAY_ELEM_TYPE_FLOAT
+    if token == 's': return ARRAY_ELEM_TYPE_TEXTLABEL
+    if token == 'v': return ARRAY_ELEM_TYPE_TEXTLABEL16
+    return None
 
-        m = RE_BUFFER128.match(token)
-        if m != None: return ArgString(DATATYPE_BUFFER128, escape(m.group(1)))
+def _arg_from_token_counted(token):
+    arg = _arg_from_token(token)
+    instrument.count(_TOKEN_COUNTERS[arg.type])
+    return arg
 
-        m = RE_STRING.match(token)
-        if m != None: return ArgString(DATATYPE_STRING, escape(m.group(1)))
+_TOKEN_COUNTERS = {value: "read_ir2.token." + name[len("DATATYPE_"):]
+                   for name, value in globals().items() if name.startswith("DATATYPE_")}
 
-        print(token)
-        assert False
+def _arg_from_token(token):
+    m = _RE_INT8.match(token)
+    if m != None: return ArgNumber(DATATYPE_INT8, int(m.group(1)))
+
+    m = _RE_INT16.match(token)
+    if m != None: return ArgNumber(DATATYPE_INT16, int(m.group(1)))
+
+    m = _RE_INT32.match(token)
+    if m != None: return ArgNumber(DATATYPE_INT32, int(m.group(1)))
+
+    m = _RE_FLOAT.match(token)
+    if m != None: # fromhex loses the sign of nan
+        return ArgNumber(DATATYPE_FLOAT, math.copysign(float.fromhex(m.group(1)), -1.0 if token[0] == '-' else 1.0))
+
+    m = _RE_GLOBALOFF.match(token)
+    if m != None: return ArgLabel(DATATYPE_GLOBAL_LABEL, m.group(1))
+
+    m = _RE_LOCALOFF.match(token)
+    if m != None: return ArgLabel(DATATYPE_LOCAL_LABEL, m.group(1))
+
+    a = _var_from_token(token)
+    if a != None: return a
+
+    m = _RE_ARRAY.match(token)
+    if m != None:
+        base = _var_from_token(m.group(1))
+        index = _var_from_token(m.group(2))
+        size = int(m.group(3))
+        elem = _elem_from_token(m.group(4))
+        return ArgArray(base, index, size, elem)
+
+    m = _RE_TEXTLABEL.match(token)
+    if m != None: return ArgString(DATATYPE_TEXTLABEL8, _escape(m.group(1)))
+
+    m = _RE_TEXTLABEL16.match(token)
+    if m != None: return ArgString(DATATYPE_TEXTLABEL16, _escape(m.group(1)))
+
+    m = _RE_BUFFER128.match(token)
+    if m != None: return ArgString(DATATYPE_BUFFER128, _escape(m.group(1)))
+
+    m = _RE_STRING.match(token)
+    if m != None: return ArgString(DATATYPE_STRING, _escape(m.group(1)))
+
+    print(token)
+    assert False
+
+def write_ir2(bytecode, file, chunk_lines=1024):
+    """
+    Writes a Bytecode as IR2 text, a chunk of lines at a time.
+
+    Unlike str(bytecode), this never holds the text of the whole program, IR2_HEX
+    payloads are written in pieces straight from their bytes, and the models and
+    stream names are written first as #DEFINE_MODEL and #DEFINE_STREAM lines, so
+    read_ir2 gets them back. A filename ending in .gz, .bz2 or .xz is written compressed.
+    """
+    try:
+        write = file.write
+    except AttributeError:
+        with open_compressed(file, "w") as f:
+            return write_ir2(bytecode, f, chunk_lines)
+    with instrument.timer("write_ir2"):
+        _write_ir2(bytecode, write, chunk_lines)
+
+def _write_ir2(bytecode, write, chunk_lines, defines=True):
+    chunk = []
+    def flush():
+        write("".join(chunk))
+        del chunk[:]
+
+    def write_block(block):
+        for data in block:
+            if data.is_hex():
+                flush()
+                write("IR2_HEX")
+                for tokens in data.iter_tokens():
+                    write(tokens)
+                write("\n")
+                continue
+            chunk.append(str(data))
+            chunk.append("\n")
+            if len(chunk) >= 2 * chunk_lines:
+                flush()
+
+    if defines:
+        for name in bytecode.models:
+            chunk.append("#DEFINE_MODEL %s\n" % name)
+        for name in bytecode.stream_names:
+            chunk.append("#DEFINE_STREAM %s\n" % name)
+    write_block(bytecode.main_block)
+    for i, block in enumerate(bytecode.mission_blocks):
+        chunk.append("#MISSION_BLOCK_START %d\n" % i)
+        write_block(block)
+        chunk.append("#MISSION_BLOCK_END\n")
+    for i, block in enumerate(bytecode.streamed_blocks):
+        chunk.append("#STREAMED_BLOCK_START %d\n" % i)
+        write_block(block)
+        chunk.append("#STREAMED_BLOCK_END\n")
+    flush()
+
+def read_scm(file, config, game, img=None): # game is one of "gta3", "gtavc" or "gtasa"
+    """
+    Decodes a compiled main.scm straight into a Bytecode, without the IR2 text round-trip.
+
+    The file is memory mapped and each block is linearly swept using the command IDs and
+    arguments of the given config. Label arguments get a label inserted at their target.
+    An instruction that cannot be decoded (e.g. an unknown command) stops the sweep of its
+    block, whose remaining bytes become a Hex payload viewing the mapped file (no copy),
+    split where labels target it. Labels targeting no instruction (e.g. the middle of one)
+    cannot be placed and are listed in unplaced_labels instead, as verify_program reports.
+
+    Streamed scripts are not part of main.scm. For San Andreas, img may be the script.img
+    archive (a path or an ImgArchive) they are read from; each streamed block is then
+    decoded only when first accessed. Without it the result has no streamed blocks.
+    """
+    try:
+        file.fileno()
+    except AttributeError:
+        with open(file, "rb") as f:
+            return read_scm(f, config, game, img)
+    with instrument.timer("read_scm"):
+        return _read_scm(file, config, game, img)
+
+def _read_scm(file, config, game, img):
+    assert game in _SCM_NUM_SEGMENTS
+    buf, slice_view = map_file(file)
+
+    # Each header segment starts with a GOTO to the next one, the last jumps to the code.
+    segments = []
+    pos = 0
+    for i in range(_SCM_NUM_SEGMENTS[game]):
+        opcode, datatype, target = _SCM_GOTO.unpack_from(buf, pos)
+        assert opcode == 0x0002 and datatype == _SCM_DATATYPE_INT32
+        segments.append(pos + _SCM_GOTO.size + 1) # skips the segment id byte
+        pos = target
+    code_start = pos
+
+    num_models, = _SCM_UINT32.unpack_from(buf, segments[1])
+    models = [_scm_string(buf, segments[1] + 4 + 24*i, 24) for i in range(1, num_models)]
+
+    pos = segments[2]
+    main_size, largest_mission, num_missions = struct.unpack_from("<IIH", buf, pos)
+    pos += 12 + (4 if game == "gtasa" else 0)
+    mission_offsets = list(struct.unpack_from("<%dI" % num_missions, buf, pos))
 
-    main_block = []
+    stream_names = []
+    stream_sizes = []
+    if game == "gtasa":
+        num_streams, = _SCM_UINT32.unpack_from(buf, segments[3] + 4)
+        for i in range(num_streams):
+            pos = segments[3] + 8 + 28*i
+            stream_names.append(_scm_string(buf, pos, 20))
+            stream_sizes.append(_SCM_UINT32.unpack_from(buf, pos + 24)[0])
+
+    commands = {cmd.id: cmd for cmd in config.commands if cmd.id is not None}
+    decoder = _ScmDecoder(buf, slice_view, commands, game)
+
+    main_block = decoder.decode_block(BYTECODE_OFFSET_MAIN, 0, code_start, main_size, 0)
     mission_blocks = []
+    for i, start in enumerate(mission_offsets):
+        end = mission_offsets[i+1] if i + 1 < num_missions else len(buf)
+        mission_blocks.append(decoder.decode_block(BYTECODE_OFFSET_MISSION, i, start, end, start))
+
     streamed_blocks = []
-    models = []
-    stream_names = []
+    if img is not None and game == "gtasa":
+        if not isinstance(img, ImgArchive):
+            img = ImgArchive(img)
+        # Streamed scripts are padded to a whole sector in the archive, so the size in
+        # main.scm bounds the sweep. Their local labels are relative to the entry start.
+        img_decoder = _ScmDecoder(img.buf, img.slice_view, commands, game)
+        def load_stream(i):
+            start, end = img.get_range(stream_names[i] + ".scm")
+            end = min(end, start + stream_sizes[i])
+            decoded = img_decoder.decode_block(BYTECODE_OFFSET_STREAMED, i, start, end, start)
+            block = img_decoder.place_labels(decoded)
+            # targets in the main block, already placed, are there only if main.scm refers to them too
+            for pos, name in img_decoder.targets.get((BYTECODE_OFFSET_MAIN, 0), {}).iteritems():
+                if name not in bytecode.label_table:
+                    img_decoder.unplaced[name] = pos
+            bytecode.unplaced_labels.update(img_decoder.unplaced)
+            return block
+        streamed_blocks = LazyBlocks(len(stream_names), load_stream)
+
+    bytecode = Bytecode(decoder.place_labels(main_block), map(decoder.place_labels, mission_blocks),
+                        streamed_blocks, models, stream_names)
+    bytecode.unplaced_labels.update(decoder.unplaced)
+    return bytecode
+
+_SCM_NUM_SEGMENTS = {"gta3": 3, "gtavc": 3, "gtasa": 6}
+
+_SCM_DATATYPE_END                  = 0
+_SCM_DATATYPE_INT32                = 1
+_SCM_DATATYPE_GLOBALVAR            = 2
+_SCM_DATATYPE_LOCALVAR             = 3
+_SCM_DATATYPE_INT8                 = 4
+_SCM_DATATYPE_INT16                = 5
+_SCM_DATATYPE_FLOAT                = 6
+_SCM_DATATYPE_GLOBALVAR_ARRAY      = 7     # the following are San Andreas only
+_SCM_DATATYPE_LOCALVAR_ARRAY       = 8
+_SCM_DATATYPE_TEXTLABEL            = 9
+_SCM_DATATYPE_GLOBALVAR_TEXTLABEL  = 10
+_SCM_DATATYPE_LOCALVAR_TEXTLABEL   = 11
+_SCM_DATATYPE_GLOBALARR_TEXTLABEL  = 12
+_SCM_DATATYPE_LOCALARR_TEXTLABEL   = 13
+_SCM_DATATYPE_STRING               = 14
+_SCM_DATATYPE_TEXTLABEL16          = 15
+_SCM_DATATYPE_GLOBALVAR_TEXTLABEL16 = 16
+_SCM_DATATYPE_LOCALVAR_TEXTLABEL16 = 17
+_SCM_DATATYPE_GLOBALARR_TEXTLABEL16 = 18
+_SCM_DATATYPE_LOCALARR_TEXTLABEL16 = 19
+
+_SCM_VARS = {
+#   Datatype                              Vartype in DATATYPES_GLOBALVARS/LOCALVARS  Is Local
+    _SCM_DATATYPE_GLOBALVAR:              (DATATYPE_GLOBALVAR_NUMBER,       False),
+    _SCM_DATATYPE_LOCALVAR:               (DATATYPE_LOCALVAR_NUMBER,        True),
+    _SCM_DATATYPE_GLOBALVAR_TEXTLABEL:    (DATATYPE_GLOBALVAR_TEXTLABEL,    False),
+    _SCM_DATATYPE_LOCALVAR_TEXTLABEL:     (DATATYPE_LOCALVAR_TEXTLABEL,     True),
+    _SCM_DATATYPE_GLOBALVAR_TEXTLABEL16:  (DATATYPE_GLOBALVAR_TEXTLABEL16,  False),
+    _SCM_DATATYPE_LOCALVAR_TEXTLABEL16:   (DATATYPE_LOCALVAR_TEXTLABEL16,   True),
+}
 
-    current_block = main_block
+_SCM_ARRAYS = {
+    _SCM_DATATYPE_GLOBALVAR_ARRAY:        (DATATYPE_GLOBALVAR_NUMBER,       False),
+    _SCM_DATATYPE_LOCALVAR_ARRAY:         (DATATYPE_LOCALVAR_NUMBER,        True),
+    _SCM_DATATYPE_GLOBALARR_TEXTLABEL:    (DATATYPE_GLOBALVAR_TEXTLABEL,    False),
+    _SCM_DATATYPE_LOCALARR_TEXTLABEL:     (DATATYPE_LOCALVAR_TEXTLABEL,     True),
+    _SCM_DATATYPE_GLOBALARR_TEXTLABEL16:  (DATATYPE_GLOBALVAR_TEXTLABEL16,  False),
+    _SCM_DATATYPE_LOCALARR_TEXTLABEL16:   (DATATYPE_LOCALVAR_TEXTLABEL16,   True),
+}
 
-    for line in lines:
-        line = line.rstrip('\r\n')
-        assert len(line) > 0 and not line[0].isspace() and not line[-1].isspace()
-        if line[0] == '#':
-            tokens = line.split()
-            if tokens[0] == "#MISSION_BLOCK_START":
-                assert len(mission_blocks) == int(tokens[1])
-                current_block = []
-            elif tokens[0] == "#STREAMED_BLOCK_START":
-                assert len(streamed_blocks) == int(tokens[1])
-                current_block = []
-            elif  tokens[0] == "#MISSION_BLOCK_END":
-                mission_blocks.append(current_block)
-                current_block = None
-            elif tokens[0] == "#STREAMED_BLOCK_END":
-                streamed_blocks.append(current_block)
-                current_block = None
-            elif tokens[0] == "#DEFINE_MODEL":
-                models.append(tokens[1])
-            elif tokens[0] == "#DEFINE_STREAM":
-                stream_names.append(tokens[1])
-        elif line[-1] == ':':
-            label = Label(line[:-1])
-            current_block.append(label)
+_SCM_GOTO   = struct.Struct("<HBi")
+_SCM_UINT8  = struct.Struct("<B")
+_SCM_UINT16 = struct.Struct("<H")
+_SCM_UINT32 = struct.Struct("<I")
+_SCM_INT8   = struct.Struct("<b")
+_SCM_INT16  = struct.Struct("<h")
+_SCM_INT32  = struct.Struct("<i")
+_SCM_FLOAT  = struct.Struct("<f")
+_SCM_ARRAY  = struct.Struct("<HHBB")
+
+class _ScmDecoder:
+    def __init__(self, buf, slice_view, commands, game):
+        self.buf = buf
+        self.slice_view = slice_view
+        self.commands = commands
+        self.game = game
+        self.targets = {}     # (offset type, block id) -> { position: label name }
+        self.unplaced = {}    # label name -> position, of the targets no instruction or hex byte starts at
+
+    def decode_block(self, blocktype, block_id, start, end, base): # -> [(position, Data), ...]
+        # base is the position local (negative) label offsets are relative to
+        self.blocktype = blocktype
+        self.block_id = block_id
+        self.base = base
+        result = []
+        pos = start
+        while pos < end:
+            try:
+                data, next_pos = self.decode_command(pos)
+            except (KeyError, IndexError, ValueError, struct.error):
+                next_pos = None
+            if next_pos is None or next_pos > end:
+                result.append((pos, Hex(self.slice_view(pos, end))))
+                break
+            result.append((pos, data))
+            pos = next_pos
+        return (blocktype, block_id, result)
+
+    def place_labels(self, decoded): # -> [Data, ...]
+        blocktype, block_id, result = decoded
+        targets = self.targets.get((blocktype, block_id), {})
+        placed = set()
+        block = []
+        for pos, data in result:
+            if data.is_hex():
+                # the undecoded tail is split at the targets inside it, each piece viewing the same bytes
+                splits = sorted(p for p in targets if pos < p < pos + len(data.bytes))
+                for start, end in zip([pos] + splits, splits + [pos + len(data.bytes)]):
+                    if start in targets:
+                        block.append(Label(targets[start]))
+                        placed.add(start)
+                    block.append(data if not splits else Hex(data.bytes[start-pos:end-pos]))
+                continue
+            name = targets.get(pos)
+            if name is not None:
+                block.append(Label(name))
+                placed.add(pos)
+            block.append(data)
+        for pos, name in targets.iteritems():
+            if pos not in placed:
+                self.unplaced[name] = pos
+        return block
+
+    def decode_command(self, pos): # -> (Command, position after it)
+        opcode, = _SCM_UINT16.unpack_from(self.buf, pos)
+        cmdinfo = self.commands[opcode & 0x7FFF]
+        pos += 2
+        args = []
+        while True:
+            arginfo = cmdinfo.arg_descriptor(len(args))
+            if arginfo is None:
+                break
+            if arginfo.optional and ord(self.buf[pos]) == _SCM_DATATYPE_END:
+                pos += 1
+                break
+            arg, pos = self.decode_arg(pos, arginfo)
+            args.append(arg)
+        return Command(bool(opcode & 0x8000), cmdinfo.name, args), pos
+
+    def decode_arg(self, pos, arginfo): # -> (Arg, position after it)
+        buf = self.buf
+        datatype = ord(buf[pos])
+        if arginfo.type == "BUFFER128":
+            return ArgString(DATATYPE_BUFFER128, _scm_string(buf, pos, 128)), pos + 128
+        if datatype == _SCM_DATATYPE_INT32:
+            value, = _SCM_INT32.unpack_from(buf, pos + 1)
+            if arginfo.type == "LABEL":
+                return self.label_arg(value), pos + 5
+            return ArgNumber(DATATYPE_INT32, value), pos + 5
+        if datatype == _SCM_DATATYPE_INT8:
+            return ArgNumber(DATATYPE_INT8, _SCM_INT8.unpack_from(buf, pos + 1)[0]), pos + 2
+        if datatype == _SCM_DATATYPE_INT16:
+            return ArgNumber(DATATYPE_INT16, _SCM_INT16.unpack_from(buf, pos + 1)[0]), pos + 3
+        if datatype == _SCM_DATATYPE_FLOAT:
+            if self.game == "gta3": # fixed point
+                return ArgNumber(DATATYPE_FLOAT, _SCM_INT16.unpack_from(buf, pos + 1)[0] / 16.0), pos + 3
+            return ArgNumber(DATATYPE_FLOAT, _SCM_FLOAT.unpack_from(buf, pos + 1)[0]), pos + 5
+        if datatype in (_SCM_DATATYPE_GLOBALVAR, _SCM_DATATYPE_LOCALVAR) or\
+           (self.game == "gtasa" and datatype in _SCM_VARS):
+            vartype, is_local = _SCM_VARS[datatype]
+            offset, = _SCM_UINT16.unpack_from(buf, pos + 1)
+            return ArgVariable(vartype, 4 * offset if is_local else offset), pos + 3
+        if self.game == "gtasa":
+            if datatype in _SCM_ARRAYS:
+                vartype, is_local = _SCM_ARRAYS[datatype]
+                offset, index, size, flags = _SCM_ARRAY.unpack_from(buf, pos + 1)
+                base = ArgVariable(vartype, 4 * offset if is_local else offset)
+                if flags & 0x80:
+                    index = ArgVariable(DATATYPE_GLOBALVAR_NUMBER, index)
+                else:
+                    index = ArgVariable(DATATYPE_LOCALVAR_NUMBER, 4 * index)
+                return ArgArray(base, index, size, ARRAY_ELEM_TYPES[flags & 0x7F]), pos + 7
+            if datatype == _SCM_DATATYPE_TEXTLABEL:
+                return ArgString(DATATYPE_TEXTLABEL8, _scm_string(buf, pos + 1, 8)), pos + 9
+            if datatype == _SCM_DATATYPE_TEXTLABEL16:
+                return ArgString(DATATYPE_TEXTLABEL16, _scm_string(buf, pos + 1, 16)), pos + 17
+            if datatype == _SCM_DATATYPE_STRING:
+                length = ord(buf[pos + 1])
+                return ArgString(DATATYPE_STRING, _scm_string(buf, pos + 2, length)), pos + 2 + length
+        if datatype >= 0x20: # text labels may be stored inline, without a datatype
+            return ArgString(DATATYPE_TEXTLABEL8, _scm_string(buf, pos, 8)), pos + 8
+        raise ValueError("unknown datatype %d at %d" % (datatype, pos))
+
+    def label_arg(self, value): # -> ArgLabel, registering its target
+        if value >= 0:
+            key = (BYTECODE_OFFSET_MAIN, 0)
+            name = "MAIN_%d" % value
+            position = value
+            labtype = DATATYPE_GLOBAL_LABEL
         else:
-            tokens = [p for p in re.split("( |b?\\\".*?\\\"|v?'.*?')", line) if p.strip()]
-            not_flag = (tokens[0] == "NOT")
-            cmdname  = tokens[not_flag].upper()
-            cmdargs = [arg_from_token(tokens[i]) for i in range(1 + not_flag, len(tokens))]
-            if cmdname == "IR2_HEX":
-                bytedata = bytearray([(i + 256 if i < 0 else i) for i in map(lambda a: a.value, cmdargs)])
-                current_block.append(Hex(bytedata))
-            else:
-                current_block.append(Command(not_flag, cmdname, cmdargs))
-
-    return Bytecode(main_block, mission_blocks, streamed_blocks, models, stream_names)
-
+            key = (self.blocktype, self.block_id)
+            name = "%s_%d_%d" % (("MAIN", "MISSION", "STREAM")[self.blocktype], self.block_id, -value)
+            position = self.base - value
+            labtype = DATATYPE_LOCAL_LABEL
+        self.targets.setdefault(key, {})[position] = name
+        return ArgLabel(labtype, name)
+
+_INF = float("inf")
+
+_HEX_TOKENS = [" %di8" % (i - 256 if i > 127 else i) for i in range(256)]
+
+def _hexfloat(value): # -> C's "%.6a" of value, e.g. "0x1.800000p+1"
+    if value != value or value in (_INF, -_INF):
+        return ("-" if math.copysign(1.0, value) < 0 else "") + ("nan" if value != value else "inf")
+    if value == 0.0:
+        return "-0x0.000000p+0" if str(value)[0] == '-' else "0x0.000000p+0"
+    sign, value = ("-", -value) if value < 0 else ("", value)
+    mantissa, exponent = value.hex()[2:].split('p')
+    lead, _, frac = mantissa.partition('.')
+    frac = int(frac.ljust(13, '0'), 16)
+    frac = (frac + (1 << 27) + ((frac >> 28) & 1) - 1) >> 28 # rounds 52 bits to 24, half to even
+    exponent = int(exponent)
+    if frac >> 24:
+        frac, exponent = 0, exponent + 1
+    return "%s0x%s.%06xp%+d" % (sign, lead, frac, exponent)
+
+def _scm_string(buf, pos, size):
+    return buf[pos:pos+size].split('\0', 1)[0]
 
 def _char_from_vartype(vartype):
     assert vartype in DATATYPES_GLOBALVARS or vartype in DATATYPES_LOCALVARS
@@ -644,23 +1134,75 @@ def _discover_vars(bytecode_iter, is_local, config=None, more_info=None): # -> s
     commands = {cmd.name: cmd for cmd in config.commands}
     cmds_set = set(config.get_alternator("SET"))
 
+    vardict = _seed_vars(more_info)
+    _collect_vars(vardict, bytecode_iter, is_local, commands)
+
+    # run again for entity/constant assignment discovery
+    for off, data in filter(lambda (o, d): d.is_command(), bytecode_iter):
+        if data.name in cmds_set and data.args[0].is_var() and data.args[1].is_var():
+            lhs_var = vardict[data.args[0].get_offset()]
+            rhs_var = vardict[data.args[1].get_offset()]
+            lhs_var.enums.update(rhs_var.enums)
+            lhs_var.entities.update(rhs_var.entities)
+            rhs_var.enums.update(lhs_var.enums)
+            rhs_var.entities.update(lhs_var.entities)
+
+    return _coalesce_vars(vardict)
+
+def _discover_vars_sharded(bytecode, is_local, config=None, more_info=None, workers=None): # -> sorted [VarInfo, ...]
+    # Map: each block is swept on its own in a worker, producing a partial vardict.
+    # Reduce: the partials are merged in program order with the same rules as _collect_vars,
+    # thus the result is the same as _discover_vars(iter(bytecode), ...).
+    commands = {cmd.name: cmd for cmd in config.commands}
+    blocks  = [(BYTECODE_OFFSET_MAIN, 0)]
+    blocks += [(BYTECODE_OFFSET_MISSION, i) for i in range(len(bytecode.mission_blocks))]
+    blocks += [(BYTECODE_OFFSET_STREAMED, i) for i in range(len(bytecode.streamed_blocks))]
+
+    partials = parallel_map(_discover_block_vars, blocks, shared=(bytecode, is_local, commands), workers=workers)
+
+    vardict = _seed_vars(more_info)
+    for partial in partials:
+        for offset_start, part in partial.iteritems():
+            var = vardict.get(offset_start)
+            if var is None:
+                vardict[offset_start] = part
+            else:
+                _update_var(var, part.type, part.size, part.end_offset)
+                var.enums.update(part.enums)
+                var.entities.update(part.entities)
+
+    # The SET propagation pass of _discover_vars runs over its already consumed iterator,
+    # so there is nothing from it to be replayed here.
+
+    return _coalesce_vars(vardict)
+
+def _discover_block_vars(shared, block): # -> { offset: VarInfo, ... }
+    bytecode, is_local, commands = shared
+    start = Offset(block[0], block[1], 0)
+    vardict = dict()
+    _collect_vars(vardict, Scope(start, None).iter_data(bytecode), is_local, commands)
+    return vardict
+
+def _seed_vars(more_info): # -> { offset: VarInfo, ... }
     vardict = dict()
+    if more_info != None:
+        for v in more_info:
+            vardict[v.start_offset] = v
+    return vardict
 
+def _collect_vars(vardict, bytecode_iter, is_local, commands):
     if is_local:
         check_var_kind = lambda x: x.is_local()
     else:
         check_var_kind = lambda x: x.is_global()
 
-    if more_info != None:
-        for v in more_info:
-            vardict[v.start_offset] = v
-
     for off, data in filter(lambda (o, d): d.is_command(), bytecode_iter):
         cmdinfo = commands.get(data.name, None) if commands else None
+        arginfos = cmdinfo.arg_descriptors(len(data.args)) if cmdinfo else None
         for i, arg in enumerate(data.args):
             if arg.is_var() and check_var_kind(arg):
 
-                arginfo = cmdinfo.get_arg(i) if cmdinfo else None
+                arginfo = arginfos[i] if arginfos is not None else None
 
                 if arg.is_array():
                     offset_start = arg.base.offset
@@ -692,34 +1234,27 @@ def _discover_vars(bytecode_iter, is_local, config=None, more_info=None): # -> s
                 
                 var = vardict.get(offset_start)
                 if var != None:
-                    assert var.type == vartype or var.type == None or vartype == None
-                    assert var.size == array_size or var.size == None or array_size == None 
-                    if vartype != None:
-                        var.type = vartype
-                    if array_size != None:
-                        var.size = array_size
-                        var.end_offset = offset_end
+                    _update_var(var, vartype, array_size, offset_end)
                 else:
                     vardict[offset_start] = VarInfo(offset_start, vartype, array_size)
                     var = vardict[offset_start]
 
                 if arginfo != None:
-                    if len(arginfo.enums) > 0:
-                        assert len(arginfo.enums) == 1
-                        var.enums.add(arginfo.enums[0])
+                    if arginfo.enum:
+                        var.enums.add(arginfo.enum)
                     if arginfo.entity:
                         var.entities.add(arginfo.entity)
 
-    # run again for entity/constant assignment discovery
-    for off, data in filter(lambda (o, d): d.is_command(), bytecode_iter):
-        if data.name in cmds_set and data.args[0].is_var() and data.args[1].is_var():
-            lhs_var = vardict[data.args[0].get_offset()]
-            rhs_var = vardict[data.args[1].get_offset()]
-            lhs_var.enums.update(rhs_var.enums)
-            lhs_var.entities.update(rhs_var.entities)
-            rhs_var.enums.update(lhs_var.enums)
-            rhs_var.entities.update(lhs_var.entities)
+def _update_var(var, vartype, array_size, offset_end):
+    assert var.type == vartype or var.type == None or vartype == None
+    assert var.size == array_size or var.size == None or array_size == None 
+    if vartype != None:
+        var.type = vartype
+    if array_size != None:
+        var.size = array_size
+        var.end_offset = offset_end
 
+def _coalesce_vars(vardict): # -> sorted [VarInfo, ...]
     result = list()
 
     varlist = sorted(vardict.itervalues(), key=lambda k: k.start_offset)
@@ -736,5 +1271,10 @@ def _discover_vars(bytecode_iter, is_local, config=None, more_info=None): # -> s
 
 if __name__ == "__main__":
     import sys
-    ir2 = read_ir2(sys.argv[1])
-    sys.stdout.write(str(ir2))
+    if len(sys.argv) > 3: # <main.scm> <config> <game> [script.img]
+        from config import read_config
+        ir2 = read_scm(sys.argv[1], read_config(sys.argv[2]), sys.argv[3], *sys.argv[4:5])
+        write_ir2(ir2, sys.stdout)
+    else:
+        ir2 = read_ir2(sys.argv[1])
+        sys.stdout.write(str(ir2))
@@ -0,0 +1,139 @@
+# -*- Python -*-
+import cPickle as pickle
+from contextlib import contextmanager
+import errno
+import hashlib
+import os
+import tempfile
+
+import instrument
+
+__all__ = ["AnalysisCache", "cached_analysis", "file_digest", "config_digest", "vars_digest"]
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gta3sc")
+
+class AnalysisCache:
+    """
+    Persistent cache of the Bytecode.discover_* results of an IR2 file.
+
+    Has the same discover_* methods as Bytecode, answering from a file stored in
+    directory (by default ~/.cache/gta3sc) under the IR2 content hash, computing what
+    is missing. Results depending on a config or a more_info seed are keyed by their
+    content too.
+
+    The computed results are only stored on close (or leaving a with statement), by
+    writing the file anew and renaming it over the old one, so processes caching the
+    same IR2 contents at once never see a partially written file; the last one
+    closing merges what is on disk by then with its own results.
+    """
+
+    def __init__(self, bytecode, ir2file, directory=None):
+        self.bytecode = bytecode
+        self.directory = directory or DEFAULT_CACHE_DIR
+        try:
+            os.makedirs(self.directory)
+        except OSError as e: # created by another process meanwhile
+            if e.errno != errno.EEXIST or not os.path.isdir(self.directory):
+                raise
+        self.path = os.path.join(self.directory, "%s-v%d" % (file_digest(ir2file), CACHE_VERSION))
+        self.results = _read_results(self.path)
+        self.computed = {} # key -> result not stored yet
+        self.config_digests = {} # id(config) -> (config, digest)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if not self.computed:
+            return
+        results = _read_results(self.path)
+        results.update(self.computed)
+        fd, temp = tempfile.mkstemp(prefix=os.path.basename(self.path) + ".", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(results, f, 2)
+            os.rename(temp, self.path)
+        except:
+            os.remove(temp)
+            raise
+        self.computed = {}
+
+    def discover_scopes(self):
+        return self._get("scopes", self.bytecode.discover_scopes)
+
+    def discover_global_vars(self, config=None, more_info=None, workers=None):
+        key = "global_vars:%s:%s" % (self._config_digest(config), vars_digest(more_info))
+        return self._get(key, lambda: self.bytecode.discover_global_vars(config=config, more_info=more_info, workers=workers))
+
+    def discover_local_vars(self, scope, config=None, more_info=None):
+        key = "local_vars:%r:%s:%s" % (tuple(scope), self._config_digest(config), vars_digest(more_info))
+        return self._get(key, lambda: self.bytecode.discover_local_vars(scope, config=config, more_info=more_info))
+
+    def discover_global_arrays(self):
+        return self._get("global_arrays", self.bytecode.discover_global_arrays)
+
+    def discover_local_arrays(self, scope):
+        return self._get("local_arrays:%r" % (tuple(scope),), lambda: self.bytecode.discover_local_arrays(scope))
+
+    def _get(self, key, compute):
+        try:
+            result = self.results[key]
+            instrument.count("cache.hit")
+            return result
+        except KeyError:
+            instrument.count("cache.miss")
+            result = self.results[key] = self.computed[key] = compute()
+            return result
+
+    def _config_digest(self, config):
+        if config is None:
+            return "none"
+        cached = self.config_digests.get(id(config))
+        if cached is None or cached[0] is not config:
+            cached = self.config_digests[id(config)] = (config, config_digest(config))
+        return cached[1]
+
+
+@contextmanager
+def cached_analysis(bytecode, ir2file, cache): # -> context giving an object with the discover_* methods of Bytecode
+    """Wraps bytecode in an AnalysisCache, unless cache (a directory, or True for the default one) is None."""
+    if cache is None or cache is False:
+        yield bytecode
+    else:
+        with AnalysisCache(bytecode, ir2file, None if cache is True else cache) as analysis:
+            yield analysis
+
+def _read_results(path): # -> {key: result} stored in path, empty if missing or unreadable
+    try:
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+        return {}
+
+def file_digest(filename): # -> hex SHA-1 of the file contents
+    h = hashlib.sha1()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), ""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def config_digest(config): # -> hex SHA-1 of what the analyses read from a Config or FlatConfig
+    h = hashlib.sha1()
+    for cmd in config.commands:
+        # the ArgDescriptors, as FlatCommands have no Arguments
+        h.update(repr((cmd.name, cmd.id, [d.__getstate__() for d in cmd.arg_table])))
+    for alt in config.alternators:
+        h.update(repr((alt.name, list(alt.alters))))
+    return h.hexdigest()
+
+def vars_digest(varlist): # -> hex SHA-1 of a more_info seed ([VarInfo, ...] or None)
+    if varlist is None:
+        return "none"
+    h = hashlib.sha1()
+    for v in varlist:
+        h.update(repr((v.start_offset, v.type, v.size, sorted(v.enums), sorted(v.entities))))
+    return h.hexdigest()
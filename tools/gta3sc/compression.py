@@ -0,0 +1,49 @@
+# -*- Python -*-
+import bz2
+import gzip
+import io
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None # .xz support is optional on Python 2
+
+__all__ = ["open_compressed", "strip_compression_ext"]
+
+_MAGICS = (("\x1f\x8b", ".gz"), ("BZh", ".bz2"), ("\xfd7zXZ\x00", ".xz"))
+_EXTENSIONS = (".gz", ".bz2", ".xz")
+
+def open_compressed(filename, mode="r"): # -> file object
+    """
+    Opens a file that may be gzip, bzip2 or xz compressed, decompressing it as it is read.
+
+    When reading, the format is detected from the first bytes of the file; when writing,
+    from its extension (e.g. main.ir2.gz). Other files are opened as usual.
+    """
+    if 'r' in mode:
+        with open(filename, "rb") as f:
+            head = f.read(6)
+        ext = next((ext for magic, ext in _MAGICS if head.startswith(magic)), None)
+    else:
+        ext = next((ext for ext in _EXTENSIONS if filename.endswith(ext)), None)
+
+    binmode = mode.replace('b', '').replace('t', '') + 'b'
+    if ext == ".gz":
+        # GzipFile reads lines in Python, the buffered reader does it much faster
+        f = gzip.GzipFile(filename, binmode)
+        return io.BufferedReader(f) if 'r' in mode else f
+    if ext == ".bz2":
+        return bz2.BZ2File(filename, binmode)
+    if ext == ".xz":
+        if lzma is None:
+            raise IOError("reading or writing %s requires the lzma module (backports.lzma on Python 2)" % filename)
+        return lzma.LZMAFile(filename, binmode)
+    return open(filename, mode)
+
+def strip_compression_ext(filename): # -> filename without a .gz/.bz2/.xz extension
+    for ext in _EXTENSIONS:
+        if filename.endswith(ext):
+            return filename[:-len(ext)]
+    return filename
@@ -1,9 +1,23 @@
 # -*- Python -*-
+from bisect import bisect_right
 from lxml import etree
 import os
 import re
 
-__all__ = ["Alternator", "Enum", "Command", "Argument", "Config", "read_config"]
+from argindex import ArgIndex
+from compression import open_compressed, strip_compression_ext
+import instrument
+
+__all__ = ["Alternator", "Enum", "Command", "Argument", "ArgDescriptor", "Config", "ConfigOverlay", "read_config",
+           "intern_argument", "intern_signature", "clear_interned"]
+
+# Shared by every config loaded with intern=True, so identical arguments and signatures
+# of different games are the same objects. Kept until clear_interned is called.
+_interned_args = {}
+_interned_signatures = {}
+_interned_behaviours = {}
+
+_ARG_TABLE_ATTRS = frozenset(["arg_table", "arg_tail", "arg_tables", "behaviour"])
 
 class Alternator:
     def __init__(self):
@@ -27,10 +41,76 @@ class Alternator:
         return node
 
 class Enum:
+    # Runs of consecutive values shorter than this are kept in the sparse dict
+    MIN_RUN = 8
+    # An enum whose values fill at least this part of their span is kept as a single run
+    # over the whole span, holes being None, which get_name indexes without searching
+    MIN_FILL = 0.5
+
     def __init__(self):
         self.name = ""
         self.is_global = False  # global is a python keyword
-        self.constants = {}
+        self.constants = {}     # name -> value, update_values() must be called after changing it
+        self.run_starts = None  # first value of each dense run, sorted, None until first needed
+        self.run_names = []     # names of the values of each dense run, None where there is none
+        self.sparse_names = {}  # value -> name of the values in no dense run
+        self.dense_low = 0      # first value of the single run over the whole span, if any
+        self.dense_names = ()   # names of that run, empty if the enum has other runs
+
+    def get_name(self, value, default=None): # -> name of a value, the lowest name if many share it
+        if self.run_starts is None:
+            self.update_values()
+        names = self.dense_names
+        k = value - self.dense_low
+        if 0 <= k < len(names):
+            name = names[k]
+            return name if name is not None else default
+        starts = self.run_starts
+        if len(starts) > 0 and value >= starts[0]:
+            i = bisect_right(starts, value) - 1
+            k = value - starts[i]
+            names = self.run_names[i]
+            if k < len(names):
+                return names[k]
+        return self.sparse_names.get(value, default)
+
+    def has_value(self, value):
+        return self.get_name(value) is not None
+
+    def max_value(self): # -> highest value or None when empty
+        return max(self.constants.itervalues()) if len(self.constants) > 0 else None
+
+    def update_values(self):
+        # must be called again after changing self.constants
+        by_value = {}
+        for name, value in self.constants.iteritems():
+            other = by_value.get(value)
+            if other is None or name < other:
+                by_value[value] = name
+        self.run_starts, self.run_names, self.sparse_names = [], [], {}
+        self.dense_low, self.dense_names = 0, ()
+        if len(by_value) > 0:
+            low = min(by_value)
+            span = max(by_value) - low + 1
+            if len(by_value) >= Enum.MIN_FILL * span:
+                names = [None] * span
+                for value, name in by_value.iteritems():
+                    names[value - low] = name
+                self.run_starts.append(low)
+                self.run_names.append(names)
+                self.dense_low, self.dense_names = low, names
+                return
+        values = sorted(by_value)
+        start = 0
+        for i in xrange(1, len(values) + 1):
+            if i == len(values) or values[i] != values[i-1] + 1:
+                if i - start >= Enum.MIN_RUN:
+                    self.run_starts.append(values[start])
+                    self.run_names.append([by_value[v] for v in values[start:i]])
+                else:
+                    for v in values[start:i]:
+                        self.sparse_names[v] = by_value[v]
+                start = i
 
     @staticmethod
     def from_node(node):
@@ -67,14 +147,28 @@ class Command:
         self.internal = False
         self.extension = False
         self.args = []
+        # arg_table, arg_tail, arg_tables and behaviour are built from args on first use
+
+    def __getattr__(self, name):
+        # only called for missing attributes, thus for the arg tables before they are built
+        if name in _ARG_TABLE_ATTRS:
+            self.update_arg_table()
+            return self.__dict__[name]
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # the arg tables are rebuilt by the loading process, interning the behaviour there
+        return {k: v for k, v in self.__dict__.iteritems() if k not in _ARG_TABLE_ATTRS}
 
     def __eq__(self, other):
         return self.name == other.name and\
                self.id == other.id and\
                self.supported == other.supported and\
-               self.args == other.args
+               (self.args is other.args or tuple(self.args) == tuple(other.args))
 
     def same_behaviour(self, other):
+        if self.behaviour is not None and other.behaviour is not None:
+            return self.id == other.id and self.behaviour is other.behaviour
         if self.id == other.id and len(self.args) == len(other.args):
             return all(a.same_behaviour(b) for a,b in zip(self.args, other.args))
         return False
@@ -90,6 +184,32 @@ class Command:
         else:
             return None
 
+    def arg_descriptor(self, i): # -> ArgDescriptor or None, same indexing rules as get_arg
+        try:
+            return self.arg_table[i]
+        except IndexError:
+            return self.arg_tail
+
+    def arg_descriptors(self, count): # -> (ArgDescriptor or None, ...) for an instruction with count args
+        table = self.arg_tables.get(count)
+        if table is None:
+            assert len(self.arg_table) == len(self.args), "stale arg table of %s, update_arg_table was not called" % self.name
+            table = tuple(self.arg_descriptor(i) for i in range(count))
+            self.arg_tables[count] = table
+        return table
+
+    def update_arg_table(self):
+        # must be called again after changing self.args or any of its Arguments
+        self.arg_table = tuple(ArgDescriptor(a) for a in self.args)
+        self.arg_tail = self.arg_table[-1] if self.has_optional() else None
+        self.arg_tables = {len(self.arg_table): self.arg_table}
+        behaviour = tuple(a.behaviour_key() for a in self.args)
+        self.behaviour = _interned_behaviours.setdefault(behaviour, behaviour)
+
+    def intern(self):
+        self.args = intern_signature(self.args)
+        self.update_arg_table()
+
     @staticmethod
     def from_node(node):
         init = Command()
@@ -106,6 +226,7 @@ class Command:
         if node_args is not None:
             for a in node_args.iter("Arg"):
                 init.args.append(Argument.from_node(a))
+        init.update_arg_table()
         return init
 
     def to_node(self):
@@ -144,7 +265,7 @@ class Argument:
         self.preserve_case = False
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return self is other or self.__dict__ == other.__dict__
 
     def same_behaviour(self, other):
         return self.type == other.type and\
@@ -152,6 +273,14 @@ class Argument:
                self.ref == other.ref and\
                self.optional == other.optional
 
+    def key(self):
+        return (self.type, self.desc, self.out, self.ref, self.optional,
+                self.allow_const, self.allow_gvar, self.allow_lvar, self.entity, tuple(self.enums),
+                self.allow_text_label, self.allow_pointer, self.preserve_case)
+
+    def behaviour_key(self):
+        return (self.type, self.out, self.ref, self.optional)
+
     def has_enum(self, name):
         return any(x == name for x in self.enums)
 
@@ -204,60 +333,346 @@ class Argument:
             node.set("Enum", self.enums[0])
         return node
     
+class _FrozenArgument(Argument):
+    # An interned Argument, shared between commands and configs, thus immutable.
+    def __setattr__(self, name, value):
+        raise TypeError("interned Argument is immutable")
+
+    def __delattr__(self, name):
+        raise TypeError("interned Argument is immutable")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+class _FrozenList(list):
+    _message = "interned or frozen list is immutable"
+
+    def _immutable(self, *args):
+        raise TypeError(self._message)
+
+    def __reduce__(self):
+        # a list subclass is otherwise pickled and copied by appending its items
+        return (self.__class__, (list(self),))
+    append = extend = insert = pop = remove = reverse = sort = _immutable
+    __setitem__ = __delitem__ = __setslice__ = __delslice__ = __iadd__ = __imul__ = _immutable
+
+class _Signature(_FrozenList):
+    # The args of an interned Command, shared with every command taking the same arguments.
+    _message = ("the args of an interned Command are shared with other commands, "
+                "assign a new list to it instead (then call update_arg_table)")
+
+class ArgDescriptor(object):
+    # Flattened copy of an Argument holding only what the analysis loops read.
+    __slots__ = ("type", "out", "optional", "allow_const", "enum", "entity", "desc")
+
+    def __init__(self, arg):
+        self.type = arg.type
+        self.out = arg.out
+        self.optional = arg.optional
+        self.allow_const = arg.allow_const
+        self.enum = arg.enums[0] if len(arg.enums) > 0 else None
+        self.entity = arg.entity
+        self.desc = arg.desc
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in ArgDescriptor.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(ArgDescriptor.__slots__, state):
+            setattr(self, name, value)
+
+class _FrozenDict(dict):
+    def _immutable(self, *args):
+        raise TypeError("frozen Enum is immutable")
+
+    def __reduce__(self):
+        # a dict subclass is otherwise pickled and copied by setting its items
+        return (_FrozenDict, (dict(self),))
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _immutable
+
+class _FrozenCommand(Command):
+    # A Command of a frozen Config, shared by its overlays.
+    def __setattr__(self, name, value):
+        # the arg tables are not pickled, a copy builds them again from its args
+        if name in _ARG_TABLE_ATTRS:
+            self.__dict__[name] = value
+        else:
+            raise TypeError("frozen Command is immutable")
+
+class _FrozenEnum(Enum):
+    def __setattr__(self, name, value):
+        raise TypeError("frozen Enum is immutable")
+
+class _FrozenAlternator(Alternator):
+    def __setattr__(self, name, value):
+        raise TypeError("frozen Alternator is immutable")
+
 class Config:
-    def __init__(self):
+    def __init__(self, intern=False):
         self.commands = []
         self.enums = []
         self.alternators = []
+        self.intern = intern    # share immutable arguments/signatures with other configs
+        self.frozen = False
+        self._arg_index = None
+        self._arg_index_commands = None # the list _arg_index was built from
+        self._commands_by_name = None
+        self._commands_by_name_of = None # (list, length) _commands_by_name was built from
 
     def get_alternator(self, name):
         return next((x for x in self.alternators if x.name == name), None)
 
+    def get_enum(self, name):
+        return next((x for x in self.enums if x.name == name), None)
+
+    def get_command(self, name): # -> Command or None, the last one read if many share the name
+        # built again after commands are read, added or removed, or self.commands is assigned
+        of = self._commands_by_name_of
+        if self._commands_by_name is None or of[0] is not self.commands or of[1] != len(self.commands):
+            self._commands_by_name = {cmd.name: cmd for cmd in self.commands}
+            self._commands_by_name_of = (self.commands, len(self.commands))
+        return self._commands_by_name.get(name)
+
+    def freeze(self):
+        """
+        Makes the config and everything in it immutable, so that overlays can share it.
+        The arguments are interned, as with intern=True, and the commands, enums and
+        alternators become immutable in place: other references to them see the change.
+        """
+        if self.frozen:
+            return
+        for cmd in self.commands:
+            if not isinstance(cmd, _FrozenCommand):
+                cmd.intern()
+                cmd.__class__ = _FrozenCommand
+        for enum in self.enums:
+            if not isinstance(enum, _FrozenEnum):
+                enum.update_values()
+                enum.constants = _FrozenDict(enum.constants)
+                enum.__class__ = _FrozenEnum
+        for alt in self.alternators:
+            if not isinstance(alt, _FrozenAlternator):
+                alt.alters = _FrozenList(alt.alters)
+                alt.__class__ = _FrozenAlternator
+        self.commands = _FrozenList(self.commands)
+        self.enums = _FrozenList(self.enums)
+        self.alternators = _FrozenList(self.alternators)
+        self.intern = True
+        self.frozen = True
+
+    def overlay(self): # -> empty ConfigOverlay over this config, which gets frozen in place
+        return ConfigOverlay(self)
+
+    def arg_index(self): # -> ArgIndex over the commands, built on first use
+        # commands read later are added to it, others must be added with add_command;
+        # assigning another list to self.commands makes it built again
+        if self._arg_index is None or self._arg_index_commands is not self.commands:
+            self._arg_index = ArgIndex(self.commands)
+            self._arg_index_commands = self.commands
+        return self._arg_index
+
     def read_config(self, file):
+        if isinstance(file, basestring):
+            with open_compressed(file, "rb") as f:
+                return self.read_config(f)
+        if self.frozen:
+            raise TypeError("frozen Config is immutable")
         tree = etree.parse(file)
         for item in tree.getroot():
             if item.tag == "Alternators":
                 for subitem in item:
                     if subitem.tag == "Alternator":
-                        self.alternators.append(Alternator.from_node(subitem))
+                        self._add_alternator(Alternator.from_node(subitem))
             elif item.tag == "Commands":
                 for subitem in item:
                     if subitem.tag == "Command":
-                        self.commands.append(Command.from_node(subitem))
+                        command = Command.from_node(subitem)
+                        if self.intern:
+                            command.intern()
+                        self._add_command(command)
             elif item.tag == "Constants":
                 for subitem in item:
                     if subitem.tag == "Enum":
-                        self.enums.append(Enum.from_node(subitem))
+                        self._add_enum(Enum.from_node(subitem))
 
+    def _add_command(self, command):
+        self.commands.append(command)
+        if self._arg_index is not None:
+            self._arg_index.add_command(command)
+
+    def _add_enum(self, enum):
+        self.enums.append(enum)
+
+    def _add_alternator(self, alternator):
+        self.alternators.append(alternator)
+
+    @instrument.timed("save_config")
     def save_config(self, file, pretty_print=True):
-        root = etree.Element("GTA3Script")
-        if len(self.enums) > 0:
-            base = etree.SubElement(root, "Constants") 
-            for c in self.enums:
-                base.append(c.to_node())
-        if len(self.alternators) > 0:
-            base = etree.SubElement(root, "Alternators") 
-            for c in self.alternators:
-                base.append(c.to_node())
-        if len(self.commands) > 0:
-            base = etree.SubElement(root, "Commands") 
-            for c in self.commands:
-                base.append(c.to_node())
-
-        tree = etree.ElementTree(root)
-        tree.write(file, encoding="utf-8", pretty_print=pretty_print, xml_declaration=True)
-
-
-def read_config(filename):
-    c = Config()
+        # each element is written as soon as it is made, the whole tree is never built
+        if isinstance(file, basestring):
+            with open_compressed(file, "wb") as f:
+                return self.save_config(f, pretty_print)
+        sections = [(tag, items) for tag, items in (("Constants", self.enums),
+                                                    ("Alternators", self.alternators),
+                                                    ("Commands", self.commands)) if len(items) > 0]
+        file.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+        with etree.xmlfile(file, encoding="utf-8") as xf:
+            if len(sections) == 0:
+                xf.write(etree.Element("GTA3Script"))
+            else:
+                with xf.element("GTA3Script"):
+                    for tag, items in sections:
+                        if pretty_print: xf.write("\n  ")
+                        with xf.element(tag):
+                            for item in items:
+                                node = item.to_node()
+                                if pretty_print:
+                                    xf.write("\n    ")
+                                    if len(node) > 0:
+                                        etree.indent(node, level=2)
+                                xf.write(node)
+                            if pretty_print: xf.write("\n  ")
+                    if pretty_print: xf.write("\n")
+        if pretty_print:
+            file.write("\n")
+
+
+class ConfigOverlay(Config):
+    """
+    A Config holding only what is read into it, on top of a frozen base Config (which
+    may be another overlay), so that variants of a config share the base one.
+
+    Commands, enums and alternators of the overlay replace those of the base with the same
+    name, in their place, and the others follow those of the base. commands, enums and
+    alternators list the merged layers, but refer to the base objects, which are immutable:
+    writable_command() copies a base command into the overlay to change it.
+
+    The base is frozen in place (see Config.freeze) by the constructor. save_config writes
+    the merged config, the own_commands, own_enums and own_alternators of the overlay are
+    what was read into it.
+    """
+
+    def __init__(self, base, intern=False):
+        Config.__init__(self, intern=intern)
+        base.freeze()
+        self.base = base
+        self.own_commands = []
+        self.own_enums = []
+        self.own_alternators = []
+        self._merge()
+
+    def _merge(self):
+        self._own_commands_by_name = {cmd.name: cmd for cmd in self.own_commands}
+        self.commands = _merge_layer(self.base.commands, self.own_commands)
+        self.enums = _merge_layer(self.base.enums, self.own_enums)
+        self.alternators = _merge_layer(self.base.alternators, self.own_alternators)
+        self._arg_index = None
+
+    def read_config(self, file):
+        Config.read_config(self, file)
+        self._merge()
+
+    def _add_command(self, command):
+        self.own_commands.append(command)
+
+    def _add_enum(self, enum):
+        self.own_enums.append(enum)
+
+    def _add_alternator(self, alternator):
+        self.own_alternators.append(alternator)
+
+    def get_command(self, name):
+        cmd = self._own_commands_by_name.get(name)
+        return cmd if cmd is not None else self.base.get_command(name)
+
+    def get_enum(self, name):
+        return next((x for x in self.own_enums if x.name == name), None) or self.base.get_enum(name)
+
+    def get_alternator(self, name):
+        return next((x for x in self.own_alternators if x.name == name), None) or self.base.get_alternator(name)
+
+    def writable_command(self, name): # -> Command of this overlay, copied from the base the first time
+        cmd = self._own_commands_by_name.get(name)
+        if cmd is None:
+            frozen = self.base.get_command(name)
+            if frozen is None:
+                raise KeyError(name)
+            cmd = Command()
+            cmd.__dict__.update(frozen.__dict__)
+            cmd.args = [_thawed_argument(a) for a in frozen.args]
+            cmd.update_arg_table()
+            self.own_commands.append(cmd)
+            self._merge()
+        return cmd
+
+    def freeze(self):
+        Config.freeze(self)
+        self.own_commands = _FrozenList(self.own_commands)
+        self.own_enums = _FrozenList(self.own_enums)
+        self.own_alternators = _FrozenList(self.own_alternators)
+
+def _merge_layer(base_items, own_items): # -> [item, ...] of both layers, own ones replacing base ones by name
+    replacing = {x.name: x for x in own_items if x.name is not None}
+    merged = [replacing.get(x.name, x) if x.name is not None else x for x in base_items]
+    base_names = set(x.name for x in base_items)
+    merged += [x for x in own_items if x.name is None or x.name not in base_names]
+    return merged
+
+def _thawed_argument(arg): # -> mutable copy of a possibly interned Argument
+    copy = Argument()
+    copy.__dict__.update(arg.__dict__)
+    copy.enums = list(arg.enums)
+    return copy
+
+
+@instrument.timed("read_config")
+def read_config(filename, intern=False, base=None):
+    """
+    Reads a config file, or every config file of a directory, as an overlay of base if given.
+    base is frozen in place, so its commands, enums and alternators can no longer be changed.
+
+    With intern, the args of each command are shared with the other interned commands
+    (of this and any other config) taking the same arguments, so both the list and its
+    Arguments are immutable: a command is changed by assigning it new args. The shared
+    objects are kept until clear_interned is called.
+    """
+    c = Config(intern=intern) if base is None else ConfigOverlay(base, intern=intern)
     if os.path.isdir(filename):
         for subfile in os.listdir(filename):
-            if subfile.endswith(".xml"):
+            if strip_compression_ext(subfile).endswith(".xml"):
                 c.read_config(os.path.join(filename, subfile))
     else:
         c.read_config(filename)
     return c
 
+def intern_argument(arg): # -> the shared immutable Argument equal to arg
+    key = arg.key()
+    shared = _interned_args.get(key)
+    if shared is None:
+        shared = Argument()
+        shared.__dict__.update(arg.__dict__)
+        shared.enums = _FrozenList(arg.enums)
+        shared.__class__ = _FrozenArgument
+        _interned_args[key] = shared
+    return shared
+
+def intern_signature(args): # -> the shared immutable list of shared Arguments equal to args
+    signature = _Signature(intern_argument(a) for a in args)
+    # interned arguments live as long as _interned_args, so their ids are stable keys
+    return _interned_signatures.setdefault(tuple(id(a) for a in signature), signature)
+
+def clear_interned():
+    """
+    Releases the arguments and signatures shared by the configs loaded with intern=True.
+    Those configs keep theirs, but share them no longer with the configs loaded afterwards.
+    """
+    _interned_args.clear()
+    _interned_signatures.clear()
+    _interned_behaviours.clear()
+
 def read_commandline(configpath):
     result = []
     with open(os.path.join(configpath, "commandline.txt")) as f:
@@ -0,0 +1,407 @@
+# -*- Python -*-
+"""
+Flat read-only encoding of a loaded Config, attached by worker processes through mmap.
+
+Attaching maps the file and decodes nothing, records are decoded when looked up, so the
+startup of a worker does not depend on the size of the config and the pages are shared by
+every process attaching the same file. A FlatConfig pickles as its filename, thus handing
+it to workers not forked from the loading process (see parallel_map) costs the same.
+
+Commands have the fields and ArgDescriptors of Command but not its Arguments, enums and
+alternators the lookups of Enum and Alternator.
+
+Usage:
+    flat = share_config(config)     # in a temporary file removed by flat.close()
+    results = parallel_map(func, items, shared=flat)
+    # or, sharing it flat only where the pool does not fork
+    results = parallel_map(func, items, shared=config, flat_config=True)
+"""
+import mmap
+import os
+import struct
+import tempfile
+
+from config import ArgDescriptor
+
+__all__ = ["FlatConfig", "write_flat_config", "share_config"]
+
+FLAT_CONFIG_MAGIC = "GTA3SCFC"
+FLAT_CONFIG_VERSION = 1
+
+_NONE = 0xFFFFFFFF # string index of None
+
+_HEADER     = struct.Struct("<8sI")       # magic, version
+_SECTION    = struct.Struct("<II")        # byte offset, number of records
+_U32        = struct.Struct("<I")
+_DESCRIPTOR = struct.Struct("<IBIII")     # type, flags, enum, entity, desc
+_COMMAND    = struct.Struct("<IiIBII")    # name, id, hash, flags, first arg ref, number of args
+_ENUM       = struct.Struct("<IBIIIIII")  # name, global, first run, runs, first sparse, sparse, first constant, constants
+_RUN        = struct.Struct("<qII")       # first value, first name ref, length
+_PAIR       = struct.Struct("<qI")        # value, name
+_ALTERNATOR = struct.Struct("<III")       # name, first alternative ref, number of alternatives
+
+# In file order, after the header and the section table. The *_order sections are the
+# indices of the items get_* finds, sorted by name; *_refs are string or descriptor indices.
+_SECTIONS = ("string_offsets", "string_data", "descriptors", "arg_refs", "commands", "command_order",
+             "enums", "enum_order", "runs", "sparse", "constants", "alternators", "alternator_order",
+             "string_refs")
+
+_DESC_OUT, _DESC_OPTIONAL, _DESC_ALLOW_CONST = 1, 2, 4
+_CMD_HAS_ID, _CMD_HAS_HASH, _CMD_SUPPORTED, _CMD_INTERNAL, _CMD_EXTENSION = 1, 2, 4, 8, 16
+
+def _encode(s):
+    return s.encode("utf-8") if isinstance(s, unicode) else s
+
+def _decode(data): # -> str, or unicode if not ascii, as lxml gives them
+    try:
+        data.decode("ascii")
+        return data
+    except UnicodeDecodeError:
+        return data.decode("utf-8")
+
+class _FlatWriter:
+    def __init__(self):
+        self.string_index = {}
+        self.strings = []
+        self.descriptor_index = {}
+        self.sections = {name: [] for name in _SECTIONS if name != "string_data"}
+
+    def string(self, s): # -> index of s in the string table
+        if s is None:
+            return _NONE
+        data = _encode(s)
+        i = self.string_index.get(data)
+        if i is None:
+            i = self.string_index[data] = len(self.strings)
+            self.strings.append(data)
+        return i
+
+    def descriptor(self, d): # -> index of an equal ArgDescriptor in the descriptor table
+        flags = ((_DESC_OUT if d.out else 0) | (_DESC_OPTIONAL if d.optional else 0) |
+                 (_DESC_ALLOW_CONST if d.allow_const else 0))
+        record = _DESCRIPTOR.pack(self.string(d.type), flags, self.string(d.enum), self.string(d.entity), self.string(d.desc))
+        i = self.descriptor_index.get(record)
+        if i is None:
+            i = self.descriptor_index[record] = len(self.sections["descriptors"])
+            self.sections["descriptors"].append(record)
+        return i
+
+    def refs(self, section, indices): # -> index of the first of indices appended to section
+        first = len(self.sections[section])
+        self.sections[section] += [_U32.pack(i) for i in indices]
+        return first
+
+    def add_command(self, cmd):
+        flags = ((_CMD_HAS_ID if cmd.id is not None else 0) | (_CMD_HAS_HASH if cmd.hash is not None else 0) |
+                 (_CMD_SUPPORTED if cmd.supported else 0) | (_CMD_INTERNAL if cmd.internal else 0) |
+                 (_CMD_EXTENSION if cmd.extension else 0))
+        first = self.refs("arg_refs", [self.descriptor(d) for d in cmd.arg_table])
+        self.sections["commands"].append(_COMMAND.pack(self.string(cmd.name), cmd.id or 0, cmd.hash or 0, flags,
+                                                       first, len(cmd.arg_table)))
+
+    def add_enum(self, enum):
+        if enum.run_starts is None:
+            enum.update_values()
+        first_run = len(self.sections["runs"])
+        for start, names in zip(enum.run_starts, enum.run_names):
+            self.sections["runs"].append(_RUN.pack(start, self.refs("string_refs", map(self.string, names)), len(names)))
+        first_sparse = len(self.sections["sparse"])
+        self.sections["sparse"] += [_PAIR.pack(v, self.string(name)) for v, name in sorted(enum.sparse_names.iteritems())]
+        first_constant = len(self.sections["constants"])
+        self.sections["constants"] += [_PAIR.pack(v, self.string(name)) for name, v in sorted(enum.constants.iteritems())]
+        self.sections["enums"].append(_ENUM.pack(self.string(enum.name), enum.is_global,
+                                                 first_run, len(enum.run_starts), first_sparse, len(enum.sparse_names),
+                                                 first_constant, len(enum.constants)))
+
+    def add_alternator(self, alt):
+        first = self.refs("string_refs", map(self.string, alt.alters))
+        self.sections["alternators"].append(_ALTERNATOR.pack(self.string(alt.name), first, len(alt.alters)))
+
+    def add_order(self, section, items, found): # items found by name, as get_* of the config finds them
+        order = [i for i, item in enumerate(items) if item.name is not None and found(item.name) is item]
+        order.sort(key=lambda i: _encode(items[i].name))
+        self.refs(section, order)
+
+    def write(self, f):
+        offsets, pos = [0], 0
+        for data in self.strings:
+            pos += len(data)
+            offsets.append(pos)
+        self.refs("string_offsets", offsets)
+        contents = [("".join(self.strings), len(self.strings)) if name == "string_data" else
+                    ("".join(self.sections[name]), len(self.sections[name])) for name in _SECTIONS]
+        pos = _HEADER.size + _SECTION.size * len(_SECTIONS)
+        f.write(_HEADER.pack(FLAT_CONFIG_MAGIC, FLAT_CONFIG_VERSION))
+        for data, count in contents:
+            f.write(_SECTION.pack(pos, count))
+            pos += len(data)
+        for data, count in contents:
+            f.write(data)
+
+def write_flat_config(config, file):
+    """Writes the flat encoding of a Config (or ConfigOverlay) to a file, attached with FlatConfig."""
+    if isinstance(file, basestring):
+        with open(file, "wb") as f:
+            return write_flat_config(config, f)
+    writer = _FlatWriter()
+    for cmd in config.commands:
+        writer.add_command(cmd)
+    for enum in config.enums:
+        writer.add_enum(enum)
+    for alt in config.alternators:
+        writer.add_alternator(alt)
+    writer.add_order("command_order", config.commands, config.get_command)
+    writer.add_order("enum_order", config.enums, config.get_enum)
+    writer.add_order("alternator_order", config.alternators, config.get_alternator)
+    writer.write(file)
+
+def share_config(config, filename=None): # -> FlatConfig of config, removing its file on close if temporary
+    owned = filename is None
+    if owned:
+        fd, filename = tempfile.mkstemp(prefix="gta3sc-", suffix=".flatconfig")
+        os.close(fd)
+    try:
+        write_flat_config(config, filename)
+        flat = FlatConfig(filename)
+    except:
+        if owned:
+            os.remove(filename)
+        raise
+    flat.owned = owned
+    return flat
+
+
+class FlatConfig(object):
+    """
+    Read-only view of a file written by write_flat_config, with the lookups of Config.
+
+    The commands, enums and alternators are decoded into views (FlatCommand, FlatEnum and
+    FlatAlternator) on first use, and kept for the next ones.
+    """
+    frozen = True
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.owned = False  # remove the file on close
+        with open(filename, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self._buf, 0)
+        if magic != FLAT_CONFIG_MAGIC or version != FLAT_CONFIG_VERSION:
+            self._buf.close()
+            raise ValueError("%s is not a version %d flat config" % (filename, FLAT_CONFIG_VERSION))
+        self._sections = {}
+        for i, name in enumerate(_SECTIONS):
+            self._sections[name] = _SECTION.unpack_from(self._buf, _HEADER.size + i * _SECTION.size)
+        self._strings = {}
+        self._descriptors = {}
+        self._views = {"commands": {}, "enums": {}, "alternators": {}}
+        self.commands = _FlatSequence(self, "commands", FlatCommand)
+        self.enums = _FlatSequence(self, "enums", FlatEnum)
+        self.alternators = _FlatSequence(self, "alternators", FlatAlternator)
+
+    def __reduce__(self):
+        return (FlatConfig, (self.filename,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._buf.close()
+        if self.owned:
+            os.remove(self.filename)
+            self.owned = False
+
+    def get_command(self, name): # -> FlatCommand or None, the last one read if many share the name
+        return self._find("command_order", "commands", FlatCommand, name)
+
+    def get_enum(self, name):
+        return self._find("enum_order", "enums", FlatEnum, name)
+
+    def get_alternator(self, name):
+        return self._find("alternator_order", "alternators", FlatAlternator, name)
+
+    def _record(self, section, record, i): # -> fields of record i of a section
+        return record.unpack_from(self._buf, self._sections[section][0] + i * record.size)
+
+    def _ref(self, section, i):
+        return _U32.unpack_from(self._buf, self._sections[section][0] + i * 4)[0]
+
+    def _string_data(self, i):
+        start = self._sections["string_data"][0]
+        return self._buf[start + self._ref("string_offsets", i):start + self._ref("string_offsets", i + 1)]
+
+    def _string(self, i):
+        if i == _NONE:
+            return None
+        s = self._strings.get(i)
+        if s is None:
+            s = self._strings[i] = _decode(self._string_data(i))
+        return s
+
+    def _descriptor(self, i): # -> ArgDescriptor, shared by the commands having it
+        d = self._descriptors.get(i)
+        if d is None:
+            type, flags, enum, entity, desc = self._record("descriptors", _DESCRIPTOR, i)
+            d = self._descriptors[i] = ArgDescriptor.__new__(ArgDescriptor)
+            d.type = self._string(type)
+            d.out = bool(flags & _DESC_OUT)
+            d.optional = bool(flags & _DESC_OPTIONAL)
+            d.allow_const = bool(flags & _DESC_ALLOW_CONST)
+            d.enum = self._string(enum)
+            d.entity = self._string(entity)
+            d.desc = self._string(desc)
+        return d
+
+    def _view(self, section, view_type, i):
+        views = self._views[section]
+        view = views.get(i)
+        if view is None:
+            view = views[i] = view_type(self, i)
+        return view
+
+    def _find(self, order, section, view_type, name): # -> view of the item named so, by binary search of order
+        record = _RECORD_OF_SECTION[section]
+        data = _encode(name)
+        lo, hi = 0, self._sections[order][1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            i = self._ref(order, mid)
+            other = self._string_data(self._record(section, record, i)[0])
+            if other < data:
+                lo = mid + 1
+            elif other > data:
+                hi = mid
+            else:
+                return self._view(section, view_type, i)
+        return None
+
+_RECORD_OF_SECTION = {"commands": _COMMAND, "enums": _ENUM, "alternators": _ALTERNATOR}
+
+class _FlatSequence(object):
+    # Read-only list of the views of a section, in the order of the config.
+    def __init__(self, flat, section, view_type):
+        self.flat = flat
+        self.section = section
+        self.view_type = view_type
+
+    def __len__(self):
+        return self.flat._sections[self.section][1]
+
+    def __getitem__(self, i):
+        count = len(self)
+        if i < 0:
+            i += count
+        if not 0 <= i < count:
+            raise IndexError("flat config index out of range")
+        return self.flat._view(self.section, self.view_type, i)
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.flat._view(self.section, self.view_type, i)
+
+class FlatCommand(object):
+    # Same fields and ArgDescriptor lookups as Command, no Arguments.
+    __slots__ = ("name", "id", "hash", "supported", "internal", "extension", "arg_table", "arg_tail", "arg_tables")
+
+    def __init__(self, flat, i):
+        name, cmdid, cmdhash, flags, first, count = flat._record("commands", _COMMAND, i)
+        self.name = flat._string(name)
+        self.id = cmdid if flags & _CMD_HAS_ID else None
+        self.hash = cmdhash if flags & _CMD_HAS_HASH else None
+        self.supported = bool(flags & _CMD_SUPPORTED)
+        self.internal = bool(flags & _CMD_INTERNAL)
+        self.extension = bool(flags & _CMD_EXTENSION)
+        self.arg_table = tuple(flat._descriptor(flat._ref("arg_refs", first + k)) for k in xrange(count))
+        self.arg_tail = self.arg_table[-1] if count > 0 and self.arg_table[-1].optional else None
+        self.arg_tables = {count: self.arg_table}
+
+    def has_optional(self):
+        return self.arg_tail is not None
+
+    def arg_descriptor(self, i): # -> ArgDescriptor or None, same indexing rules as Command.get_arg
+        try:
+            return self.arg_table[i]
+        except IndexError:
+            return self.arg_tail
+
+    def arg_descriptors(self, count): # -> (ArgDescriptor or None, ...) for an instruction with count args
+        table = self.arg_tables.get(count)
+        if table is None:
+            table = self.arg_tables[count] = tuple(self.arg_descriptor(i) for i in range(count))
+        return table
+
+class FlatEnum(object):
+    # Same lookups as Enum, the constants dict is decoded on first use.
+    __slots__ = ("name", "is_global", "_flat", "_record", "_constants")
+
+    def __init__(self, flat, i):
+        self._flat = flat
+        self._record = flat._record("enums", _ENUM, i)
+        self._constants = None
+        self.name = flat._string(self._record[0])
+        self.is_global = bool(self._record[1])
+
+    @property
+    def constants(self): # -> { name: value, ... }
+        if self._constants is None:
+            flat, first, count = self._flat, self._record[6], self._record[7]
+            pairs = (flat._record("constants", _PAIR, first + k) for k in xrange(count))
+            self._constants = {flat._string(name): value for value, name in pairs}
+        return self._constants
+
+    def get_name(self, value, default=None): # -> name of a value, the lowest name if many share it
+        flat = self._flat
+        first_run, runs, first_sparse, sparse = self._record[2:6]
+        # last run starting at or before value
+        lo, hi = 0, runs
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if flat._record("runs", _RUN, first_run + mid)[0] <= value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0:
+            start, names, length = flat._record("runs", _RUN, first_run + lo - 1)
+            if value - start < length:
+                name = flat._string(flat._ref("string_refs", names + value - start))
+                if name is not None:
+                    return name
+        lo, hi = 0, sparse
+        while lo < hi:
+            mid = (lo + hi) // 2
+            other, name = flat._record("sparse", _PAIR, first_sparse + mid)
+            if other < value:
+                lo = mid + 1
+            elif other > value:
+                hi = mid
+            else:
+                return flat._string(name)
+        return default
+
+    def has_value(self, value):
+        return self.get_name(value) is not None
+
+    def max_value(self): # -> highest value or None when empty
+        flat = self._flat
+        first_run, runs, first_sparse, sparse = self._record[2:6]
+        values = []
+        if runs > 0:
+            start, names, length = flat._record("runs", _RUN, first_run + runs - 1)
+            values.append(start + length - 1)
+        if sparse > 0:
+            values.append(flat._record("sparse", _PAIR, first_sparse + sparse - 1)[0])
+        return max(values) if len(values) > 0 else None
+
+class FlatAlternator(object):
+    __slots__ = ("name", "alters")
+
+    def __init__(self, flat, i):
+        name, first, count = flat._record("alternators", _ALTERNATOR, i)
+        self.name = flat._string(name)
+        self.alters = tuple(flat._string(flat._ref("string_refs", first + k)) for k in xrange(count))
+
+    def __iter__(self):
+        return iter(self.alters)
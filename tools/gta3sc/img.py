@@ -0,0 +1,59 @@
+# -*- Python -*-
+import mmap
+import struct
+
+__all__ = ["ImgArchive", "map_file"]
+
+IMG_SECTOR_SIZE = 2048
+
+class ImgArchive:
+    """
+    Random access reader of a version 2 (San Andreas) IMG archive, such as script.img.
+
+    The archive is memory mapped and its directory indexed by lowercase entry name;
+    entries are returned as views of the mapping, so nothing is read until used.
+    """
+
+    def __init__(self, file):
+        self.buf, self.slice_view = map_file(file)
+        magic, count = struct.unpack_from("<4sI", self.buf, 0)
+        if magic != "VER2":
+            raise ValueError("not a version 2 IMG archive")
+        self.names = []
+        self.entries = {}   # lowercase name -> (start, end)
+        for i in range(count):
+            offset, streaming_size, archive_size, name = struct.unpack_from("<IHH24s", self.buf, 8 + 32*i)
+            size = archive_size or streaming_size
+            name = name.split('\0', 1)[0]
+            self.names.append(name)
+            self.entries[name.lower()] = (offset * IMG_SECTOR_SIZE, (offset + size) * IMG_SECTOR_SIZE)
+
+    def __contains__(self, name):
+        return name.lower() in self.entries
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get_range(self, name): # -> (start, end) position of the entry in the archive
+        return self.entries[name.lower()]
+
+    def get(self, name): # -> view of the entry contents
+        start, end = self.get_range(name)
+        return self.slice_view(start, end)
+
+
+def map_file(file): # -> (mmap, slice_view), where slice_view(start, end) does not copy
+    try:
+        fileno = file.fileno()
+    except AttributeError:
+        with open(file, "rb") as f:
+            return map_file(f)
+    buf = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    try:
+        view = memoryview(buf)
+        return buf, lambda start, end: view[start:end]
+    except TypeError: # Python 2 mmap only exposes the old buffer interface
+        return buf, lambda start, end: buffer(buf, start, end - start)
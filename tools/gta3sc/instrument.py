@@ -0,0 +1,268 @@
+# -*- Python -*-
+"""
+Phase timers and counters for the gta3sc tools.
+
+Everything is a no-op until enable() is called (the tools do so for --profile), so the
+instrumented code pays at most a function call and a flag check. Hot loops should pick
+an instrumented variant once, based on is_enabled(), rather than counting per item.
+
+With enable_memory() (the tools do so for --memory-report) the phases also record how
+much memory they leave allocated and their own peak, the most they had allocated above
+the memory at their start. Allocations are traced with tracemalloc when it is available
+(Python 3, or pytracemalloc), otherwise the resident set size of the process is used,
+which only approximates them. The peak is reset when a phase starts, through
+tracemalloc.reset_peak or /proc/self/clear_refs on Linux; where it cannot be, a phase
+peak may include that of an earlier phase.
+
+Only the current process is measured; work done by parallel_map workers is not.
+"""
+import functools
+import os
+import sys
+import time
+from collections import defaultdict
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None # memory is measured as the process RSS
+try:
+    import resource
+except ImportError:
+    resource = None
+
+__all__ = ["enable", "disable", "is_enabled", "reset", "timer", "timed", "add_time", "count", "report",
+           "enable_memory", "is_memory_traced", "memory_stats", "peak_rss", "memory_report", "run_tool"]
+
+_enabled = False
+_memory = False
+_times = defaultdict(float)    # phase -> seconds
+_calls = defaultdict(int)      # phase -> times entered
+_counters = defaultdict(int)   # counter -> count
+_growth = defaultdict(int)     # phase -> bytes left allocated by its calls
+_peaks = defaultdict(int)      # phase -> highest peak bytes of its calls, above the memory at their start
+_order = []                    # phases and counters in order of first use
+_active = []                   # _Timers measuring memory, started and not stopped
+_rss_peak_cleared = 0          # highest peak RSS before a phase reset the one of the kernel
+
+_TRACEMALLOC_FRAMES = 8
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled, _memory
+    _enabled = False
+    _memory = False
+
+def is_enabled():
+    return _enabled
+
+def reset():
+    _times.clear()
+    _calls.clear()
+    _counters.clear()
+    _growth.clear()
+    _peaks.clear()
+    del _order[:]
+
+def timer(phase): # -> context manager timing the enclosed code as phase, or started and stopped by hand
+    return _Timer(phase) if _enabled else _null_timer
+
+def timed(phase): # -> decorator timing every call of a function as phase
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Timer(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def add_time(phase, seconds):
+    if _enabled:
+        _register(phase)
+        _times[phase] += seconds
+        _calls[phase] += 1
+
+def count(counter, n=1):
+    if _enabled:
+        _register(counter)
+        _counters[counter] += n
+
+def report(file=None):
+    file = file or sys.stderr
+    phases = [name for name in _order if name in _calls]
+    counters = [name for name in _order if name in _counters]
+    if phases:
+        file.write("%-40s %8s %10s\n" % ("phase", "calls", "seconds"))
+        for name in phases:
+            file.write("%-40s %8d %10.3f\n" % (name, _calls[name], _times[name]))
+    if counters:
+        file.write("%-40s %8s\n" % ("counter", "count"))
+        for name in counters:
+            file.write("%-40s %8d\n" % (name, _counters[name]))
+
+def enable_memory():
+    """Enables instrumentation, also measuring the memory of the phases."""
+    global _memory
+    enable()
+    _memory = True
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start(_TRACEMALLOC_FRAMES)
+
+def is_memory_traced(): # -> whether memory is measured by tracemalloc, rather than approximated by the RSS
+    return tracemalloc is not None and tracemalloc.is_tracing()
+
+def memory_stats(): # -> { phase: (bytes left allocated, peak bytes above the start), ... }, RSS deltas unless is_memory_traced()
+    return {name: (_growth[name], _peaks[name]) for name in _order if name in _peaks}
+
+def peak_rss(): # -> peak resident set size of the process in bytes, or None if unknown
+    rss = _kernel_peak_rss()
+    return None if rss is None else max(rss, _rss_peak_cleared)
+
+def memory_report(file=None, top=10):
+    file = file or sys.stderr
+    mb = 1024.0 * 1024.0
+    phases = [name for name in _order if name in _peaks]
+    traced = is_memory_traced()
+    if phases:
+        file.write("%-40s %8s %10s %10s\n" % ("phase", "calls", "kept MB" if traced else "~kept MB", "peak MB" if traced else "~peak MB"))
+        for name in phases:
+            file.write("%-40s %8d %10.1f %10.1f\n" % (name, _calls[name], _growth[name] / mb, _peaks[name] / mb))
+    rss = peak_rss()
+    if rss is not None:
+        file.write("peak RSS %.1f MB\n" % (rss / mb))
+    if traced:
+        file.write("top allocation sites:\n")
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:top]:
+            file.write("  %s\n" % stat)
+    else:
+        file.write("(allocation sites need tracemalloc; ~ phases are changes of the process RSS, only approximate:\n"
+                   " memory freed by a phase is reused by the next ones, so a phase may keep less than those inside it)\n")
+
+def run_tool(options, func, *args, **kwargs): # -> func(*args, **kwargs)
+    """
+    Runs the main function of a tool given its --profile and --memory-report options.
+
+    With profile set, instrumentation is enabled and a phase breakdown is printed to
+    stderr afterwards; when profile is a filename, cProfile data is also dumped there
+    (load it with pstats). With memory-report set, the memory of the phases, the peak
+    RSS and the top allocation sites are printed as well.
+    """
+    profile = options.get("profile")
+    memory = options.get("memory-report")
+    if not profile and not memory:
+        return func(*args, **kwargs)
+    enable()
+    if memory:
+        enable_memory()
+    profiler = None
+    if profile and profile is not True:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        with timer("total"):
+            return func(*args, **kwargs)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if profile:
+            report()
+        if memory:
+            memory_report()
+
+
+def _register(name):
+    if name not in _calls and name not in _counters and name not in _order:
+        _order.append(name)
+
+
+def _current_memory(): # -> bytes allocated now
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[0]
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError):
+        return peak_rss() or 0
+
+def _kernel_peak_rss(): # -> peak resident set size since the last _reset_peak, or None if unknown
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024 # kilobytes elsewhere
+
+def _peak_memory(): # -> highest bytes allocated since the last _reset_peak, if it could reset it
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()[1]
+    return _kernel_peak_rss() or _current_memory()
+
+def _reset_peak():
+    global _rss_peak_cleared
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        if hasattr(tracemalloc, "reset_peak"): # Python 3.9
+            tracemalloc.reset_peak()
+        return
+    _rss_peak_cleared = max(_rss_peak_cleared, _kernel_peak_rss() or 0)
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5") # resets the peak RSS of the process
+    except (IOError, OSError):
+        pass
+
+def _note_peak(): # the peak so far counts for every running phase, before a reset loses it
+    peak = _peak_memory()
+    for t in _active:
+        if peak > t.peak:
+            t.peak = peak
+
+
+class _Timer(object):
+    __slots__ = ("phase", "started", "memory", "peak")
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        _register(self.phase) # outer phases are reported before the inner ones
+        if _memory:
+            _note_peak()
+            _reset_peak()
+            self.memory = self.peak = _current_memory()
+            _active.append(self)
+        self.started = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        add_time(self.phase, time.time() - self.started)
+        if _memory and self in _active:
+            _note_peak()
+            _active.remove(self)
+            memory = _current_memory()
+            _growth[self.phase] += memory - self.memory
+            # the RSS peak is counted in coarser units than the current RSS
+            _peaks[self.phase] = max(_peaks[self.phase], max(self.peak, memory) - self.memory)
+        return False
+
+    start = __enter__
+
+    def stop(self):
+        self.__exit__(None, None, None)
+
+class _NullTimer(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    start = __enter__
+
+    def stop(self):
+        pass
+
+_null_timer = _NullTimer()
@@ -0,0 +1,46 @@
+# -*- Python -*-
+from bisect import bisect_right
+
+__all__ = ["IntervalIndex"]
+
+class IntervalIndex:
+    """
+    Answers which [start, end) range owns a byte offset in O(log n).
+
+    Nested or overlapping ranges are folded into the one starting first (the same way
+    overlapping variables are coalesced by Bytecode.discover_*_vars), so an offset
+    has at most one owner.
+    """
+
+    def __init__(self, ranges=()): # ranges is an iterable of (start, end, value)
+        self.starts = []
+        self.ends = []
+        self.values = []
+        for start, end, value in sorted(ranges, key=lambda r: (r[0], -r[1])):
+            if len(self.starts) > 0 and start < self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+                continue
+            self.starts.append(start)
+            self.ends.append(end)
+            self.values.append(value)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def find(self, offset): # -> (start, end, value) or None
+        i = bisect_right(self.starts, offset) - 1
+        if i >= 0 and offset < self.ends[i]:
+            return (self.starts[i], self.ends[i], self.values[i])
+        return None
+
+    def owner(self, offset): # -> start offset of the owning range or None
+        found = self.find(offset)
+        return found[0] if found is not None else None
+
+    @staticmethod
+    def from_arrays(arrays): # arrays as returned by Bytecode.discover_*_arrays
+        return IntervalIndex((offset, offset + size, offset) for offset, size in arrays.iteritems())
+
+    @staticmethod
+    def from_vars(varlist): # [VarInfo, ...] as returned by Bytecode.discover_*_vars
+        return IntervalIndex((v.start_offset, v.end_offset, v) for v in varlist)
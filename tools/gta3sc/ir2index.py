@@ -0,0 +1,138 @@
+# -*- Python -*-
+"""
+Sidecar index of an IR2 file (<file>.idx, JSON) for loading only some of its blocks.
+
+The index records the byte and line range of every block, where each label and
+SCRIPT_NAME is, and the #DEFINE_MODEL/#DEFINE_STREAM headers. Building it only looks
+at the start of each line, so it is much cheaper than read_ir2. A stale index (the IR2
+file size or modification time changed) is ignored and rebuilt by load_ir2_index.
+
+Usage:
+    py gta3sc/ir2index.py main.ir2
+"""
+import json
+import os
+
+from compression import open_compressed
+from bytecode import Bytecode, Offset, _parse_ir2_lines, _RE_TOKENS, _arg_from_token
+from bytecode import BYTECODE_OFFSET_MAIN, BYTECODE_OFFSET_MISSION, BYTECODE_OFFSET_STREAMED
+
+__all__ = ["build_ir2_index", "read_ir2_index", "write_ir2_index", "load_ir2_index",
+           "find_script_block", "read_ir2_blocks"]
+
+IR2_INDEX_VERSION = 1
+
+def index_filename(ir2file):
+    return ir2file + ".idx"
+
+def build_ir2_index(ir2file): # -> index
+    stat = os.stat(ir2file)
+    index = {
+        "version": IR2_INDEX_VERSION,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "models": [],
+        "streams": [],
+        "blocks": [],       # [[offset type, block id, start byte, end byte, start line, end line], ...]
+        "labels": {},       # { name: [offset type, block id, index], ... }
+        "script_names": [], # [[name, offset type, block id, index], ...]
+    }
+
+    current = [BYTECODE_OFFSET_MAIN, 0, 0, None, 0, None]
+    index["blocks"].append(current)
+    data_index = 0
+    pos = 0
+    lineno = -1
+    with open_compressed(ir2file, "rb") as f:
+        for lineno, line in enumerate(f):
+            if line[0] == '#':
+                tokens = line.split()
+                if tokens[0] == "#MISSION_BLOCK_START" or tokens[0] == "#STREAMED_BLOCK_START":
+                    if current[3] is None: # the main block ends at the first mission or stream
+                        current[3], current[5] = pos, lineno
+                    blocktype = BYTECODE_OFFSET_MISSION if tokens[0] == "#MISSION_BLOCK_START" else BYTECODE_OFFSET_STREAMED
+                    current = [blocktype, int(tokens[1]), pos + len(line), None, lineno + 1, None]
+                    index["blocks"].append(current)
+                    data_index = 0
+                elif tokens[0] == "#MISSION_BLOCK_END" or tokens[0] == "#STREAMED_BLOCK_END":
+                    current[3], current[5] = pos, lineno
+                elif tokens[0] == "#DEFINE_MODEL":
+                    index["models"].append(tokens[1])
+                elif tokens[0] == "#DEFINE_STREAM":
+                    index["streams"].append(tokens[1])
+            else:
+                text = line.rstrip('\r\n')
+                if text[-1] == ':':
+                    index["labels"][text[:-1]] = [current[0], current[1], data_index]
+                elif text.startswith("SCRIPT_NAME "):
+                    name = _arg_from_token([p for p in _RE_TOKENS.split(text) if p.strip()][1]).value
+                    index["script_names"].append([name, current[0], current[1], data_index])
+                data_index += 1
+            pos += len(line)
+
+    main_block = index["blocks"][0]
+    if main_block[3] is None:
+        main_block[3], main_block[5] = pos, lineno + 1
+    return index
+
+def read_ir2_index(ir2file): # -> index, or None if missing or stale
+    try:
+        with open(index_filename(ir2file)) as f:
+            index = json.load(f)
+    except (IOError, ValueError):
+        return None
+    stat = os.stat(ir2file)
+    if index.get("version") != IR2_INDEX_VERSION or index["size"] != stat.st_size or index["mtime"] != stat.st_mtime:
+        return None
+    return index
+
+def write_ir2_index(ir2file, index):
+    with open(index_filename(ir2file), "w") as f:
+        json.dump(index, f)
+
+def load_ir2_index(ir2file): # -> index, building and saving it if needed
+    index = read_ir2_index(ir2file)
+    if index is None:
+        index = build_ir2_index(ir2file)
+        try:
+            write_ir2_index(ir2file, index)
+        except IOError: # read-only location, the index is only an optimization
+            pass
+    return index
+
+def find_script_block(index, script_name): # -> (offset type, block id) of the block with such SCRIPT_NAME or None
+    for name, blocktype, block_id, i in index["script_names"]:
+        if name.lower() == script_name.lower():
+            return (blocktype, block_id)
+    return None
+
+def read_ir2_blocks(ir2file, index, blocks): # -> Bytecode
+    """
+    Reads only the given [(offset type, block id), ...] blocks of an IR2 file.
+
+    The other blocks are left empty, but the models, stream names and the label table
+    are the ones of the whole file.
+    """
+    loaded = { BYTECODE_OFFSET_MAIN: [[]], BYTECODE_OFFSET_MISSION: [], BYTECODE_OFFSET_STREAMED: [] }
+    for blocktype, block_id, start, end, first_line, end_line in index["blocks"]:
+        if blocktype != BYTECODE_OFFSET_MAIN:
+            loaded[blocktype].append([])
+    wanted = set(tuple(b) for b in blocks)
+    with open_compressed(ir2file, "rb") as f: # offsets are in the decompressed text
+        for blocktype, block_id, start, end, first_line, end_line in index["blocks"]:
+            if (blocktype, block_id) in wanted:
+                f.seek(start)
+                lines = f.read(end - start).splitlines(True)
+                loaded[blocktype][block_id] = _parse_ir2_lines(lines, (blocktype, block_id, 0, len(lines)))
+
+    bytecode = Bytecode(loaded[BYTECODE_OFFSET_MAIN][0], loaded[BYTECODE_OFFSET_MISSION],
+                        loaded[BYTECODE_OFFSET_STREAMED], map(str, index["models"]), map(str, index["streams"]))
+    bytecode.label_table = {str(name): Offset(*pos) for name, pos in index["labels"].iteritems()}
+    return bytecode
+
+
+if __name__ == "__main__":
+    import sys
+    index = build_ir2_index(sys.argv[1])
+    write_ir2_index(sys.argv[1], index)
+    print("%d blocks, %d labels, %d script names" % (len(index["blocks"]), len(index["labels"]), len(index["script_names"])))
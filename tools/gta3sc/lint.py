@@ -0,0 +1,104 @@
+# -*- Python -*-
+"""
+Semantic checks of a loaded Config, beyond what the schema can tell.
+
+The name, id, hash and enum indexes are built once and every rule is checked in a
+single pass over the commands, alternators and enums, reporting all the problems.
+
+Usage:
+    py gta3sc/lint.py ../config/gtasa
+"""
+import sys
+
+from config import read_config, one_at_a_time
+from parallel import split_options
+import instrument
+
+__all__ = ["lint_config", "ARG_TYPES"]
+
+ARG_TYPES = frozenset(["ANY", "INT", "FLOAT", "PARAM", "LABEL", "TEXT_LABEL", "STRING", "BUFFER128"])
+BUILTIN_ENUMS = frozenset(["MODEL"]) # the models of the script being compiled
+
+ERROR = "error"
+WARNING = "warning"
+
+@instrument.timed("lint_config")
+def lint_config(config): # -> [(severity, message), ...]
+    problems = []
+    def report(severity, message, *args):
+        problems.append((severity, message % args))
+
+    enums = {}        # name -> [Enum, ...], read_config keeps the parts of an enum apart
+    for enum in config.enums:
+        if enum.name is not None:
+            enums.setdefault(enum.name, []).append(enum)
+
+    by_name = {}      # name -> Command
+    by_id = {}        # id -> Command
+    by_hash = {}      # one_at_a_time(name) -> Command
+    for cmd in config.commands:
+        other = by_name.get(cmd.name)
+        if other is not None:
+            report(ERROR, "command %s is defined more than once", cmd.name)
+            continue
+        by_name[cmd.name] = cmd
+
+        if cmd.id is not None:
+            other = by_id.setdefault(cmd.id, cmd)
+            # names sharing an id are fine as long as they mean the same command
+            if other is not cmd and not cmd.same_behaviour(other):
+                report(ERROR, "commands %s and %s have the id %s but different arguments", other.name, cmd.name, hex(cmd.id))
+
+        name_hash = one_at_a_time(cmd.name)
+        other = by_hash.setdefault(name_hash, cmd)
+        if other is not cmd:
+            report(ERROR, "commands %s and %s have the same hash 0x%.8x", other.name, cmd.name, name_hash)
+        if cmd.hash is not None and cmd.hash != name_hash:
+            report(ERROR, "command %s has hash 0x%.8x but its name hashes to 0x%.8x", cmd.name, cmd.hash, name_hash)
+
+        for i, arg in enumerate(cmd.args):
+            if arg.type not in ARG_TYPES:
+                report(ERROR, "argument %d of %s has unknown type %s", i, cmd.name, arg.type)
+            if arg.optional and i + 1 != len(cmd.args):
+                report(ERROR, "argument %d of %s is optional but not the last one", i, cmd.name)
+            if arg.entity is not None and len(arg.enums) > 0:
+                report(ERROR, "argument %d of %s has both entity %s and enum %s", i, cmd.name, arg.entity, arg.enums[0])
+            for name in arg.enums:
+                if name not in enums and name not in BUILTIN_ENUMS:
+                    report(ERROR, "argument %d of %s uses the undefined enum %s", i, cmd.name, name)
+
+    for alt in config.alternators:
+        for name in alt.alters:
+            if name not in by_name:
+                report(ERROR, "alternator %s lists the undefined command %s", alt.name, name)
+
+    for name, parts in sorted(enums.iteritems()):
+        values = {}   # constant -> value
+        names = {}    # value -> constant
+        for enum in parts:
+            for constant, value in sorted(enum.constants.iteritems(), key=lambda x: x[1]):
+                if values.setdefault(constant, value) != value:
+                    report(ERROR, "constant %s of enum %s is defined as both %d and %d", constant, name, values[constant], value)
+                other = names.setdefault(value, constant)
+                if other != constant:
+                    report(WARNING, "constants %s and %s of enum %s have the same value %d", other, constant, name, value)
+
+    return problems
+
+def main(argv): # -> exit status
+    args, options = split_options(argv)
+    if len(args) < 1:
+        print("Usage: lint.py <config_dir|xmlfile>... [--profile[=<file.pstats>]] [--memory-report]")
+        return 1
+    def run():
+        errors = 0
+        for path in args:
+            for severity, message in lint_config(read_config(path)):
+                print("%s: %s: %s" % (path, severity, message))
+                errors += (severity == ERROR)
+        return 1 if errors else 0
+    return instrument.run_tool(options, run)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
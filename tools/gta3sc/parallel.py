@@ -0,0 +1,75 @@
+# -*- Python -*-
+import glob
+import multiprocessing
+import os
+import sys
+
+from compression import strip_compression_ext
+from config import Config
+from flatconfig import share_config
+
+__all__ = ["parallel_map", "find_ir2_files", "split_options"]
+
+# Whether the pool starts its workers by forking this process, as multiprocessing does
+# everywhere but on Windows
+_POOL_FORKS = sys.platform != "win32"
+
+_worker_func = None
+_worker_shared = None
+
+def parallel_map(func, items, shared=None, workers=None, flat_config=False): # -> [func(shared, item), ...]
+    """
+    Calls func(shared, item) for each item in a process pool, returning the results in order.
+
+    The shared object (e.g. a loaded Config) is handed to the workers when the pool starts,
+    so on fork based platforms it is never pickled. Only the items and the results are.
+    Elsewhere it is pickled for each worker, unless it is a Config and flat_config tells
+    that func only needs what a FlatConfig has (the lookups and ArgDescriptors): then it is
+    handed over as one (see share_config), which pickles as its filename, and the file is
+    removed once the pool is done.
+    """
+    items = list(items)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = min(workers, len(items))
+    if workers <= 1:
+        return [func(shared, item) for item in items]
+    flat = None
+    if flat_config and not _POOL_FORKS and isinstance(shared, Config):
+        shared = flat = share_config(shared)
+    try:
+        pool = multiprocessing.Pool(workers, _init_worker, (func, shared))
+        try:
+            return pool.map(_run_worker, items, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        if flat is not None:
+            flat.close()
+
+def find_ir2_files(path): # -> sorted [filename, ...]
+    """Expands a directory (every *.ir2, compressed or not, inside it) or a glob pattern into a list of IR2 files."""
+    if os.path.isdir(path):
+        return sorted(os.path.join(path, f) for f in os.listdir(path) if strip_compression_ext(f).endswith(".ir2"))
+    return sorted(glob.glob(path)) or [path]
+
+def split_options(argv): # -> ([arg, ...], {name: value, ...})
+    """Splits --name=value and --flag options (value True) from the positional arguments."""
+    args, options = [], {}
+    for a in argv:
+        if a.startswith("--"):
+            split = a[2:].split('=', 1)
+            options[split[0]] = split[1] if len(split) > 1 else True
+        else:
+            args.append(a)
+    return args, options
+
+
+def _init_worker(func, shared):
+    global _worker_func, _worker_shared
+    _worker_func = func
+    _worker_shared = shared
+
+def _run_worker(item):
+    return _worker_func(_worker_shared, item)
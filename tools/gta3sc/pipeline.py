@@ -0,0 +1,115 @@
+# -*- Python -*-
+"""
+Runs config maintenance steps in order over a single load of a commands file.
+
+Each step is the transformation of one of the maintenance scripts next to this package
+(make_hash.py, simplify.py, ...) applied in process to the same Config, which is read
+once at the start and saved once at the end, instead of once per script.
+
+Usage:
+    py -m gta3sc pipeline ../config/gtasa/commands.xml hash simplify discover-supported=main.ir2
+    py -m gta3sc pipeline ../config/gtasa/commands.xml simplify=clear --output=min.xml
+"""
+import importlib
+import os
+import sys
+import time
+from collections import namedtuple
+
+from config import read_config
+from parallel import split_options
+import instrument
+
+__all__ = ["STEPS", "parse_steps", "run_pipeline"]
+
+TOOLS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# value is None for steps taking no value, "<...>" for a required one and "[...]" for an optional one
+Step = namedtuple("Step", ["func", "value", "help"])
+
+def _tool(name): # -> module of a script in the tools directory
+    if TOOLS_DIR not in sys.path:
+        sys.path.insert(0, TOOLS_DIR)
+    return importlib.import_module(name)
+
+def _hash(config, value, jobs):
+    _tool("make_hash").make_hash(config)
+
+def _simplify(config, value, jobs):
+    _tool("simplify").simplify(config, value == "clear")
+
+def _simplify_descs(config, value, jobs):
+    _tool("test").simplify_descs(config)
+
+def _discover_supported(config, value, jobs):
+    _tool("discover_supported_commands").discover_supported(config, value, jobs)
+
+def _properties_from_desc(config, value, jobs):
+    _tool("fix_sa").discover_properties_from_description({cmd.id: cmd for cmd in config.commands}, config.arg_index())
+
+STEPS = {
+    "hash":                 Step(_hash, None, "hash of every command name (make_hash.py)"),
+    "simplify":             Step(_simplify, "[clear]", "drop redundant descriptions, clear drops everything optional (simplify.py)"),
+    "simplify-descs":       Step(_simplify_descs, None, "shorten argument descriptions (test.py)"),
+    "discover-supported":   Step(_discover_supported, "<ir2_script|ir2_dir|ir2_glob>", "mark commands used by programs as supported (discover_supported_commands.py)"),
+    "properties-from-desc": Step(_properties_from_desc, None, "entities and enums of arguments from their descriptions (fix_sa.py)"),
+}
+
+def parse_steps(specs): # -> [(name, value or None), ...], raises ValueError
+    steps = []
+    for spec in specs:
+        name, sep, value = spec.partition("=")
+        value = value if sep else None
+        step = STEPS.get(name)
+        if step is None:
+            raise ValueError("unknown step %s" % name)
+        if value is None and step.value is not None and step.value.startswith("<"):
+            raise ValueError("step %s takes %s" % (name, step.value))
+        if value is not None and (step.value is None or (step.value.startswith("[") and value != step.value[1:-1])):
+            raise ValueError("step %s does not take %s" % (name, value))
+        steps.append((name, value))
+    return steps
+
+def run_pipeline(xmlfile, steps, output=None, jobs=None): # -> [(step, seconds), ...]
+    """Reads xmlfile, applies the (name, value) steps in order and saves to output (or back to xmlfile)."""
+    timings = []
+    def run(name, func, *args):
+        start = time.time()
+        with instrument.timer("pipeline.%s" % name):
+            result = func(*args)
+        timings.append((name, time.time() - start))
+        return result
+
+    config = run("read_config", read_config, xmlfile)
+    for name, value in steps:
+        run(name if value is None else "%s=%s" % (name, value), STEPS[name].func, config, value, jobs)
+    # each script saves what it changed, so the last one decides the layout: simplify.py
+    # writes a cleared config compactly, the others pretty print
+    pretty_print = len(steps) == 0 or steps[-1] != ("simplify", "clear")
+    run("save_config", config.save_config, output or xmlfile, pretty_print)
+    return timings
+
+def main(argv): # -> exit status
+    args, options = split_options(argv)
+    if len(args) < 2:
+        print("Usage: pipeline.py <xmlfile> <step[=value]>... [--output=<xmlfile>] [--jobs=N] [--profile[=<file.pstats>]] [--memory-report]")
+        print("Steps:")
+        for name, step in sorted(STEPS.items()):
+            value = "" if step.value is None else "[=%s]" % step.value[1:-1] if step.value.startswith("[") else "=" + step.value
+            print("    %-50s %s" % (name + value, step.help))
+        return 1
+    try:
+        steps = parse_steps(args[1:])
+    except ValueError as e:
+        print("pipeline: %s" % e)
+        return 1
+    timings = instrument.run_tool(options, run_pipeline, args[0], steps, output=options.get("output"),
+                                  jobs=int(options["jobs"]) if "jobs" in options else None)
+    for name, seconds in timings:
+        sys.stderr.write("%-40s %8.3f s\n" % (name, seconds))
+    sys.stderr.write("%-40s %8.3f s\n" % ("total", sum(seconds for name, seconds in timings)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
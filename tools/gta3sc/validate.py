@@ -0,0 +1,168 @@
+# -*- Python -*-
+"""
+RELAX NG validation of the configuration files, in process.
+
+The schema is compiled once into an lxml RelaxNG object. A compact syntax schema
+(schema.rnc) is read through the schema.rng next to it when that is up to date,
+otherwise it is converted with the rnc2rng package (--write-rng saves the conversion).
+
+Files are validated in a process pool, and a manifest of the files that passed (size,
+modification time and SHA-1) lets later runs skip those not modified since, as long as
+the schema did not change either.
+
+Usage:
+    py gta3sc/validate.py ../schema.rnc ../config [--jobs=N] [--force] [--manifest=<file>]
+    py gta3sc/validate.py ../schema.rnc --write-rng
+"""
+import json
+import os
+import re
+import sys
+from lxml import etree
+
+from cache import DEFAULT_CACHE_DIR, file_digest
+from compression import open_compressed, strip_compression_ext
+from parallel import parallel_map, split_options
+
+__all__ = ["rnc_to_rng", "compile_schema", "find_config_files", "validate_configs"]
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST = os.path.join(DEFAULT_CACHE_DIR, "validate-manifest.json")
+
+_RNG_GRAMMAR = "{http://relaxng.org/ns/structure/1.0}grammar"
+
+def rnc_to_rng(rnc_text): # -> RNG document text
+    import rnc2rng
+    # rnc2rng does not take documentation comments everywhere, they are plain comments here
+    text = re.sub(r"^(\s*)##", r"\1#", rnc_text, flags=re.M)
+    parser = etree.XMLParser(remove_blank_text=True) # reindented below
+    root = etree.fromstring(rnc2rng.dumps(rnc2rng.loads(text)).encode("utf-8"), parser)
+    # an explicit grammar { } ends up nested in the grammar rnc2rng always makes
+    if len(root) == 1 and root[0].tag == _RNG_GRAMMAR:
+        inner = root[0]
+        for name, value in root.attrib.items():
+            if inner.get(name) is None:
+                inner.set(name, value)
+        root = inner
+    return etree.tostring(root, pretty_print=True, xml_declaration=True, encoding="UTF-8")
+
+def rng_filename(schemafile):
+    return os.path.splitext(schemafile)[0] + ".rng"
+
+def compile_schema(schemafile): # -> etree.RelaxNG
+    if not schemafile.endswith(".rnc"):
+        return etree.RelaxNG(file=schemafile)
+    rngfile = rng_filename(schemafile)
+    if os.path.exists(rngfile) and os.path.getmtime(rngfile) >= os.path.getmtime(schemafile):
+        return etree.RelaxNG(file=rngfile)
+    try:
+        with open(schemafile) as f:
+            return etree.RelaxNG(etree.fromstring(rnc_to_rng(f.read())))
+    except ImportError:
+        if not os.path.exists(rngfile):
+            raise ImportError("compiling %s requires the rnc2rng package" % schemafile)
+        sys.stderr.write("warning: %s may be outdated, compiling %s requires the rnc2rng package\n" % (rngfile, schemafile))
+        return etree.RelaxNG(file=rngfile)
+
+def find_config_files(paths): # -> sorted [filename, ...]
+    """Expands directories (every XML file below them, compressed or not) into a list of files."""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            for dirpath, dirnames, filenames in os.walk(path):
+                result += [os.path.join(dirpath, f) for f in filenames if strip_compression_ext(f).endswith(".xml")]
+        else:
+            result.append(path)
+    return sorted(result)
+
+def validate_configs(files, schemafile, workers=None, manifest=None, force=False): # -> { filename: [error, ...] }
+    """
+    Validates the files against the schema, returning the errors of each validated file.
+
+    With manifest (a filename) the files unchanged since they passed are skipped, and
+    are thus missing from the result. force validates every file anyway.
+    """
+    schema_digest = file_digest(schemafile)
+    entries = {}
+    if manifest is not None and not force:
+        stored = _read_manifest(manifest)
+        if stored.get("version") == MANIFEST_VERSION and stored.get("schema") == schema_digest:
+            entries = stored["files"]
+
+    todo = [] # [(filename, manifest entry), ...]
+    for filename in files:
+        key = os.path.abspath(filename)
+        stat = os.stat(filename)
+        entry = entries.pop(key, None)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            entries[key] = entry
+            continue
+        digest = file_digest(filename)
+        if entry is not None and entry[2] == digest: # touched but the same
+            entries[key] = [stat.st_size, stat.st_mtime, digest]
+            continue
+        todo.append((filename, [stat.st_size, stat.st_mtime, digest]))
+
+    result = {}
+    if todo:
+        schema = compile_schema(schemafile)
+        errors = parallel_map(_validate_file, [filename for filename, entry in todo], shared=schema, workers=workers)
+        for (filename, entry), file_errors in zip(todo, errors):
+            result[filename] = file_errors
+            if not file_errors:
+                entries[os.path.abspath(filename)] = entry
+
+    if manifest is not None:
+        _write_manifest(manifest, {"version": MANIFEST_VERSION, "schema": schema_digest, "files": entries})
+    return result
+
+def _validate_file(schema, filename): # -> [error, ...]
+    try:
+        with open_compressed(filename, "rb") as f:
+            tree = etree.parse(f)
+    except etree.XMLSyntaxError as e:
+        return ["%s:%d:%d: %s" % (filename, e.position[0], e.position[1], e.msg)]
+    if schema.validate(tree):
+        return []
+    return ["%s:%d:%d: %s" % (filename, e.line, e.column, e.message) for e in schema.error_log]
+
+def _read_manifest(manifest): # -> manifest dict, empty if missing or unreadable
+    try:
+        with open(manifest) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def _write_manifest(manifest, data):
+    directory = os.path.dirname(os.path.abspath(manifest))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(manifest, "w") as f:
+        json.dump(data, f)
+
+def main(argv): # -> exit status
+    args, options = split_options(argv)
+    if len(args) < 1 or (len(args) < 2 and "write-rng" not in options):
+        print("Usage: validate.py <schema.rnc|schema.rng> <config_dir|xmlfile>... [--jobs=N] [--force] [--manifest=<file>]")
+        print("       validate.py <schema.rnc> --write-rng")
+        return 1
+    if "write-rng" in options:
+        with open(args[0]) as f:
+            rng = rnc_to_rng(f.read())
+        with open(rng_filename(args[0]), "wb") as f:
+            f.write(rng)
+        return 0
+    files = find_config_files(args[1:])
+    results = validate_configs(files, args[0], workers=int(options["jobs"]) if "jobs" in options else None,
+                               manifest=options.get("manifest", DEFAULT_MANIFEST), force="force" in options)
+    failed = 0
+    for filename in sorted(results):
+        for error in results[filename]:
+            print(error)
+        failed += bool(results[filename])
+    sys.stderr.write("%d files validated (%d failed), %d unchanged\n" % (len(results), failed, len(files) - len(results)))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,141 @@
+# -*- Python -*-
+"""
+Checks every instruction of a program against a Config, before analyzing or converting it.
+
+The argument descriptors of each command are turned once into a signature of argument
+counts and bitmasks of the argument kinds each position takes, so checking an argument
+is a table lookup and a bitwise test. All the problems are returned, not only the first.
+"""
+import sys
+
+import instrument
+from bytecode import Offset, BYTECODE_OFFSET_MAIN, BYTECODE_OFFSET_MISSION, BYTECODE_OFFSET_STREAMED
+from bytecode import DATATYPE_INT8, DATATYPE_INT16, DATATYPE_INT32, DATATYPE_FLOAT
+from bytecode import DATATYPES_LABEL, DATATYPES_STRING, DATATYPES_VARS_ALL
+from bytecode import DATATYPE_GLOBALVAR_NUMBER, DATATYPE_LOCALVAR_NUMBER
+from bytecode import DATATYPE_GLOBALVAR_ARRAY_NUMBER, DATATYPE_LOCALVAR_ARRAY_NUMBER
+
+__all__ = ["verify_program", "check_program", "format_offset"]
+
+KIND_LABEL   = 1
+KIND_INT     = 2
+KIND_FLOAT   = 4
+KIND_NUMVAR  = 8
+KIND_TEXTVAR = 16
+KIND_STRING  = 32
+KINDS_CONST  = KIND_INT | KIND_FLOAT | KIND_STRING
+
+_KIND_NAMES = {
+    KIND_LABEL:   "a label",
+    KIND_INT:     "an integer",
+    KIND_FLOAT:   "a float",
+    KIND_NUMVAR:  "a variable",
+    KIND_TEXTVAR: "a text label variable",
+    KIND_STRING:  "a string",
+}
+
+# Arg type -> kinds of argument taken, types missing here take anything
+_KINDS_OF_TYPE = {
+    "LABEL":      KIND_LABEL,
+    "INT":        KIND_INT | KIND_NUMVAR,
+    "FLOAT":      KIND_FLOAT | KIND_NUMVAR,
+    "PARAM":      KIND_INT | KIND_FLOAT | KIND_NUMVAR | KIND_TEXTVAR | KIND_STRING,
+    "TEXT_LABEL": KIND_STRING | KIND_TEXTVAR,
+    "STRING":     KIND_STRING | KIND_TEXTVAR,
+    "BUFFER128":  KIND_STRING,
+}
+
+def _kinds_of_datatypes(): # -> [kind of datatype, ...] indexed by datatype
+    kinds = [0] * (max(DATATYPES_VARS_ALL + DATATYPES_STRING) + 1)
+    kinds[DATATYPE_INT8] = kinds[DATATYPE_INT16] = kinds[DATATYPE_INT32] = KIND_INT
+    kinds[DATATYPE_FLOAT] = KIND_FLOAT
+    for datatype in DATATYPES_LABEL:
+        kinds[datatype] = KIND_LABEL
+    for datatype in DATATYPES_STRING:
+        kinds[datatype] = KIND_STRING
+    for datatype in DATATYPES_VARS_ALL:
+        kinds[datatype] = KIND_TEXTVAR
+    for datatype in (DATATYPE_GLOBALVAR_NUMBER, DATATYPE_LOCALVAR_NUMBER,
+                     DATATYPE_GLOBALVAR_ARRAY_NUMBER, DATATYPE_LOCALVAR_ARRAY_NUMBER):
+        kinds[datatype] = KIND_NUMVAR
+    return kinds
+
+_KIND_OF_DATATYPE = _kinds_of_datatypes()
+
+def _arg_check(arginfo): # -> (kinds taken, whether constants are taken)
+    kinds = _KINDS_OF_TYPE.get(arginfo.type, ~0)
+    return (kinds, arginfo.allow_const and not arginfo.out)
+
+def _signature(cmdinfo): # -> (min args, max args or None, (check, ...), tail check or None)
+    table = tuple(_arg_check(a) for a in cmdinfo.arg_table)
+    if cmdinfo.arg_tail is not None: # the optional last argument may be repeated or omitted
+        return (len(table) - 1, None, table, _arg_check(cmdinfo.arg_tail))
+    return (len(table), len(table), table, None)
+
+def format_offset(offset): # -> e.g. "main:10", "mission 2:31", "stream 5:0"
+    if offset.type == BYTECODE_OFFSET_MAIN:
+        return "main:%d" % offset.index
+    return "%s %d:%d" % ("mission" if offset.type == BYTECODE_OFFSET_MISSION else "stream", offset.block, offset.index)
+
+@instrument.timed("verify_program")
+def verify_program(bytecode, config): # -> [(Offset, message), ...] in program order
+    """
+    Checks that every command of the program is in the config, with a valid number of
+    arguments, each of a kind its parameter takes (no constants for outputs), and that
+    every label referenced is defined.
+    """
+    signatures = {cmd.name: _signature(cmd) for cmd in config.commands}
+    kind_of = _KIND_OF_DATATYPE
+    problems = []
+    label_refs = [] # [(Offset, name), ...], checked once every block was visited
+
+    blocks  = [(BYTECODE_OFFSET_MAIN, 0, bytecode.main_block)]
+    blocks += [(BYTECODE_OFFSET_MISSION, i, block) for i, block in enumerate(bytecode.mission_blocks)]
+    blocks += [(BYTECODE_OFFSET_STREAMED, i, block) for i, block in enumerate(bytecode.streamed_blocks)]
+    for blocktype, block_id, block in blocks:
+        for index, data in enumerate(block):
+            if not data.is_command():
+                continue
+            signature = signatures.get(data.name)
+            if signature is None:
+                problems.append((Offset(blocktype, block_id, index), "unknown command %s" % data.name))
+                continue
+            min_args, max_args, table, tail = signature
+            args = data.args
+            if len(args) < min_args or (max_args is not None and len(args) > max_args):
+                expected = ("%d" % min_args) if max_args is not None else ("at least %d" % min_args)
+                problems.append((Offset(blocktype, block_id, index), "%s takes %s arguments, given %d" % (data.name, expected, len(args))))
+            for i, arg in enumerate(args):
+                if i < len(table):
+                    kinds, const_ok = table[i]
+                elif tail is not None:
+                    kinds, const_ok = tail
+                else:
+                    break
+                kind = kind_of[arg.type]
+                if not kind & kinds:
+                    problems.append((Offset(blocktype, block_id, index), "argument %d of %s cannot be %s" % (i, data.name, _KIND_NAMES[kind])))
+                elif kind & KINDS_CONST and not const_ok:
+                    problems.append((Offset(blocktype, block_id, index), "argument %d of %s is an output, given a constant" % (i, data.name)))
+                if kind == KIND_LABEL:
+                    label_refs.append((Offset(blocktype, block_id, index), arg.value))
+
+    label_table = bytecode.label_table
+    unplaced = bytecode.unplaced_labels
+    problems += [(off, "label %s targets position %d, where no instruction starts" % (name, unplaced[name]) if name in unplaced else
+                       "undefined label %s" % name) for off, name in label_refs if name not in label_table]
+    problems.sort(key=lambda p: p[0])
+    return problems
+
+def check_program(bytecode, config, filename, strict=False): # -> [(Offset, message), ...]
+    """
+    Pre-flight of the tools: prints every problem of the program as a warning, or as an
+    error raising ValueError afterwards if strict.
+    """
+    problems = verify_program(bytecode, config)
+    severity = "error" if strict else "warning"
+    for offset, message in problems:
+        sys.stderr.write("%s:%s: %s: %s\n" % (filename, format_offset(offset), severity, message))
+    if problems and strict:
+        raise ValueError("%s does not match the config (%d problems)" % (filename, len(problems)))
+    return problems
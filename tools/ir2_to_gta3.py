@@ -2,10 +2,14 @@
 """
   Examples:
     py ir2_to_gta3.py main.ir2 ../config/gta3 output/
+    py ir2_to_gta3.py main.ir2 ../config/gtasa output/ --jobs=8
+    py ir2_to_gta3.py main.ir2 ../config/gtasa output/ --only=INTRO1
+    py ir2_to_gta3.py main.ir2 ../config/gtasa output/ --cache
 """
-import sys, os, errno
+import sys, os, errno, time
 import gta3sc
-from gta3sc.bytecode import VarInfo, Scope
+from gta3sc import instrument
+from gta3sc.bytecode import VarInfo, Scope, Offset
 from gta3sc.bytecode import DATATYPE_GLOBALVAR_NUMBER
 from gta3sc.bytecode import DATATYPE_GLOBALVAR_TEXTLABEL
 from gta3sc.bytecode import DATATYPE_GLOBALVAR_TEXTLABEL16
@@ -77,16 +81,16 @@ def converted_arg(ir2, arg, arginfo, global_vars, local_vars, enums=None, no_ind
                 output += "0"
             return output
         else:
-            if enums != None and len(arginfo.enums) > 0:
-                if arginfo.enums[0] == "MODEL":
+            if enums != None and arginfo.enum:
+                if arginfo.enum == "MODEL":
                     if arg.value < 0:
                         return ir2.get_model(-arg.value - 1) or str(arg.value)
                     else:
-                        return enums["DEFAULTMODEL"].get(arg.value) or str(arg.value)
+                        return enums["DEFAULTMODEL"].get_name(arg.value) or str(arg.value)
                 else:
-                    enum = enums.get(arginfo.enums[0])
+                    enum = enums.get(arginfo.enum)
                     if enum != None:
-                        return enum.get(arg.value, str(arg.value))
+                        return enum.get_name(arg.value, str(arg.value))
             elif enums != None and arginfo.desc.startswith("Bool") and arg.value in (0,1):
                 return ("FALSE", "TRUE")[arg.value]
             return str(arg.value)
@@ -138,14 +142,14 @@ def find_constant_for_var(argvar, argconst, global_vars, local_vars, enums):
 
     if len(var.enums) > 0:
         for ve in var.enums:
-            enum_dict = enums.get(ve)
-            if enum_dict is not None:
-                constant = enum_dict.get(argconst.value)
+            enum = enums.get(ve)
+            if enum is not None:
+                constant = enum.get_name(argconst.value)
                 if constant is not None:
                     break
 
     if constant is None:
-        constant = enums["DEFAULTMODEL"].get(argconst.value)
+        constant = enums["DEFAULTMODEL"].get_name(argconst.value)
 
     #assert constant != None
     if constant == None:
@@ -157,8 +161,8 @@ def find_constant_for_var(argvar, argconst, global_vars, local_vars, enums):
 
 def get_args_for_expr(ir2, data, cmdinfo, global_vars, local_vars, enums):
 
-    args = [converted_arg(ir2, data.args[0], cmdinfo.get_arg(0), global_vars, local_vars),
-            converted_arg(ir2, data.args[1], cmdinfo.get_arg(1), global_vars, local_vars)]
+    args = [converted_arg(ir2, data.args[0], cmdinfo.arg_descriptor(0), global_vars, local_vars),
+            converted_arg(ir2, data.args[1], cmdinfo.arg_descriptor(1), global_vars, local_vars)]
 
     if data.name.startswith("IS_CONSTANT_") or data.name.endswith("_CONSTANT"):
         tup = (1, 0) if data.name.endswith("_CONSTANT") else (0, 1)
@@ -228,7 +232,7 @@ def converted_data(ir2, data, commands, alternators, enums, global_vars, local_v
         elif cmdname == "GOSUB_FILE":
             assert data.args[1].is_label()
             arg1 = os.path.basename(filename_by_offset[ir2.offset_from_label(data.args[1].value)])
-            arg0 = converted_arg(ir2, data.args[0], cmdinfo.get_arg(0), global_vars, local_vars, enums=enums)
+            arg0 = converted_arg(ir2, data.args[0], cmdinfo.arg_descriptor(0), global_vars, local_vars, enums=enums)
             return "GOSUB_FILE %s %s" % (arg0, arg1)
         elif cmdname == "LAUNCH_MISSION":
             assert data.args[0].is_label()
@@ -248,12 +252,12 @@ def converted_data(ir2, data, commands, alternators, enums, global_vars, local_v
                     streamed_offset = ir2.offset_from_streamed(data.args[0].value)
                     output += " %s" % os.path.basename(filename_by_offset[streamed_offset])
                 else:
-                    output += " %s" % converted_arg(ir2, arg, cmdinfo.get_arg(i), global_vars, local_vars, enums=enums)
+                    output += " %s" % converted_arg(ir2, arg, cmdinfo.arg_descriptor(i), global_vars, local_vars, enums=enums)
             return output
         else:
             output += cmdname
-            for i, arg in enumerate(data.args):
-                output += " %s" % converted_arg(ir2, arg, cmdinfo.get_arg(i), global_vars, local_vars, enums=enums)
+            for arg, arginfo in zip(data.args, cmdinfo.arg_descriptors(len(data.args))):
+                output += " %s" % converted_arg(ir2, arg, arginfo, global_vars, local_vars, enums=enums)
             return output
     else:
         assert False
@@ -284,11 +288,26 @@ def print_vars(stream, vars, is_local, is_mission, tab=0):
     if any_var:
         stream.write("\n")
 
-def main(ir2file, configpath, output_dir):
+def main(ir2file, configpath, output_dir, jobs=None, only=None, cache=None, verify=True, strict=False):
 
     cmdline = dict(gta3sc.read_commandline(configpath))
-    config = gta3sc.read_config(configpath)
-    ir2 = gta3sc.read_ir2(ir2file)
+    config = gta3sc.read_config(configpath, intern=True)
+
+    if only is None:
+        ir2 = gta3sc.read_ir2(ir2file, workers=jobs)
+    else:
+        # only the block holding such script is read, through the IR2 index
+        index = gta3sc.load_ir2_index(ir2file)
+        only_block = gta3sc.find_script_block(index, only)
+        if only_block is None:
+            raise ValueError("no script named %s in %s" % (only, ir2file))
+        ir2 = gta3sc.read_ir2_blocks(ir2file, index, [only_block])
+        block_ids = [tuple(b[:2]) for b in index["blocks"]]
+        next_block = block_ids.index(tuple(only_block)) + 1
+        next_block_start = Offset(block_ids[next_block][0], block_ids[next_block][1], 0) if next_block < len(block_ids) else None
+
+    if verify:
+        gta3sc.check_program(ir2, config, ir2file, strict)
 
     scopes_before_label = bool(cmdline["-fscope-then-label"])
     timer_index = int(cmdline["-ftimer-index"])
@@ -300,171 +319,218 @@ def main(ir2file, configpath, output_dir):
 
     commands    = {cmd.name: cmd for cmd in config.commands}
     alternators = defaultdict(set, {alt.name: set(alt.alters) for alt in config.alternators})
-    enums       = {enum.name: {v: k for k,v in enum.constants.iteritems()} for enum in config.enums}
-
-    scopes = ir2.discover_scopes()
-    filename_by_offset = dict()
-    subscripts = dict()
-    gosubfiles = dict()
-    current_scope = None
-    first_scope = scopes[0] if len(scopes) > 0 else None
-    current_scope_name = None
-
-    for i in range(len(ir2.mission_blocks)):
-        script_offset = ir2.offset_from_mission(i)
-        script_name   = Scope.from_offset(script_offset, scopes).find_script_name(ir2)
-        filename_by_offset[script_offset] = "missions/%s.sc" % script_name.lower()
-
-    for i in range(len(ir2.streamed_blocks)):
-        script_offset = ir2.offset_from_streamed(i)
-        stream_name   = ir2.get_stream_name(i)
-        filename_by_offset[script_offset] = "streams/%s.sc" % stream_name.lower()
-
-    for off, data in ir2:
-        if data.is_command() and data.name == "LAUNCH_MISSION":
-            assert data.args[0].is_label()
-            script_offset = ir2.offset_from_label(data.args[0].value)
+    enums       = {enum.name: enum for enum in config.enums}
+
+    # a partially loaded program has different results, so it is never cached
+    with gta3sc.cached_analysis(ir2, ir2file, cache if only is None else None) as analysis:
+        scopes = analysis.discover_scopes()
+        filename_by_offset = dict()
+        subscripts = dict()
+        gosubfiles = dict()
+        current_scope = None
+        first_scope = scopes[0] if len(scopes) > 0 else None
+        current_scope_name = None
+
+        only_scope = None
+        if only is not None:
+            only_scope = next((s for s in scopes if (s.find_script_name(ir2) or "").lower() == only.lower()), None)
+            if only_scope is None:
+                raise ValueError("no script named %s in %s" % (only, ir2file))
+            main_start = Offset(BYTECODE_OFFSET_MAIN, 0, 0)
+            if only_scope.start != main_start:
+                # converts the wanted scope as if coming from the main script
+                first_scope = current_scope = Scope(main_start, main_start)
+
+        for i in range(len(ir2.mission_blocks)):
+            if len(ir2.mission_blocks[i]) == 0: # not loaded
+                continue
+            script_offset = ir2.offset_from_mission(i)
             script_name   = Scope.from_offset(script_offset, scopes).find_script_name(ir2)
-            filename = "%s.sc" % script_name.lower() if script_name else "subscript%d.sc" % len(subscripts)
-            filename_by_offset[script_offset] = filename
-            subscripts[script_offset] = filename
-        elif data.is_command() and data.name == "GOSUB_FILE":
-            assert data.args[1].is_label()
-            filename = "gosub%d.sc" % len(gosubs)
-            script_offset = ir2.offset_from_label(data.args[1].value)
-            filename_by_offset[script_offset] = filename
-            gosubfiles[script_offset] = filename
-
-    if farrays:
-        more_info = [v for (s,v) in SA_VAR_ARRAYS if s == None]
-    else:
-        more_info = None
+            filename_by_offset[script_offset] = "missions/%s.sc" % script_name.lower()
 
-    global_vars = ir2.discover_global_vars(config=config, more_info=more_info)
-    local_vars = None
+        for i in range(len(ir2.streamed_blocks)):
+            if len(ir2.streamed_blocks[i]) == 0:
+                continue
+            script_offset = ir2.offset_from_streamed(i)
+            stream_name   = ir2.get_stream_name(i)
+            filename_by_offset[script_offset] = "streams/%s.sc" % stream_name.lower()
+
+        for off, data in ir2:
+            if data.is_command() and data.name == "LAUNCH_MISSION":
+                assert data.args[0].is_label()
+                script_offset = ir2.offset_from_label(data.args[0].value)
+                script_name   = Scope.from_offset(script_offset, scopes).find_script_name(ir2)
+                filename = "%s.sc" % script_name.lower() if script_name else "subscript%d.sc" % len(subscripts)
+                filename_by_offset[script_offset] = filename
+                subscripts[script_offset] = filename
+            elif data.is_command() and data.name == "GOSUB_FILE":
+                assert data.args[1].is_label()
+                filename = "gosub%d.sc" % len(gosubs)
+                script_offset = ir2.offset_from_label(data.args[1].value)
+                filename_by_offset[script_offset] = filename
+                gosubfiles[script_offset] = filename
+
+        if only_scope is not None and only_scope.start.type == BYTECODE_OFFSET_MAIN and\
+           only_scope.start not in subscripts and only_scope.start not in gosubfiles:
+            # it would go to main.sc, whose global variables need the whole program
+            raise ValueError("script %s is part of main.sc, which --only does not convert" % only)
+
+        if farrays:
+            more_info = [v for (s,v) in SA_VAR_ARRAYS if s == None]
+        else:
+            more_info = None
 
-    print("//--------------------------")
+        global_vars = analysis.discover_global_vars(config=config, more_info=more_info, workers=jobs)
+        local_vars = None
 
-    try:
-        os.makedirs(os.path.join(output_dir, "main"))
-        os.makedirs(os.path.join(output_dir, "main", "missions"))
-        os.makedirs(os.path.join(output_dir, "main", "streams"))
-    except OSError as e:
-        if e.errno != errno.EEXIST:
-            raise
+        print("//--------------------------")
 
-    stream = open(os.path.join(output_dir, "main.sc"), 'w')
+        try:
+            os.makedirs(os.path.join(output_dir, "main"))
+            os.makedirs(os.path.join(output_dir, "main", "missions"))
+            os.makedirs(os.path.join(output_dir, "main", "streams"))
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
 
-    got_mission_terminate = [None] # hack
-    is_mission = False
-    print_script_terminate_for = None
+        # with --only, nothing before the wanted script is written, main.sc is left as it is
+        stream = open(os.path.join(output_dir, "main.sc") if only_scope is None else os.devnull, 'w')
 
-    print_vars(stream, global_vars, False, False)
+        got_mission_terminate = [None] # hack
+        is_mission = False
+        print_script_terminate_for = None
 
-    for off, data in ir2:
+        if only_scope is None:
+            print_vars(stream, global_vars, False, False)
 
-        if print_script_terminate_for != None:
-            if print_script_terminate_for.type != BYTECODE_OFFSET_STREAMED or print_script_terminate_for.block != off.block:
-                if print_script_terminate_for.type == BYTECODE_OFFSET_STREAMED:
+        def write_script_terminate(terminated_at, next_off): # the end of the script terminated at terminated_at, reaching next_off
+            if terminated_at.type != BYTECODE_OFFSET_STREAMED or terminated_at.block != next_off.block:
+                if terminated_at.type == BYTECODE_OFFSET_STREAMED:
                     stream.write("}\n")
-                stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[print_script_terminate_for.type])
+                stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[terminated_at.type])
                 got_mission_terminate[0] = True
             else:
                 stream.write("    TERMINATE_THIS_SCRIPT\n")
-            print_script_terminate_for = None
-
-        def on_scope_begin(old_scope, new_scope):
-            print("Converting %s" % current_scope_name)
-            if new_scope.start in subscripts or (old_scope.start.type != new_scope.start.type or old_scope.start.block != new_scope.start.block):
-                if new_scope.start.type != BYTECODE_OFFSET_MAIN or new_scope.start in subscripts:
-                    stream.write("%s\n" % ("MISSION_START", "MISSION_START", "SCRIPT_START")[new_scope.start.type])
-                    got_mission_terminate[0] = False
-        def on_scope_end(old_scope, new_scope):
-            if old_scope.start in subscripts or (old_scope.start.type != new_scope.start.type or old_scope.start.block != new_scope.start.block):
-                if old_scope.start.type != BYTECODE_OFFSET_MAIN or old_scope.start in subscripts:
-                    #stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[old_scope.start.type])
-                    got_mission_terminate[0] = None
-
-        def write_data(tab=0):
-            tabing = ' ' * (tab*4)
-            if data.is_label(): stream.write("\n")
-            line = converted_data(ir2, data, commands, alternators, enums, global_vars, local_vars, filename_by_offset=filename_by_offset)
-            stream.write("%s%s\n" % (tabing, line))
-
-        if current_scope == None:
-            if first_scope != None and off >= first_scope.start:
+
+        convert = instrument.timer("ir2_to_gta3.convert").start()
+        scope_started = time.time()
+        for off, data in (ir2 if only_scope is None else only_scope.iter_data(ir2)):
+
+            if print_script_terminate_for != None:
+                write_script_terminate(print_script_terminate_for, off)
+                print_script_terminate_for = None
+
+            def on_scope_begin(old_scope, new_scope):
+                print("Converting %s" % current_scope_name)
+                if new_scope.start in subscripts or (old_scope.start.type != new_scope.start.type or old_scope.start.block != new_scope.start.block):
+                    if new_scope.start.type != BYTECODE_OFFSET_MAIN or new_scope.start in subscripts:
+                        stream.write("%s\n" % ("MISSION_START", "MISSION_START", "SCRIPT_START")[new_scope.start.type])
+                        got_mission_terminate[0] = False
+            def on_scope_end(old_scope, new_scope):
+                if old_scope.start in subscripts or (old_scope.start.type != new_scope.start.type or old_scope.start.block != new_scope.start.block):
+                    if old_scope.start.type != BYTECODE_OFFSET_MAIN or old_scope.start in subscripts:
+                        #stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[old_scope.start.type])
+                        got_mission_terminate[0] = None
+
+            def write_data(tab=0):
+                tabing = ' ' * (tab*4)
+                if data.is_label(): stream.write("\n")
+                line = converted_data(ir2, data, commands, alternators, enums, global_vars, local_vars, filename_by_offset=filename_by_offset)
+                stream.write("%s%s\n" % (tabing, line))
+
+            if current_scope == None:
+                if first_scope != None and off >= first_scope.start:
+                    current_scope = Scope.from_offset(off, scopes)
+                    assert current_scope != None
+            elif not current_scope.owns_offset(off):
+                now = time.time()
+                instrument.add_time("ir2_to_gta3.convert_scope", now - scope_started)
+                scope_started = now
+
+                previous_scope = current_scope
+                if current_scope != first_scope and previous_scope.start.type != BYTECODE_OFFSET_STREAMED:
+                    stream.write("}\n")
                 current_scope = Scope.from_offset(off, scopes)
                 assert current_scope != None
-        elif not current_scope.owns_offset(off):
-            previous_scope = current_scope
-            if current_scope != first_scope and previous_scope.start.type != BYTECODE_OFFSET_STREAMED:
-                stream.write("}\n")
-            current_scope = Scope.from_offset(off, scopes)
-            assert current_scope != None
-
-            current_scope_name = current_scope.find_script_name(ir2)
-            if current_scope_name is None:
-                current_scope_name = "??"
-
-            on_scope_end(previous_scope, current_scope)
-
-            if off.type != BYTECODE_OFFSET_MAIN:
-                stream.close()
-                stream = open(os.path.join(output_dir, "main", filename_by_offset[off]), 'w')
-            elif off in subscripts or off in gosubfiles:
-                filename = subscripts.get(off) or gosubfiles.get(off)
-                stream.close()
-                stream = open(os.path.join(output_dir, "main", filename), 'w')
-
-            on_scope_begin(previous_scope, current_scope)
-
-            if farrays and current_scope_name != None:
-                more_info = [v for (s,v) in SA_VAR_ARRAYS if s == current_scope_name]
-            else:
-                more_info = None
 
-            local_vars = ir2.discover_local_vars(current_scope, config=config, more_info=more_info)
+                current_scope_name = current_scope.find_script_name(ir2)
+                if current_scope_name is None:
+                    current_scope_name = "??"
 
-            is_mission = (current_scope.start.type == BYTECODE_OFFSET_MISSION)
-            is_stream  = (current_scope.start.type == BYTECODE_OFFSET_STREAMED)
+                on_scope_end(previous_scope, current_scope)
 
-            if data.is_label():
-                if scopes_before_label:
-                    stream.write("\n{")
-                    write_data(tab=1)
-                    print_vars(stream, local_vars, True, is_mission, tab=1)
-                    continue
+                if off.type != BYTECODE_OFFSET_MAIN:
+                    stream.close()
+                    stream = open(os.path.join(output_dir, "main", filename_by_offset[off]), 'w')
+                elif off in subscripts or off in gosubfiles:
+                    filename = subscripts.get(off) or gosubfiles.get(off)
+                    stream.close()
+                    stream = open(os.path.join(output_dir, "main", filename), 'w')
+
+                on_scope_begin(previous_scope, current_scope)
+
+                if farrays and current_scope_name != None:
+                    more_info = [v for (s,v) in SA_VAR_ARRAYS if s == current_scope_name]
+                else:
+                    more_info = None
+
+                local_vars = analysis.discover_local_vars(current_scope, config=config, more_info=more_info)
+
+                is_mission = (current_scope.start.type == BYTECODE_OFFSET_MISSION)
+                is_stream  = (current_scope.start.type == BYTECODE_OFFSET_STREAMED)
+
+                if data.is_label():
+                    if scopes_before_label:
+                        stream.write("\n{")
+                        write_data(tab=1)
+                        print_vars(stream, local_vars, True, is_mission, tab=1)
+                        continue
+                    else:
+                        write_data(tab=0)
+                        stream.write("{\n")
+                        print_vars(stream, local_vars, True, is_mission, tab=1)
+                        continue
                 else:
-                    write_data(tab=0)
                     stream.write("{\n")
                     print_vars(stream, local_vars, True, is_mission, tab=1)
-                    continue
-            else:
-                stream.write("{\n")
-                print_vars(stream, local_vars, True, is_mission, tab=1)
 
-        if got_mission_terminate[0] == False and\
-           data.is_command() and data.name == "TERMINATE_THIS_SCRIPT":
-           print_script_terminate_for = off
-        else:
-            tab = int(current_scope != None and current_scope != first_scope)
-            if got_mission_terminate[0] == False and not is_stream:
-                tab += 1
-            write_data(tab=tab)
+            if got_mission_terminate[0] == False and\
+               data.is_command() and data.name == "TERMINATE_THIS_SCRIPT":
+               print_script_terminate_for = off
+            else:
+                tab = int(current_scope != None and current_scope != first_scope)
+                if got_mission_terminate[0] == False and not is_stream:
+                    tab += 1
+                write_data(tab=tab)
 
-    if current_scope != None and current_scope != first_scope:
-        stream.write("}\n")
+    next_off = None
+    if only_scope is not None:
+        next_off = only_scope.end if only_scope.end is not None else next_block_start
 
-    if print_script_terminate_for != None:
-        stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[print_script_terminate_for.type])
+    if next_off is not None:
+        # the script is followed by others, thus ends as a whole conversion ends it on reaching them
+        if print_script_terminate_for != None:
+            write_script_terminate(print_script_terminate_for, next_off)
+        if current_scope != None and current_scope != first_scope and current_scope.start.type != BYTECODE_OFFSET_STREAMED:
+            stream.write("}\n")
+    else:
+        if current_scope != None and current_scope != first_scope:
+            stream.write("}\n")
+        if print_script_terminate_for != None:
+            stream.write("%s\n" % ("MISSION_END", "MISSION_END", "SCRIPT_END")[print_script_terminate_for.type])
+    instrument.add_time("ir2_to_gta3.convert_scope", time.time() - scope_started)
+    convert.stop()
 
     if stream != sys.stdout:
         stream.close()
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: discover_entity_commands.py <ir2_script> <configpath> <output_dir>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 3:
+        print("Usage: ir2_to_gta3.py <ir2_script> <configpath> <output_dir> [--jobs=N] [--only=<script_name>] [--cache[=<dir>]] [--no-verify|--strict] [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2], sys.argv[3])
+    instrument.run_tool(options, main, args[0], args[1], args[2],
+                        jobs=int(options["jobs"]) if "jobs" in options else None, only=options.get("only"),
+                        cache=options.get("cache"), verify="no-verify" not in options, strict="strict" in options)
 
@@ -2,20 +2,23 @@
 """
 """
 import gta3sc
+from gta3sc import instrument
 from gta3sc.config import one_at_a_time
 import sys
 
-def main(xmlfile):
-    config = gta3sc.read_config(xmlfile)
-
+def make_hash(config):
     for cmd in config.commands:
         cmd.hash = one_at_a_time(cmd.name)
 
+def main(xmlfile):
+    config = gta3sc.read_config(xmlfile)
+    make_hash(config)
     config.save_config(xmlfile)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: make_hash.py <xmlfile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 1:
+        print("Usage: make_hash.py <xmlfile> [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1])
+    instrument.run_tool(options, main, args[0])
@@ -5,6 +5,7 @@
     py simplify.py gtasa/commands.xml any_2nd_arg_will_trigger_clear_useless
 """
 import gta3sc
+from gta3sc import instrument
 import sys
 
 AMBIGOUS_DESCRIPTION_ENTITY = {
@@ -48,23 +49,25 @@ AMBIGOUS_DESCRIPTION_ENUM = {
     "Explosion ID": ("EXPLOSION"),
 }
 
-def main(xmlfile, clear_useless_data):
-    config = gta3sc.read_config(xmlfile)
+def simplify(config, clear_useless_data):
     commands = config.commands
 
     # Remove description from where Entity and Enum information is enough.
-    for cmd in commands:
-        for arg in cmd.args:
-            amb_entity = AMBIGOUS_DESCRIPTION_ENTITY.get(arg.desc)
-            amb_enum   = AMBIGOUS_DESCRIPTION_ENUM.get(arg.desc)
-            if amb_entity and arg.entity and arg.entity in amb_entity:
-                arg.desc = ""
-            if amb_enum and len(arg.enums) > 0 and arg.enums[0] in amb_enum:
-                arg.desc = ""
+    index = config.arg_index()
+    for desc in set(AMBIGOUS_DESCRIPTION_ENTITY) | set(AMBIGOUS_DESCRIPTION_ENUM):
+        amb_entity = AMBIGOUS_DESCRIPTION_ENTITY.get(desc)
+        amb_enum   = AMBIGOUS_DESCRIPTION_ENUM.get(desc)
+        for cmd, i in index.find("desc", desc):
+            arg = cmd.args[i]
+            if (amb_entity and arg.entity and arg.entity in amb_entity) or\
+               (amb_enum and len(arg.enums) > 0 and arg.enums[0] in amb_enum):
+                index.set(cmd, i, "desc", "")
 
     if clear_useless_data:
+        # the index is kept in sync, so later steps of a pipeline can use it
         new_commands = []
         for cmd in commands:
+            index.remove_command(cmd)
             if cmd.supported == False:
                 continue
             for a in cmd.args:
@@ -74,16 +77,20 @@ def main(xmlfile, clear_useless_data):
                 a.allow_const = True
                 a.allow_gvar = True
                 a.allow_lvar = True
+            cmd.update_arg_table()
+            index.add_command(cmd)
             new_commands.append(cmd)
-    else:
-        # Simply rewriting the XML will simplify it.
-        new_commands = commands
+        commands[:] = new_commands
+    # else simply rewriting the XML will simplify it.
 
-    config.commands = new_commands
+def main(xmlfile, clear_useless_data):
+    config = gta3sc.read_config(xmlfile)
+    simplify(config, clear_useless_data)
     config.save_config(xmlfile, pretty_print=(not clear_useless_data))
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: simplify.py <xmlfile> <[clear_useless_data]>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 1:
+        print("Usage: simplify.py <xmlfile> <[clear_useless_data]> [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], len(sys.argv) > 2)
+    instrument.run_tool(options, main, args[0], len(args) > 1)
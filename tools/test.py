@@ -1,47 +1,55 @@
 #!/usr/bin/env python2
 import gta3sc
+from gta3sc import instrument
 import sys
 
-def main(xmlfile, clear_useless_data):
-    config = gta3sc.read_config(xmlfile)
-    commands = config.commands
+def simplify_desc(desc):
+    if desc[0] in ['X', 'Y', 'Z'] or desc in ["Radius", "Angle", "Rotation"]:
+        return desc
+    elif desc.startswith("Script ID"):
+        return "Streamed Script"
+    elif desc.startswith("Time"):
+        return "Time"
+    elif desc.startswith("Boolean"):
+        return "Bool"
+    elif desc.startswith("Width"):
+        return "Width"
+    elif desc.startswith("Height"):
+        return "Height"
+    elif desc == "Red (0-255)":
+        return "Red"
+    elif desc == "Green (0-255)":
+        return "Green"
+    elif desc == "Blue (0-255)":
+        return "Blue"
+    elif desc == "Alpha (0-255)":
+        return "Alpha"
+    elif desc == "2D Pixel X":
+        return "2D Pixel X"
+    elif desc == "2D Pixel Y":
+        return "2D Pixel Y"
+    else:
+        return ""
+
+def simplify_descs(config):
+    index = config.arg_index()
 
-    myset = set()
-    for cmd in commands:
-        for arg in cmd.args:
-            if arg.desc:
-                if arg.desc[0] in ['X', 'Y', 'Z'] or arg.desc in ["Radius", "Angle", "Rotation"]:
-                    arg.desc = arg.desc
-                elif arg.desc.startswith("Script ID"):
-                    arg.desc = "Streamed Script"
-                elif arg.desc.startswith("Time"):
-                    arg.desc = "Time"
-                elif arg.desc.startswith("Boolean"):
-                    arg.desc = "Bool"
-                elif arg.desc.startswith("Width"):
-                    arg.desc = "Width"
-                elif arg.desc.startswith("Height"):
-                    arg.desc = "Height"
-                elif arg.desc == "Red (0-255)":
-                    arg.desc = "Red"
-                elif arg.desc == "Green (0-255)":
-                    arg.desc = "Green"
-                elif arg.desc == "Blue (0-255)":
-                    arg.desc = "Blue"
-                elif arg.desc == "Alpha (0-255)":
-                    arg.desc = "Alpha"
-                elif arg.desc == "2D Pixel X":
-                    arg.desc = "2D Pixel X"
-                elif arg.desc == "2D Pixel Y":
-                    arg.desc = "2D Pixel Y"
-                else:
-                    arg.desc = ""
+    # once per distinct description, touching only the args having it, all looked up
+    # before any change, so that a new description is not simplified again
+    changes = [(index.find("desc", desc), simplify_desc(desc)) for desc in index.values("desc")]
+    for postings, new_desc in changes:
+        for cmd, i in postings:
+            index.set(cmd, i, "desc", new_desc)
 
+def main(xmlfile, clear_useless_data):
+    config = gta3sc.read_config(xmlfile)
+    simplify_descs(config)
     config.save_config(xmlfile)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: test.py <xmlfile>")
+    args, options = gta3sc.split_options(sys.argv[1:])
+    if len(args) < 1:
+        print("Usage: test.py <xmlfile> [--profile[=<file.pstats>]] [--memory-report]")
         sys.exit(1)
-    main(sys.argv[1], len(sys.argv) > 2)
+    instrument.run_tool(options, main, args[0], len(args) > 1)
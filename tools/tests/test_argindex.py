@@ -0,0 +1,74 @@
+#!/usr/bin/env python2
+"""
+  Tests of gta3sc.ArgIndex over the small config in tests/data.
+
+  Examples:
+    py tests/test_argindex.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import unittest
+import gta3sc
+import fix_sa
+import simplify
+
+COMMANDS_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "commands.xml")
+
+class ArgIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = gta3sc.read_config(COMMANDS_XML)
+        self.index = self.config.arg_index()
+
+    def test_set_updates_arg_tables(self):
+        cmd = self.config.get_command("GIVE_WEAPON_TO_CHAR")
+        behaviour = cmd.behaviour
+        self.index.set(cmd, 2, "desc", "Bullets")
+        self.index.set(cmd, 0, "entity", "PLAYER")
+        self.index.set(cmd, 1, "enum", "FADE")
+        descriptors = cmd.arg_descriptors(3)
+        self.assertEqual((descriptors[2].desc, descriptors[0].entity, descriptors[1].enum), ("Bullets", "PLAYER", "FADE"))
+        self.assertIs(cmd.behaviour, behaviour)
+        self.assertEqual(self.index.find("desc", "Bullets"), [(cmd, 2)])
+        self.assertEqual(self.index.find("desc", "Ammo"), [])
+
+    def test_set_enum_keeps_the_others(self):
+        cmd = self.config.get_command("DO_FADE")
+        cmd.args[1].enums.append("WEAPONTYPE")
+        self.index.set(cmd, 1, "enum", "PAD")
+        self.assertEqual(cmd.args[1].enums, ["PAD", "WEAPONTYPE"])
+        self.index.set(cmd, 1, "enum", None)
+        self.assertEqual(cmd.args[1].enums, ["WEAPONTYPE"])
+        self.assertEqual(self.index.find("enum", "WEAPONTYPE"), [(self.config.get_command("GIVE_WEAPON_TO_CHAR"), 1), (cmd, 1)])
+        self.assertEqual(self.index.find("enum", "PAD"), [])
+
+    def test_rebuilt_for_other_commands(self):
+        self.config.commands = [cmd for cmd in self.config.commands if cmd.supported]
+        index = self.config.arg_index()
+        self.assertIsNot(index, self.index)
+        self.assertEqual([cmd.name for cmd, i in index.find("entity", "CHAR")], ["GIVE_WEAPON_TO_CHAR"])
+
+    def test_kept_by_simplify_clear(self):
+        simplify.simplify(self.config, True)
+        self.assertIs(self.config.arg_index(), self.index)
+        self.assertEqual(self.index.find("desc", "Time in ms"), [])
+        self.assertEqual(self.index.find("enum", "WEAPONTYPE"), [])
+        self.assertEqual(self.index.postings, gta3sc.ArgIndex(self.config.commands).postings)
+
+    def test_kept_by_properties_from_desc(self):
+        cmd = self.config.get_command("IS_CHAR_IN_AREA_3D")
+        self.index.set(cmd, 0, "entity", None)
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                fix_sa.discover_properties_from_description({c.id: c for c in self.config.commands}, self.index)
+            finally:
+                sys.stdout = stdout
+        self.assertEqual(cmd.arg_descriptors(3)[0].entity, "CHAR")
+        self.assertIs(self.config.arg_index(), self.index)
+        self.assertEqual(self.index.postings, gta3sc.ArgIndex(self.config.commands).postings)
+
+
+if __name__ == "__main__":
+    unittest.main()
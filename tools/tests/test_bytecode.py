@@ -0,0 +1,56 @@
+#!/usr/bin/env python2
+"""
+  Tests of the IR2 text written by str(Bytecode) and gta3sc.bytecode.write_ir2.
+
+  Examples:
+    py tests/test_bytecode.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import shutil
+import tempfile
+import unittest
+import gta3sc
+from gta3sc.bytecode import write_ir2
+
+MAIN_IR2 = """\
+#DEFINE_MODEL CHEETAH
+#DEFINE_STREAM INTRO
+MAIN_1:
+WAIT 0i8
+IS_CHAR_IN_AREA_3D s&8 v&12 1@v
+#MISSION_BLOCK_START 0
+MISSION_1:
+WAIT 100i16
+#MISSION_BLOCK_END
+"""
+
+class WriteTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ir2file = os.path.join(self.tmpdir, "main.ir2")
+        with open(self.ir2file, "w") as f:
+            f.write(MAIN_IR2)
+        self.ir2 = gta3sc.read_ir2(self.ir2file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_str(self):
+        # as ever, without the models and stream names, and TEXTLABEL16 variables written as TEXTLABEL ones
+        self.assertEqual(str(self.ir2), "MAIN_1:\nWAIT 0i8\nIS_CHAR_IN_AREA_3D s&8 s&12 1@s\n"
+                                        "#MISSION_BLOCK_START 0\nMISSION_1:\nWAIT 100i16\n#MISSION_BLOCK_END")
+
+    def test_write_ir2(self):
+        written = os.path.join(self.tmpdir, "written.ir2")
+        write_ir2(self.ir2, written)
+        with open(written) as f:
+            self.assertEqual(f.read(), "#DEFINE_MODEL CHEETAH\n#DEFINE_STREAM INTRO\n" + str(self.ir2) + "\n")
+        reread = gta3sc.read_ir2(written)
+        self.assertEqual((reread.models, reread.stream_names), (["CHEETAH"], ["INTRO"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
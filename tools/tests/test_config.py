@@ -0,0 +1,198 @@
+#!/usr/bin/env python2
+"""
+  Tests of gta3sc.config over the small config in tests/data.
+
+  Examples:
+    py tests/test_config.py
+    py -m unittest discover tests
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import copy
+import cPickle
+import pickle
+import tempfile
+import unittest
+import gta3sc
+from gta3sc.config import Config, Enum
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+COMMANDS_XML = os.path.join(DATA_DIR, "commands.xml")
+EXTENSIONS_XML = os.path.join(DATA_DIR, "extensions.xml")
+
+def descriptor_fields(d):
+    return None if d is None else (d.type, d.out, d.optional, d.allow_const, d.enum, d.entity, d.desc)
+
+def command_fields(cmd):
+    return None if cmd is None else (cmd.name, cmd.id, cmd.hash, cmd.supported, cmd.internal, cmd.extension,
+                                     [arg.key() for arg in cmd.args],
+                                     [descriptor_fields(d) for d in cmd.arg_descriptors(len(cmd.args) + 1)])
+
+def config_fields(config): # -> what the tools read from a config, comparable between configs
+    return ([command_fields(cmd) for cmd in config.commands],
+            [(enum.name, enum.is_global, enum.constants, [enum.get_name(v) for v in range(-1, 30)]) for enum in config.enums],
+            [(alt.name, list(alt.alters)) for alt in config.alternators])
+
+class PickleTest(unittest.TestCase):
+
+    def round_trips(self, config): # -> [(how, copy of config), ...]
+        return ([("pickle protocol %d" % p, pickle.loads(pickle.dumps(config, p))) for p in range(3)] +
+                [("cPickle protocol %d" % p, cPickle.loads(cPickle.dumps(config, p))) for p in range(3)] +
+                [("deepcopy", copy.deepcopy(config))])
+
+    def check_round_trips(self, config):
+        for how, other in self.round_trips(config):
+            self.assertEqual(config_fields(other), config_fields(config), how)
+            for cmd, other_cmd in zip(config.commands, other.commands):
+                self.assertTrue(other_cmd.same_behaviour(cmd), how)
+
+    def test_config(self):
+        self.check_round_trips(gta3sc.read_config(COMMANDS_XML))
+
+    def test_interned_config(self):
+        config = gta3sc.read_config(COMMANDS_XML, intern=True)
+        self.check_round_trips(config)
+        for how, other in self.round_trips(config):
+            with self.assertRaises(TypeError):
+                other.commands[0].args[0].desc = "changed"
+            with self.assertRaises(TypeError):
+                other.get_command("DO_FADE").args[1].enums.append("WEAPONTYPE")
+
+    def test_frozen_config(self):
+        config = gta3sc.read_config(COMMANDS_XML)
+        config.freeze()
+        self.check_round_trips(config)
+        for how, other in self.round_trips(config):
+            self.assertTrue(other.frozen, how)
+            with self.assertRaises(TypeError):
+                other.get_command("WAIT").id = 2
+            with self.assertRaises(TypeError):
+                other.get_enum("FADE").constants["FADE_NONE"] = 2
+
+    def test_overlay(self):
+        overlay = gta3sc.read_config(EXTENSIONS_XML, base=gta3sc.read_config(COMMANDS_XML))
+        self.check_round_trips(overlay)
+        for how, other in self.round_trips(overlay):
+            self.assertEqual(config_fields(other.base), config_fields(overlay.base), how)
+            self.assertEqual([cmd.name for cmd in other.own_commands], [cmd.name for cmd in overlay.own_commands], how)
+
+class InternTest(unittest.TestCase):
+
+    def test_args_shared(self):
+        config = gta3sc.read_config(COMMANDS_XML, intern=True)
+        other = gta3sc.read_config(COMMANDS_XML, intern=True)
+        cmd = config.get_command("DO_FADE")
+        self.assertIs(other.get_command("DO_FADE").args, cmd.args)
+        self.assertIsInstance(cmd.args, list)
+        with self.assertRaisesRegexp(TypeError, "assign a new list"):
+            cmd.args.append(cmd.args[0])
+        cmd.args = list(cmd.args[:1])
+        cmd.update_arg_table()
+        self.assertEqual(len(cmd.arg_descriptors(1)), 1)
+        self.assertEqual(len(other.get_command("DO_FADE").args), 2)
+
+    def test_clear_interned(self):
+        config = gta3sc.read_config(COMMANDS_XML, intern=True)
+        gta3sc.config.clear_interned()
+        self.assertEqual((gta3sc.config._interned_args, gta3sc.config._interned_signatures), ({}, {}))
+        other = gta3sc.read_config(COMMANDS_XML, intern=True)
+        self.assertIsNot(other.get_command("DO_FADE").args, config.get_command("DO_FADE").args)
+        self.assertEqual(config_fields(other), config_fields(config))
+
+class OverlayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.base = gta3sc.read_config(COMMANDS_XML)
+        self.overlay = gta3sc.read_config(EXTENSIONS_XML, base=self.base)
+        # the same files read one after another into a single config
+        self.config = Config()
+        self.config.read_config(COMMANDS_XML)
+        self.config.read_config(EXTENSIONS_XML)
+
+    def test_lookups(self):
+        names = [cmd.name for cmd in self.config.commands]
+        for name in names + ["MISSING"]:
+            self.assertEqual(command_fields(self.overlay.get_command(name)), command_fields(self.config.get_command(name)), name)
+        for enum in self.config.enums:
+            self.assertEqual(self.overlay.get_enum(enum.name).constants, enum.constants)
+        for alt in self.config.alternators:
+            self.assertEqual(list(self.overlay.get_alternator(alt.name).alters), alt.alters)
+        self.assertIsNone(self.overlay.get_enum("MISSING"))
+        self.assertEqual([cmd.name for cmd in self.overlay.commands], sorted(set(names), key=names.index))
+
+    def test_base_frozen_in_place(self):
+        self.assertTrue(self.base.frozen)
+        self.assertIs(self.overlay.get_command("WAIT"), self.base.get_command("WAIT"))
+        self.assertEqual(len(self.base.get_command("IS_CHAR_IN_AREA_3D").args), 3)
+        with self.assertRaises(TypeError):
+            self.base.get_command("WAIT").args = []
+
+    def test_writable_command(self):
+        cmd = self.overlay.writable_command("WAIT")
+        cmd.args[0].desc = "Time"
+        cmd.update_arg_table()
+        self.assertIs(self.overlay.get_command("WAIT"), cmd)
+        self.assertEqual(self.overlay.get_command("WAIT").arg_descriptors(1)[0].desc, "Time")
+        self.assertEqual(self.base.get_command("WAIT").arg_descriptors(1)[0].desc, "Time in ms")
+
+    def test_save_config_writes_merged(self):
+        filename = tempfile.mktemp(".xml")
+        self.overlay.save_config(filename)
+        saved = gta3sc.read_config(filename)
+        os.remove(filename)
+        self.assertEqual(config_fields(saved), config_fields(self.overlay))
+
+class EnumTest(unittest.TestCase):
+
+    def make_enum(self, values):
+        enum = Enum()
+        enum.constants = {"C%d" % v: v for v in values}
+        return enum
+
+    def check_names(self, enum, values):
+        for value in range(min(values) - 2, max(values) + 3):
+            name = "C%d" % value if value in values else None
+            self.assertEqual(enum.get_name(value), name, value)
+            self.assertEqual(enum.get_name(value, "none"), name or "none", value)
+
+    def test_dense(self):
+        values = range(10, 30) + [32, 35]
+        enum = self.make_enum(values)
+        self.check_names(enum, values)
+        self.assertEqual((enum.run_starts, len(enum.run_names[0]), enum.sparse_names), ([10], 26, {}))
+
+    def test_sparse(self):
+        values = range(10, 30) + [32, 35, 100, 1000]
+        enum = self.make_enum(values)
+        self.check_names(enum, values)
+        self.assertEqual((enum.run_starts, enum.sparse_names), ([10], {32: "C32", 35: "C35", 100: "C100", 1000: "C1000"}))
+
+    def test_update_values(self):
+        enum = self.make_enum(range(10))
+        enum.get_name(0)
+        enum.constants["C20"] = 20
+        self.assertIsNone(enum.get_name(20))
+        enum.update_values()
+        self.check_names(enum, range(10) + [20])
+
+    def test_lowest_name(self):
+        enum = gta3sc.read_config(COMMANDS_XML).get_enum("WEAPONTYPE")
+        self.assertEqual(enum.get_name(21), "WEAPONTYPE_DETONATOR")
+        self.assertIsNone(enum.get_name(15))
+
+    def test_flat_config(self):
+        config = gta3sc.read_config(COMMANDS_XML)
+        config.enums += [self.make_enum(range(10, 30) + [32, 35]), self.make_enum(range(10, 30) + [32, 100, 1000])]
+        filename = tempfile.mktemp(".flatconfig")
+        gta3sc.write_flat_config(config, filename)
+        with gta3sc.FlatConfig(filename) as flat:
+            for enum, flat_enum in zip(config.enums, flat.enums):
+                for value in range(-1, 1002):
+                    self.assertEqual(flat_enum.get_name(value, "none"), enum.get_name(value, "none"), value)
+                self.assertEqual(flat_enum.max_value(), enum.max_value())
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    unittest.main()
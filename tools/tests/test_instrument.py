@@ -0,0 +1,46 @@
+#!/usr/bin/env python2
+"""
+  Tests of the memory measures of gta3sc.instrument.
+
+  Examples:
+    py tests/test_instrument.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import unittest
+from gta3sc import instrument
+
+MB = 1024 * 1024
+
+def allocate(megabytes): # -> object holding about so many megabytes, touched so that they are resident
+    return bytearray(megabytes * MB)
+
+class MemoryTest(unittest.TestCase):
+
+    def setUp(self):
+        instrument.reset()
+        instrument.enable_memory()
+
+    def tearDown(self):
+        instrument.disable()
+        instrument.reset()
+
+    def test_phase_peaks(self):
+        with instrument.timer("outer"):
+            with instrument.timer("large"):
+                data = allocate(64)
+                del data
+            with instrument.timer("small"):
+                kept = allocate(4)
+        stats = instrument.memory_stats()
+        self.assertGreater(stats["large"][1], 48 * MB)
+        self.assertLess(stats["small"][1], 16 * MB)
+        self.assertGreater(stats["small"][0], 2 * MB)
+        self.assertGreater(stats["outer"][1], 48 * MB)
+        self.assertGreater(instrument.peak_rss(), 64 * MB)
+        del kept
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python2
+"""
+  Tests of gta3sc.lint_config over the small configs in tests/data.
+
+  Examples:
+    py tests/test_lint.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import unittest
+import gta3sc
+from gta3sc import lint
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+COMMANDS_XML = os.path.join(DATA_DIR, "commands.xml")
+EXTENSIONS_XML = os.path.join(DATA_DIR, "extensions.xml")
+
+# WEAPONTYPE_LAST shares its value on purpose, as in the shipped constants
+SHARED_VALUE = (lint.WARNING, "constants WEAPONTYPE_LAST and WEAPONTYPE_DETONATOR of enum WEAPONTYPE have the same value 21")
+
+class LintTest(unittest.TestCase):
+
+    def test_commands(self):
+        self.assertEqual(gta3sc.lint_config(gta3sc.read_config(COMMANDS_XML)), [SHARED_VALUE])
+
+    def test_overlay(self):
+        overlay = gta3sc.read_config(EXTENSIONS_XML, base=gta3sc.read_config(COMMANDS_XML))
+        self.assertEqual(gta3sc.lint_config(overlay), [SHARED_VALUE])
+
+    def test_problems(self):
+        config = gta3sc.read_config(COMMANDS_XML)
+        cmd = config.get_command("GIVE_WEAPON_TO_CHAR")
+        cmd.args[0].type = "ENTITY"
+        cmd.args[1].enums = ["WEAPON"]
+        config.commands.append(config.get_command("WAIT"))
+        self.assertEqual(sorted(message for severity, message in gta3sc.lint_config(config) if severity == lint.ERROR),
+                         ["argument 0 of GIVE_WEAPON_TO_CHAR has unknown type ENTITY",
+                          "argument 1 of GIVE_WEAPON_TO_CHAR uses the undefined enum WEAPON",
+                          "command WAIT is defined more than once"])
+
+    def test_main(self):
+        with open(os.devnull, "w") as devnull:
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                status = lint.main([COMMANDS_XML])
+            finally:
+                sys.stdout = stdout
+        self.assertEqual(status, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python2
+"""
+  Tests of gta3sc.parallel_map handing a Config to its workers, over the small config in tests/data.
+
+  Examples:
+    py tests/test_parallel.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import glob
+import shutil
+import tempfile
+import unittest
+from functools import partial
+import gta3sc
+from gta3sc import parallel
+import discover_constants
+
+COMMANDS_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "commands.xml")
+
+# scanned by discover_constants, which finds the FADE and WEAPONTYPE values used
+MAIN_IR2 = """\
+MAIN_1:
+WAIT 0i8
+DO_FADE 500i16 1i8
+GIVE_WEAPON_TO_CHAR &8 5i8 100i8
+WAIT 0i8
+"""
+
+def describe(config, name): # -> (type of config, descs of the args of the command named so)
+    return (config.__class__.__name__, [d.desc for d in config.get_command(name).arg_table])
+
+def flat_files():
+    return glob.glob(os.path.join(tempfile.gettempdir(), "gta3sc-*.flatconfig"))
+
+class ParallelMapTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = gta3sc.read_config(COMMANDS_XML)
+        self.names = ["WAIT", "DO_FADE", "GIVE_WEAPON_TO_CHAR"]
+        self.descs = [describe(self.config, name)[1] for name in self.names]
+        self.tmpdir = tempfile.mkdtemp()
+        self.ir2files = [os.path.join(self.tmpdir, name) for name in ("a.ir2", "b.ir2")]
+        for filename, extra in zip(self.ir2files, ("", "WAIT 0i8\n")):
+            with open(filename, "w") as f:
+                f.write(MAIN_IR2 + extra)
+
+    def tearDown(self):
+        parallel._POOL_FORKS = sys.platform != "win32"
+        shutil.rmtree(self.tmpdir)
+
+    def test_forking_pool(self):
+        parallel._POOL_FORKS = True
+        results = gta3sc.parallel_map(describe, self.names, shared=self.config, workers=2, flat_config=True)
+        self.assertEqual(results, [("Config", descs) for descs in self.descs])
+
+    def test_pool_not_forking(self):
+        parallel._POOL_FORKS = False
+        before = flat_files()
+        results = gta3sc.parallel_map(describe, self.names, shared=self.config, workers=2, flat_config=True)
+        self.assertEqual(results, [("FlatConfig", descs) for descs in self.descs])
+        self.assertEqual(flat_files(), before)
+        results = gta3sc.parallel_map(describe, self.names, shared=self.config, workers=2)
+        self.assertEqual(results, [("Config", descs) for descs in self.descs])
+
+    def test_cached_scan_not_forking(self):
+        parallel._POOL_FORKS = False
+        expected = [discover_constants.scan(self.config, filename) for filename in self.ir2files]
+        self.assertEqual(expected[0][0], {"FADE": set([1]), "WEAPONTYPE": set([5])})
+        scan = partial(discover_constants.scan, cache=os.path.join(self.tmpdir, "cache"))
+        for run in range(2): # computing, then reading the cache
+            results = gta3sc.parallel_map(scan, self.ir2files, shared=self.config, workers=2, flat_config=True)
+            self.assertEqual(results, expected)
+
+    def test_cached_scan_same_contents(self):
+        copies = [os.path.join(self.tmpdir, "copy%d.ir2" % i) for i in range(8)]
+        for filename in copies:
+            shutil.copy(self.ir2files[0], filename)
+        expected = discover_constants.scan(self.config, self.ir2files[0])
+        cachedir = os.path.join(self.tmpdir, "cache")
+        scan = partial(discover_constants.scan, cache=cachedir)
+        for run in range(2):
+            results = gta3sc.parallel_map(scan, copies, shared=self.config, workers=4)
+            self.assertEqual(results, [expected] * len(copies))
+            # a single complete file, no writer leaving its temporary one behind
+            self.assertEqual(os.listdir(cachedir), ["%s-v%d" % (gta3sc.cache.file_digest(copies[0]), gta3sc.cache.CACHE_VERSION)])
+            with gta3sc.AnalysisCache(None, copies[0], cachedir) as analysis:
+                self.assertEqual(sorted(key.split(":")[0] for key in analysis.results),
+                                 ["global_vars", "scopes"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python2
+"""
+  Tests that python -m gta3sc pipeline writes the same file as running the maintenance
+  scripts of its steps one after another, over the small config in tests/data.
+
+  Examples:
+    py tests/test_pipeline.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+TOOLS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+COMMANDS_XML = os.path.join(DATA_DIR, "commands.xml")
+
+# scanned by discover-supported, which finds IS_CHAR_IN_AREA_3D used
+MAIN_IR2 = """\
+MAIN_1:
+WAIT 0i8
+IS_CHAR_IN_AREA_3D &8 0x1.000000p+0f 0x0.000000p+0f
+WAIT 0i8
+"""
+
+# step -> command line of the script doing it alone, given the xml and ir2 files
+SCRIPTS = {
+    "hash":                 lambda xml, ir2: ["make_hash.py", xml],
+    "simplify":             lambda xml, ir2: ["simplify.py", xml],
+    "simplify=clear":       lambda xml, ir2: ["simplify.py", xml, "clear"],
+    "simplify-descs":       lambda xml, ir2: ["test.py", xml],
+    "discover-supported":   lambda xml, ir2: ["discover_supported_commands.py", ir2, xml],
+}
+
+STEP_SEQUENCES = [
+    ["hash"],
+    ["simplify"],
+    ["simplify=clear"],
+    ["simplify-descs"],
+    ["discover-supported"],
+    ["simplify=clear", "simplify-descs"],
+    ["simplify-descs", "simplify=clear"],
+    ["simplify", "simplify-descs", "hash"],
+    ["discover-supported", "simplify=clear", "hash"],
+    ["hash", "discover-supported", "simplify", "simplify-descs"],
+]
+
+def run(args):
+    with open(os.devnull, "w") as devnull:
+        subprocess.check_call([sys.executable] + args, cwd=TOOLS_DIR, stdout=devnull, stderr=devnull)
+
+class PipelineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ir2 = os.path.join(self.tmpdir, "main.ir2")
+        with open(self.ir2, "w") as f:
+            f.write(MAIN_IR2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def copy_of_commands(self, name):
+        filename = os.path.join(self.tmpdir, name)
+        shutil.copy(COMMANDS_XML, filename)
+        return filename
+
+    def test_same_as_scripts(self):
+        for steps in STEP_SEQUENCES:
+            by_scripts = self.copy_of_commands("scripts.xml")
+            for step in steps:
+                run(SCRIPTS[step](by_scripts, self.ir2))
+            by_pipeline = self.copy_of_commands("pipeline.xml")
+            run(["-m", "gta3sc", "pipeline", by_pipeline] +
+                [step if step != "discover-supported" else "discover-supported=" + self.ir2 for step in steps])
+            with open(by_scripts, "rb") as f1, open(by_pipeline, "rb") as f2:
+                self.assertEqual(f2.read(), f1.read(), " ".join(steps))
+
+
+if __name__ == "__main__":
+    unittest.main()
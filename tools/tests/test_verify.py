@@ -0,0 +1,68 @@
+#!/usr/bin/env python2
+"""
+  Tests of gta3sc.verify_program and check_program over the small config in tests/data.
+
+  Examples:
+    py tests/test_verify.py
+"""
+import os, sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+import gta3sc
+
+COMMANDS_XML = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "commands.xml")
+
+MAIN_IR2 = """\
+MAIN_1:
+WAIT 0i8
+WAIT 0i8 1i8
+UNKNOWN_THING 1i8
+DO_FADE 500i16 1i8
+"""
+
+PROBLEMS = ["main:2: WAIT takes 1 arguments, given 2", "main:3: unknown command UNKNOWN_THING"]
+
+class VerifyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = gta3sc.read_config(COMMANDS_XML)
+        self.tmpdir = tempfile.mkdtemp()
+        self.ir2file = os.path.join(self.tmpdir, "main.ir2")
+        with open(self.ir2file, "w") as f:
+            f.write(MAIN_IR2)
+        self.ir2 = gta3sc.read_ir2(self.ir2file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def check(self, strict): # -> (problems or the ValueError raised, lines printed)
+        stderr, sys.stderr = sys.stderr, StringIO()
+        try:
+            result = gta3sc.check_program(self.ir2, self.config, "main.ir2", strict)
+        except ValueError as e:
+            result = e
+        finally:
+            stderr, sys.stderr = sys.stderr, stderr
+        return result, stderr.getvalue().splitlines()
+
+    def test_verify_program(self):
+        problems = gta3sc.verify_program(self.ir2, self.config)
+        self.assertEqual(["%s: %s" % (gta3sc.verify.format_offset(off), message) for off, message in problems], PROBLEMS)
+
+    def test_check_program_warns(self):
+        problems, lines = self.check(strict=False)
+        self.assertEqual(len(problems), 2)
+        self.assertEqual(lines, ["main.ir2:%s" % p.replace(": ", ": warning: ", 1) for p in PROBLEMS])
+
+    def test_check_program_strict(self):
+        error, lines = self.check(strict=True)
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual(lines, ["main.ir2:%s" % p.replace(": ", ": error: ", 1) for p in PROBLEMS])
+
+
+if __name__ == "__main__":
+    unittest.main()
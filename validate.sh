@@ -1,3 +1,3 @@
 #!/bin/bash
-cd config
-rnv ../schema.rnc $(find -type f -name '*.xml')
+cd tools
+python2 gta3sc/validate.py ../schema.rnc ../config "$@"